@@ -0,0 +1,42 @@
+import logging
+import threading
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class DeviceList(QObject):
+    """
+    Names of the audio input devices. Enumerating them starts PortAudio and probes every device, which
+    takes long enough to freeze a dialog, so it runs on a background thread and the last result is kept.
+    updated is emitted with the names whenever a refresh finishes.
+    """
+    updated = pyqtSignal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.names = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def refresh(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self.enumerate, name="device-list", daemon=True).start()
+
+    def enumerate(self):
+        start = time.monotonic()
+        try:
+            import speech_recognition as sr
+            names = sr.Microphone.list_microphone_names()
+        except Exception as e:
+            logging.warning(f"Couldn't list audio devices: {e}")
+            names = self.names or []
+        finally:
+            with self.lock:
+                self.refreshing = False
+        logging.info(f"Found {len(names)} audio devices in {time.monotonic() - start:.2f} seconds")
+        self.names = names
+        self.updated.emit(names)
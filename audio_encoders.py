@@ -0,0 +1,98 @@
+import io
+import logging
+
+import speech_recognition as sr
+
+from wav_encoding import WavStream
+
+# FLAC and Opus need libsndfile through soundfile, which isn't a hard dependency.
+try:
+    import numpy as np
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+class EncodedAudio(io.BytesIO):
+    """
+    An encoded segment, file-like so it can be uploaded the same way as a WavStream.
+    """
+    def __init__(self, data, name, content_type, duration):
+        super().__init__(data)
+        self.name = name
+        self.content_type = content_type
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.getbuffer())
+
+
+class WavEncoder:
+    name = "wav"
+
+    def encode(self, pcm, sample_rate, sample_width):
+        # No encoding at all, the header is just put in front of the PCM views.
+        return WavStream(pcm, sample_rate, sample_width)
+
+
+class FlacEncoder:
+    """
+    Lossless, usually around half the size of the WAV for speech.
+    """
+    name = "flac"
+
+    def encode(self, pcm, sample_rate, sample_width):
+        pcm = b"".join(pcm) if isinstance(pcm, (list, tuple)) else pcm
+        duration = len(pcm) / (sample_rate * sample_width)
+        if soundfile is not None and sample_width == 2:
+            output = io.BytesIO()
+            soundfile.write(output, np.frombuffer(pcm, dtype=np.int16), sample_rate, format="FLAC")
+            data = output.getvalue()
+        else:
+            # speech_recognition ships a flac binary for the common platforms.
+            data = sr.AudioData(bytes(pcm), sample_rate, sample_width).get_flac_data()
+        return EncodedAudio(data, "audio.flac", "audio/flac", duration)
+
+
+class OpusEncoder:
+    """
+    Lossy Opus in an OGG container at roughly bitrate kbps, a fraction of the WAV size.
+    """
+    name = "opus"
+
+    def __init__(self, bitrate=24):
+        if soundfile is None or "OPUS" not in soundfile.available_subtypes("OGG"):
+            raise RuntimeError("Opus encoding needs the soundfile package with a libsndfile built with Opus support")
+        self.bitrate = bitrate
+        # libsndfile maps its compression level linearly onto Opus' 6 to 256 kbps range, 0 being the highest bitrate.
+        self.compression_level = min(1.0, max(0.0, 1 - (bitrate - 6) / 250))
+
+    def encode(self, pcm, sample_rate, sample_width):
+        pcm = b"".join(pcm) if isinstance(pcm, (list, tuple)) else pcm
+        duration = len(pcm) / (sample_rate * sample_width)
+        output = io.BytesIO()
+        soundfile.write(
+            output, np.frombuffer(pcm, dtype=np.int16), sample_rate,
+            format="OGG", subtype="OPUS", compression_level=self.compression_level,
+        )
+        return EncodedAudio(output.getvalue(), "audio.ogg", "audio/ogg", duration)
+
+
+ENCODERS = {
+    WavEncoder.name: WavEncoder,
+    FlacEncoder.name: FlacEncoder,
+    OpusEncoder.name: OpusEncoder,
+}
+
+
+def create_encoder(name, bitrate=24):
+    """
+    Returns the encoder for an upload format name, falling back to WAV if it can't be used here.
+    """
+    try:
+        if name == OpusEncoder.name:
+            return OpusEncoder(bitrate)
+        return ENCODERS[name]()
+    except (KeyError, RuntimeError) as e:
+        logging.warning(f"Can't use upload format {name!r} ({e}), uploading WAV instead")
+        return WavEncoder()
@@ -0,0 +1,109 @@
+import collections
+import logging
+import threading
+import time
+
+
+class PendingSegment:
+    """
+    A segment ready to be transcribed but still waiting for a worker: the span of its source's ring buffer
+    to upload (window_start to end, the overlap included) and the newly committed part of it (start to end).
+    """
+    __slots__ = ("source", "window_start", "start", "end", "new_utterance", "timings", "captured_at", "generation")
+
+    def __init__(self, source, window_start, start, end, new_utterance, timings, generation=0):
+        self.source = source
+        self.window_start = window_start
+        self.start = start
+        self.end = end
+        self.new_utterance = new_utterance
+        self.timings = timings
+        # Phrase generation its newest phrase ended, the partials of older ones are replaced by its text.
+        self.generation = generation
+        # Capture time of its oldest audio, what the lag is measured from.
+        self.captured_at = timings.captured_at if timings is not None else time.monotonic()
+
+
+class SegmentBacklog:
+    """
+    Bounded queue of segments waiting for a transcription worker. When the backend can't keep up, segments
+    wait here instead of piling up without limit, and policy decides how the load is shed:
+
+    coalesce     a segment that continues the last waiting one of its source is merged into it, so a
+                 backlog of small segments goes out as fewer, longer requests, up to max_coalesced_bytes
+                 of new audio each. Past max_lag_seconds the recorder drops the oldest like drop_oldest
+    drop_oldest  nothing is merged, the oldest waiting segments are dropped once there are too many
+    downgrade    the recorder sends to a faster backend until the backlog has cleared
+    pause        the recorder stops capturing until the backlog has cleared
+
+    Whatever the policy, more than max_segments waiting segments means the oldest ones are dropped.
+    """
+    POLICIES = ("coalesce", "drop_oldest", "downgrade", "pause")
+
+    def __init__(self, max_segments=6, policy="coalesce", max_lag_seconds=20.0, max_coalesced_bytes=None):
+        if policy not in self.POLICIES:
+            logging.warning(f"Unknown backlog policy {policy!r}, using coalesce")
+            policy = "coalesce"
+        self.policy = policy
+        self.max_segments = max(1, max_segments)
+        self.max_lag_seconds = max_lag_seconds
+        # None lets a merged segment grow without limit.
+        self.max_coalesced_bytes = max_coalesced_bytes
+        self.segments = collections.deque()
+        self.lock = threading.Lock()
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.segments)
+
+    def push(self, segment):
+        """
+        Queues segment and returns the segments dropped to make room for it.
+        """
+        with self.lock:
+            if self.policy == "coalesce":
+                for waiting in reversed(self.segments):
+                    if waiting.source is segment.source:
+                        # Only audio that follows on directly, a new utterance after a pause stays separate,
+                        # and only while the merged segment stays short enough to be one request.
+                        fits = self.max_coalesced_bytes is None or segment.end - waiting.start <= self.max_coalesced_bytes
+                        if waiting.end == segment.start and fits:
+                            # Timed from its newest phrase like any other segment, the lag from its oldest.
+                            waiting.end = segment.end
+                            waiting.timings = segment.timings
+                            waiting.generation = segment.generation
+                            self.coalesced += 1
+                            return []
+                        break
+            self.segments.append(segment)
+            dropped = []
+            while len(self.segments) > self.max_segments:
+                dropped.append(self.segments.popleft())
+            self.dropped += len(dropped)
+            return dropped
+
+    def pop(self):
+        with self.lock:
+            return self.segments.popleft() if self.segments else None
+
+    def drop_oldest(self):
+        with self.lock:
+            if not self.segments:
+                return None
+            self.dropped += 1
+            return self.segments.popleft()
+
+    def restart_utterance(self, source):
+        # Marks the next waiting segment of source as the start of an utterance, False if there is none.
+        with self.lock:
+            for segment in self.segments:
+                if segment.source is source:
+                    segment.new_utterance = True
+                    return True
+            return False
+
+    def oldest_captured_at(self):
+        with self.lock:
+            return min((segment.captured_at for segment in self.segments), default=None)
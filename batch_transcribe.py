@@ -0,0 +1,304 @@
+"""
+Transcribes recordings instead of the microphone. The file is memory-mapped (WAV) or decoded once
+(FLAC), split at silences into chunks of bounded length, and the chunks are transcribed concurrently on
+any registered backend, then put back in order with timestamps.
+
+    python batch_transcribe.py meeting.wav --backend whisperInt --workers 4 -o meeting.txt
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import mmap
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from audio_encoders import create_encoder
+from request_policy import RequestPolicy
+from resampler import PolyphaseResampler
+from settings_manager import SettingsManager
+from transcription_backends import SegmentMeta, TranscriptionError, create_backend
+from vad import VoiceActivityDetector
+
+
+class PCMFile:
+    """
+    16 bit PCM of an audio file. For plain WAV files samples is a view straight into the memory-mapped
+    file, nothing is read up front.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.mapping = None
+        if path.lower().endswith((".wav", ".wave")):
+            self.open_wav(path)
+        else:
+            self.open_with_soundfile(path)
+
+    def open_wav(self, path):
+        with open(path, "rb") as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mapping)
+        if view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        position, fmt = 12, None
+        while position + 8 <= len(view):
+            chunk_id, size = struct.unpack_from("<4sI", view, position)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack_from("<HHIIHH", view, position + 8)
+            elif chunk_id == b"data":
+                if fmt is None or fmt[0] != 1 or fmt[5] != 16:
+                    raise ValueError(f"{path}: only 16 bit PCM WAV files can be memory-mapped, convert it or use FLAC")
+                self.channels, self.sample_rate = fmt[1], fmt[2]
+                size = min(size, len(view) - position - 8)
+                data = view[position + 8:position + 8 + size - size % (2 * self.channels)]
+                self.samples = np.frombuffer(data, dtype=np.int16)
+                break
+            position += 8 + size + size % 2
+        else:
+            raise ValueError(f"{path} has no audio data")
+        if self.channels > 1:
+            self.samples = self.downmix(self.samples.reshape(-1, self.channels))
+
+    def open_with_soundfile(self, path):
+        import soundfile
+        data, self.sample_rate = soundfile.read(path, dtype="int16", always_2d=True)
+        self.channels = data.shape[1]
+        self.samples = self.downmix(data) if self.channels > 1 else data[:, 0]
+
+    @staticmethod
+    def downmix(frames):
+        return frames.mean(axis=1).astype(np.int16)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def close(self):
+        self.samples = None
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError:
+                # Someone still holds a view of it, the mapping goes away with the last one.
+                pass
+
+
+def split_at_silences(samples, sample_rate, max_chunk_seconds=30, min_chunk_seconds=5, min_silence_seconds=0.3, energy_threshold=None):
+    """
+    Returns (start, end) sample ranges covering samples, each at most max_chunk_seconds long, cut in the
+    longest silence the VAD finds past min_chunk_seconds, or hard cut if there is none.
+    """
+    vad = VoiceActivityDetector(sample_rate=sample_rate, hangover_frames=3)
+    frame = vad.frame_length
+    if energy_threshold is None:
+        # Relative to the recording's own noise floor, files come from all sorts of microphones.
+        rms, _, _ = vad.frame_features(samples[:len(samples) - len(samples) % frame])
+        energy_threshold = max(100.0, 3 * float(np.percentile(rms, 10))) if len(rms) else 300.0
+
+    # Frame decisions for the whole file, a block at a time to bound the temporary arrays.
+    block = frame * 4096
+    speech = np.concatenate([
+        vad.frame_decisions(samples[i:i + block], energy_threshold) for i in range(0, max(len(samples), 1), block)
+    ]) if len(samples) else np.zeros(0, dtype=bool)
+
+    frames_per_second = sample_rate / frame
+    max_frames = int(max_chunk_seconds * frames_per_second)
+    min_frames = int(min_chunk_seconds * frames_per_second)
+    min_silence = max(1, int(min_silence_seconds * frames_per_second))
+
+    chunks, start = [], 0
+    total = len(speech)
+    while total - start > max_frames:
+        window = speech[start + min_frames:start + max_frames]
+        cut = None
+        # Runs of silence in the window, cut in the middle of the longest one.
+        padded = np.concatenate(([False], ~window, [False]))
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        runs = edges.reshape(-1, 2)
+        if len(runs):
+            lengths = runs[:, 1] - runs[:, 0]
+            best = int(np.argmax(lengths))
+            if lengths[best] >= min_silence:
+                cut = start + min_frames + (runs[best, 0] + runs[best, 1]) // 2
+        if cut is None:
+            cut = start + max_frames
+        chunks.append((start * frame, cut * frame))
+        start = cut
+    chunks.append((start * frame, len(samples)))
+    return [(begin, end) for begin, end in chunks if end > begin]
+
+
+def chunk_pcm(samples, sample_rate, start, end, to_rate=16000):
+    """
+    The chunk [start, end) of samples as to_rate PCM. The resampler is run over a filter's length more of
+    the file on both sides, so the chunk edges come out as they would resampling the whole file.
+    """
+    if sample_rate == to_rate:
+        return memoryview(samples[start:end]).cast("B")
+    resampler = PolyphaseResampler(sample_rate, to_rate)
+    # A whole number of down steps, so the output samples fall where they would for the whole file.
+    pad = -(-resampler.taps // resampler.down) * resampler.down
+    padded_start = max(0, start - pad)
+    converted = resampler.process(samples[padded_start:end + pad])[:, 0]
+    # Output n is centred on input n * sample_rate / to_rate - (taps - 1) / 2.
+    first = round((start - padded_start + (resampler.taps - 1) / 2) * to_rate / sample_rate)
+    frames = round((end - start) * to_rate / sample_rate)
+    chunk = converted[first:first + frames]
+    # The end of the file has nothing after it to fill the filter with.
+    chunk = np.pad(chunk, (0, frames - len(chunk)))
+    return memoryview(np.ascontiguousarray(chunk)).cast("B")
+
+
+def format_timestamp(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:05.2f}"
+
+
+def transcribe_file(path, backend, workers=4, max_chunk_seconds=30, encoder=None, policy=None, progress=None):
+    """
+    Returns [(start_seconds, end_seconds, text)] in file order, text is None for the chunks that failed.
+    progress(done, total) is called as chunks finish. Chunks go to the backend as 16 kHz, whatever the file's rate.
+    """
+    audio = PCMFile(path)
+    own_policy = policy is None
+    policy = policy or RequestPolicy(max_workers=2 * workers)
+    try:
+        chunks = split_at_silences(audio.samples, audio.sample_rate, max_chunk_seconds=max_chunk_seconds)
+        logging.info(f"Transcribing {path}: {audio.duration:.1f} seconds in {len(chunks)} chunks on {workers} workers")
+        done = [0]
+        done_lock = threading.Lock()
+
+        def transcribe_chunk(chunk):
+            start, end = chunk
+            pcm = chunk_pcm(audio.samples, audio.sample_rate, start, end)
+            meta = SegmentMeta(16000, 2, (end - start) / audio.sample_rate, encoder=encoder)
+            try:
+                text = policy.transcribe(backend, pcm, meta).strip()
+            except (TimeoutError, TranscriptionError) as e:
+                logging.warning(f"Chunk at {format_timestamp(start / audio.sample_rate)} failed: {e}")
+                text = None
+            with done_lock:
+                done[0] += 1
+                count = done[0]
+            if progress:
+                progress(count, len(chunks))
+            return start / audio.sample_rate, end / audio.sample_rate, text
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+            # map gives the results back in chunk order whatever order they finish in.
+            return list(executor.map(transcribe_chunk, chunks))
+    finally:
+        if own_policy:
+            policy.shutdown()
+        audio.close()
+
+
+def format_transcript(results):
+    return "\n".join(f"[{format_timestamp(start)} --> {format_timestamp(end)}] {text}" for start, end, text in results if text is not None)
+
+
+def failure_summary(results):
+    # None if every chunk was transcribed.
+    failed = [start for start, _, text in results if text is None]
+    if not failed:
+        return None
+    return f"{len(failed)} of {len(results)} chunks failed, at {', '.join(format_timestamp(start) for start in failed)}"
+
+
+def backend_from_settings(settings_manager, service=None, workers=4):
+    get = settings_manager.get_setting
+    return create_backend(
+        service or get('DEFAULT', 'transcription_service'),
+        openai_api_key=get('DEFAULT', 'openai_api_key'),
+        whisperInt_auth_header=get('DEFAULT', 'whisperInt_auth_header'),
+        request_timeout=get('DEFAULT', 'request_timeout'),
+        http_pool_size=workers,
+        transcription_workers=workers,
+        local_model=get('DEFAULT', 'local_model'),
+    )
+
+
+class BatchTranscriptionThread(QThread):
+    """
+    Runs transcribe_file off the GUI thread for the File menu action.
+    """
+    progress = pyqtSignal(int, int)
+    finished_transcript = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, settings_manager, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.settings_manager = settings_manager
+
+    def run(self):
+        get = self.settings_manager.get_setting
+        workers = get('DEFAULT', 'batch_workers')
+        backend = backend_from_settings(self.settings_manager, workers=workers)
+        if backend is None:
+            self.failed.emit("No transcription service selected")
+            return
+        try:
+            encoder = create_encoder(get('DEFAULT', 'upload_format'), bitrate=get('DEFAULT', 'opus_bitrate'))
+            results = transcribe_file(
+                self.path, backend, workers=workers, encoder=encoder,
+                max_chunk_seconds=get('DEFAULT', 'batch_max_chunk_seconds'),
+                progress=self.progress.emit,
+            )
+            self.finished_transcript.emit(format_transcript(results))
+            summary = failure_summary(results)
+            if summary:
+                self.failed.emit(f"Batch transcription of {self.path}: {summary}")
+        except Exception as e:
+            logging.exception(f"Batch transcription of {self.path} failed")
+            self.failed.emit(f"Batch transcription failed: {e}")
+        finally:
+            backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="WAV or FLAC recording")
+    parser.add_argument("--backend", help="registered transcription backend, the configured one by default")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-chunk", type=float, default=30, help="longest chunk in seconds")
+    parser.add_argument("--upload-format", default="wav")
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("-o", "--output", help="write the transcript here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    backend = backend_from_settings(SettingsManager(args.config), args.backend, workers=args.workers)
+    if backend is None:
+        sys.exit("No usable transcription backend, pass --backend")
+
+    start = time.monotonic()
+    try:
+        results = transcribe_file(
+            args.file, backend, workers=args.workers, max_chunk_seconds=args.max_chunk, encoder=create_encoder(args.upload_format),
+            progress=lambda done, total: print(f"\r{done}/{total} chunks", end="", file=sys.stderr),
+        )
+    finally:
+        print(file=sys.stderr)
+        backend.close()
+    transcript = format_transcript(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(transcript + "\n")
+    else:
+        print(transcript)
+    audio_seconds = results[-1][1] if results else 0
+    logging.info(f"Transcribed {audio_seconds:.1f} seconds of audio in {time.monotonic() - start:.1f} seconds")
+    summary = failure_summary(results)
+    if summary:
+        logging.warning(summary)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Benchmarks, run them from the repository root with e.g. python -m benchmarks.bench_http_client
@@ -0,0 +1,82 @@
+"""
+Compares how long a phrase waits between record_callback and dispatch to transcription with the event
+driven recorder loop against the old 100 ms polling, and how much CPU each burns while idle.
+
+    python -m benchmarks.bench_dispatch_latency --phrases 50
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from recorder import AudioRecorder
+
+
+class PollingRecorder(AudioRecorder):
+    """
+    The recorder as it used to be, looking at the queue every poll_interval seconds instead of waiting on it.
+    """
+    poll_interval = 1 / 10
+
+    def wait_for_spans(self):
+        time.sleep(self.poll_interval)
+        spans = []
+        while not self.data_queue.empty():
+            spans.append(self.data_queue.get_nowait())
+        return [span for span in spans if span is not None]
+
+
+def run_mode(recorder_class, phrases, idle_seconds):
+    recorder = recorder_class(1000, 18, 1.5, 0, "", "", transcription_service="none", metrics_file=None)
+    queued_at = {}
+    latencies = []
+    dispatched = threading.Event()
+
+    def process_new_audio(source, new_utterance, timings=None):
+        latencies.append(time.perf_counter() - queued_at[source.utterance_end])
+        dispatched.set()
+        return False
+
+    recorder.process_new_audio = process_new_audio
+    recorder.running = True
+    dispatcher = threading.Thread(target=recorder.dispatch_segments)
+    dispatcher.start()
+
+    # Idle CPU first, nothing is queued.
+    cpu_start = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_start) / idle_seconds
+
+    rng = random.Random(0)
+    for i in range(phrases):
+        time.sleep(rng.uniform(0.05, 0.25))
+        dispatched.clear()
+        span = (recorder.sources[0], i * 100, i * 100 + 100, None, i + 1)
+        queued_at[span[2]] = time.perf_counter()
+        recorder.data_queue.put(span)
+        dispatched.wait()
+
+    recorder.running = False
+    recorder.data_queue.put(None)
+    dispatcher.join()
+    recorder.shutdown()
+    return latencies, idle_cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phrases", type=int, default=50)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    for name, recorder_class in (("polling 100 ms", PollingRecorder), ("event driven", AudioRecorder)):
+        latencies, idle_cpu = run_mode(recorder_class, args.phrases, args.idle_seconds)
+        latencies.sort()
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(f"{name:<16} dispatch latency mean {statistics.mean(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms  "
+              f"max {latencies[-1] * 1000:7.2f} ms  idle CPU {idle_cpu * 100:.3f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Reports bytes on the wire and encode CPU time per second of audio for every upload format.
+
+    python -m benchmarks.bench_encoders [recording.wav] --seconds 10 --uplink-kbps 1000
+"""
+import argparse
+import math
+import random
+import struct
+import time
+import wave
+
+from audio_encoders import ENCODERS, create_encoder
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+
+def synthetic_speech(seconds):
+    # Voiced harmonics with a syllable-rate envelope plus a bit of noise, closer to speech than a sine.
+    rng = random.Random(0)
+    samples = []
+    for i in range(int(seconds * SAMPLE_RATE)):
+        t = i / SAMPLE_RATE
+        pitch = 140 + 30 * math.sin(2 * math.pi * 0.5 * t)
+        envelope = max(0.0, math.sin(2 * math.pi * 4 * t))
+        voiced = sum(math.sin(2 * math.pi * pitch * k * t) / k for k in range(1, 6))
+        samples.append(int(max(-32768, min(32767, 6000 * envelope * voiced + rng.gauss(0, 200)))))
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def load_wav(path):
+    with wave.open(path, "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != SAMPLE_WIDTH or f.getframerate() != SAMPLE_RATE:
+            raise SystemExit("Expected a 16 kHz 16 bit mono WAV, like the microphone records")
+        return f.readframes(f.getnframes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="?", help="16 kHz mono 16 bit WAV to encode, synthetic speech if omitted")
+    parser.add_argument("--seconds", type=float, default=10, help="length of the synthetic audio")
+    parser.add_argument("--bitrate", type=int, default=24, help="Opus bitrate in kbps")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--uplink-kbps", type=float, default=1000, help="uplink used to estimate upload time")
+    args = parser.parse_args()
+
+    pcm = load_wav(args.wav) if args.wav else synthetic_speech(args.seconds)
+    seconds = len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH)
+    print(f"{seconds:.1f} seconds of audio, uplink {args.uplink_kbps:.0f} kbps")
+    print(f"{'format':<8}{'bytes/s':>12}{'ratio':>8}{'encode CPU ms/s':>18}{'upload ms/s':>14}")
+
+    for name in ENCODERS:
+        encoder = create_encoder(name, bitrate=args.bitrate)
+        if encoder.name != name:
+            print(f"{name:<8} not available here")
+            continue
+        start = time.process_time()
+        for _ in range(args.repeat):
+            encoded = encoder.encode(memoryview(pcm), SAMPLE_RATE, SAMPLE_WIDTH)
+            encoded.read()
+        cpu = (time.process_time() - start) / args.repeat
+        size = len(encoded)
+        bytes_per_second = size / seconds
+        upload_ms = bytes_per_second * 8 / args.uplink_kbps
+        print(f"{name:<8}{bytes_per_second:>12.0f}{size / len(pcm):>8.2f}{cpu / seconds * 1000:>18.2f}{upload_ms:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares a bare requests.post per segment against the pooled TranscriptionHTTPClient, against a local
+stand-in for the whisperInt endpoint.
+
+    python -m benchmarks.bench_http_client --requests 200 --payload-kb 512
+"""
+import argparse
+import os
+import time
+import statistics
+
+import requests
+
+from http_client import TranscriptionHTTPClient
+from benchmarks.mock_endpoint import MockTranscriptionServer
+
+
+def timed(fn, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, latencies, connections):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{name:<24} mean {statistics.mean(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms  connections opened {connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--payload-kb", type=int, default=512, help="size of the uploaded fake WAV segment")
+    parser.add_argument("--latency", type=float, default=0.0, help="server side latency per request, in seconds")
+    parser.add_argument("--http2", action="store_true", help="use HTTP/2 if httpx[http2] is installed")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload_kb * 1024)
+    headers = {"Authorization": "Bearer benchmark", "Content-Type": "audio/wav"}
+
+    with MockTranscriptionServer(latency=args.latency) as server:
+        latencies = timed(lambda: requests.post(server.url, headers=headers, data=payload).json(), args.requests)
+        report("requests.post", latencies, server.connections)
+
+        server.connections = 0
+        client = TranscriptionHTTPClient(server.url, pool_size=4, http2=args.http2)
+        client.warm_up()
+        time.sleep(0.2)
+        latencies = timed(lambda: client.post(payload, headers=headers), args.requests)
+        report("TranscriptionHTTPClient", latencies, server.connections)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
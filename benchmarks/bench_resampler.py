@@ -0,0 +1,62 @@
+"""
+CPU cost of converting native rate capture to 16 kHz mono: the downmix and PolyphaseResampler work
+NativeRateStream does for every chunk it reads, on blocks the size the device delivers them in.
+
+    python -m benchmarks.bench_resampler
+    python -m benchmarks.bench_resampler --seconds 120 --rates 44100 48000 --channels 2
+
+Prints CPU time per second of audio (and as a share of one core), the latency the conversion adds
+(the filter's delay plus waiting for a whole block) and the level of a 1 kHz tone after conversion.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from resampler import PolyphaseResampler, downmix
+
+
+def test_signal(rate, channels, seconds):
+    t = np.arange(int(rate * seconds)) / rate
+    tone = 8000 * np.sin(2 * np.pi * 1000 * t)
+    noise = np.random.default_rng(0).normal(0, 500, (len(t), channels))
+    return np.clip(tone[:, None] + noise, -32768, 32767).astype(np.int16)
+
+
+def convert(samples, rate, channels, chunk_size=1024, to_rate=16000):
+    resampler = PolyphaseResampler(rate, to_rate) if rate != to_rate else None
+    read_size = max(1, round(chunk_size * rate / to_rate))
+    out = []
+    start = time.process_time()
+    for offset in range(0, len(samples), read_size):
+        block = samples[offset:offset + read_size]
+        if channels > 1 or resampler is not None:
+            mono = downmix(block)
+            block = resampler.process(mono) if resampler is not None else np.rint(mono).astype(np.int16)
+        out.append(block.tobytes())
+    cpu = time.process_time() - start
+    return cpu, b"".join(out), resampler, read_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--rates", type=int, nargs="+", default=[8000, 22050, 44100, 48000, 96000])
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    print(f"{'rate':>6} {'ch':>3} {'taps':>5} {'CPU ms/s':>9} {'core %':>7} {'latency ms':>11} {'1 kHz level':>12}")
+    for rate in args.rates:
+        for channels in args.channels:
+            samples = test_signal(rate, channels, args.seconds)
+            cpu, pcm, resampler, read_size = convert(samples, rate, channels)
+            out = np.frombuffer(pcm, dtype=np.int16)[16000:].astype(np.float64)
+            level = np.sqrt(2) * np.sqrt(np.mean(out ** 2)) / 8000
+            delay = resampler.delay_seconds if resampler is not None else 0
+            latency = (delay + read_size / rate) * 1000
+            print(f"{rate:6d} {channels:3d} {resampler.taps if resampler else 0:5d} {cpu / args.seconds * 1000:9.3f} "
+                  f"{cpu / args.seconds * 100:7.3f} {latency:11.2f} {level:12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measures cold start: an -X importtime report of what importing a module costs, and how long the app
+takes from launch to painting its window and to finishing the deferred startup work (recorder, hotkeys,
+device list). The app runs offscreen in a temporary directory so its config and logs don't land here.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --module recorder --top 30
+"""
+import argparse
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import os, sys, time
+launched = float(os.environ["STARTUP_LAUNCHED"])
+import main
+imported = time.time()
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+
+marks = {}
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and "painted" not in marks:
+            marks["painted"] = time.time()
+        return False
+
+finish_startup = main.MainWindow.finish_startup
+def timed_finish_startup(self):
+    start = time.time()
+    try:
+        finish_startup(self)
+    except Exception as e:
+        print(f"deferred startup failed: {e!r}", file=sys.stderr)
+    marks["deferred"] = time.time() - start
+    marks["ready"] = time.time()
+main.MainWindow.finish_startup = timed_finish_startup
+
+app = QApplication(sys.argv)
+paint_filter = FirstPaint()
+app.installEventFilter(paint_filter)
+window = main.MainWindow()
+constructed = time.time()
+def check():
+    if "painted" in marks and "ready" in marks:
+        app.quit()
+timer = QTimer()
+timer.timeout.connect(check)
+timer.start(10)
+QTimer.singleShot(10000, app.quit)
+app.exec_()
+print(f"import main       {imported - launched:8.3f} s")
+print(f"window built      {constructed - launched:8.3f} s")
+print(f"first paint       {marks.get('painted', float('nan')) - launched:8.3f} s")
+print(f"deferred startup  {marks.get('deferred', float('nan')):8.3f} s (done at {marks.get('ready', float('nan')) - launched:.3f} s)")
+"""
+
+
+def import_report(module, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+    cumulative = {}
+    by_package = collections.defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        cumulative[name] = int(cumulative_us)
+        by_package[name.split(".")[0]] += int(self_us)
+    print(f"import {module}: {cumulative.get(module, 0) / 1000:.1f} ms")
+    print("heaviest packages (own import time):")
+    for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {name:30s} {us / 1000:8.1f} ms")
+
+
+def time_to_paint(runs):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"), PYTHONPATH=REPO)
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as directory:
+            env["STARTUP_LAUNCHED"] = repr(time.time())
+            result = subprocess.run([sys.executable, "-c", CHILD], cwd=directory, env=env, capture_output=True, text=True)
+        print(result.stdout.strip() or result.stderr.strip().splitlines()[-1])
+        for line in result.stderr.splitlines():
+            if line.startswith("deferred startup failed"):
+                print(line)
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module for the import time report")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3, help="app launches to time")
+    args = parser.parse_args()
+
+    import_report(args.module, args.top)
+    print()
+    time_to_paint(args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+
+class MockTranscriptionServer:
+    """
+    Local stand-in for the whisperInt endpoint. Answers every POST with a fixed transcript after
+    latency seconds (plus seconds_per_mb per megabyte uploaded) and keeps connections alive like the real one.
+    """
+    def __init__(self, latency=0.0, seconds_per_mb=0.0, text="mock transcription", host="127.0.0.1", port=0):
+        self.latency = latency
+        self.seconds_per_mb = seconds_per_mb
+        self.text = text
+        self.requests = 0
+        self.bytes_received = 0
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Small header and body writes on a kept-alive connection otherwise hit Nagle + delayed ACK stalls.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                with server.lock:
+                    server.requests += 1
+                    server.bytes_received += len(body)
+                time.sleep(server.latency + server.seconds_per_mb * len(body) / 1e6)
+                payload = json.dumps({"text": server.text}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,213 @@
+"""
+Headless benchmark of the whole live pipeline without a microphone or real endpoints. WAV files are
+played through CustomBackgroundRecorder.listen by a file backed AudioSource, then through AudioRecorder's
+segmentation and transcription path against a local mock of the whisperInt endpoint.
+
+    python -m benchmarks.replay_pipeline recordings/*.wav --latency 0.4 --workers 3
+    python -m benchmarks.replay_pipeline --synthetic 60 --realtime
+    python -m benchmarks.replay_pipeline --synthetic 60 --realtime --sources 8
+    python -m benchmarks.replay_pipeline --synthetic 60 --realtime --switch-every 2.5
+
+Reports real-time factor, segments per second, CPU time and peak memory. With --sources N the audio is
+played on N capture sources at once, each with its own listener and VAD, sharing one transcription pool.
+With --switch-every S the first source is moved to another device every S seconds while it plays, and the
+capture gap of every switch is reported.
+"""
+import argparse
+import resource
+import threading
+import time
+import wave
+
+from PyQt5.QtCore import Qt
+from speech_recognition import AudioSource
+
+from capture_sources import SourceSpec
+from recorder import AudioRecorder
+from benchmarks.bench_encoders import synthetic_speech
+from benchmarks.mock_endpoint import MockTranscriptionServer
+
+
+class WavFileStream:
+    def __init__(self, source):
+        self.source = source
+
+    def read(self, size):
+        # size is in frames, like PyAudio's stream.read
+        source = self.source
+        data = bytes(source.pcm[source.position:source.position + size * source.SAMPLE_WIDTH])
+        source.position += len(data)
+        if source.realtime and data:
+            # Hold the data back until it would have been recorded, like a microphone.
+            due = source.started_at + source.position / (source.SAMPLE_RATE * source.SAMPLE_WIDTH)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return data
+
+    def get_read_available(self):
+        # Frames a microphone would have captured by now that weren't read yet.
+        source = self.source
+        if not source.realtime:
+            return 0
+        due = int((time.monotonic() - source.started_at) * source.SAMPLE_RATE)
+        return max(0, min(due, len(source.pcm) // source.SAMPLE_WIDTH) - source.position // source.SAMPLE_WIDTH)
+
+
+class WavFileSource(AudioSource):
+    """
+    AudioSource that plays back 16 kHz 16 bit mono PCM, either as fast as it is read or paced in real
+    time. Entering it again continues where it was, so adjust_for_ambient_noise doesn't rewind it.
+    """
+    def __init__(self, pcm, sample_rate=16000, sample_width=2, chunk_size=1024, realtime=False):
+        self.pcm = memoryview(pcm)
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = sample_width
+        self.CHUNK = chunk_size
+        self.realtime = realtime
+        self.position = 0
+        self.started_at = None
+        self.stream = None
+
+    @classmethod
+    def from_files(cls, paths, gap_seconds=1.0, **options):
+        # The corpus is played back to back, with some silence in between like between speakers' turns.
+        silence = bytes(int(gap_seconds * 16000) * 2)
+        pieces = []
+        for path in paths:
+            with wave.open(path, "rb") as f:
+                if f.getnchannels() != 1 or f.getsampwidth() != 2 or f.getframerate() != 16000:
+                    raise SystemExit(f"{path}: expected a 16 kHz 16 bit mono WAV")
+                pieces += [f.readframes(f.getnframes()), silence]
+        return cls(b"".join(pieces), **options)
+
+    def device_copy(self):
+        # Another "device" hearing the same audio at the same time, for device switches.
+        copy = WavFileSource(self.pcm, self.SAMPLE_RATE, self.SAMPLE_WIDTH, self.CHUNK, self.realtime)
+        copy.started_at, copy.position = self.started_at, self.position
+        return copy
+
+    @property
+    def duration(self):
+        return len(self.pcm) / (self.SAMPLE_RATE * self.SAMPLE_WIDTH)
+
+    def __enter__(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.stream = WavFileStream(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+
+def synthetic_corpus(seconds, pauses=True):
+    # Alternating speech and pauses long enough for the listener to close phrases, or talk without any.
+    pieces = []
+    while sum(len(piece) for piece in pieces) < seconds * 32000:
+        pieces += [synthetic_speech(4), bytes(32000 * 2)] if pauses else [synthetic_speech(4)]
+    return b"".join(pieces)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wavs", nargs="*", help="16 kHz 16 bit mono WAV files")
+    parser.add_argument("--synthetic", type=float, default=60, help="seconds of synthetic speech when no WAV is given")
+    parser.add_argument("--realtime", action="store_true", help="pace playback like a live microphone")
+    parser.add_argument("--latency", type=float, default=0.3, help="mock endpoint latency per request, in seconds")
+    parser.add_argument("--seconds-per-mb", type=float, default=0.5, help="extra mock endpoint latency per uploaded MB")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--upload-format", default="wav")
+    parser.add_argument("--energy-threshold", type=int, default=300)
+    parser.add_argument("--record-timeout", type=int, default=18)
+    parser.add_argument("--sources", type=int, default=1, help="capture sources playing the audio at the same time")
+    parser.add_argument("--continuous", action="store_true", help="synthetic speech without pauses between phrases")
+    parser.add_argument("--backlog-policy", default="coalesce", help="coalesce, drop_oldest, downgrade or pause")
+    parser.add_argument("--max-backlog", type=int, default=6, help="segments that may wait for a worker")
+    parser.add_argument("--max-lag", type=float, default=20.0, help="seconds behind real time before the policy kicks in")
+    parser.add_argument("--switch-every", type=float, default=0, help="switch the capture device every so many seconds (with --realtime)")
+    parser.add_argument("--no-compaction", action="store_true", help="upload segments with their silences")
+    parser.add_argument("--no-segmentation", action="store_true", help="only cut phrases at pauses and the time limit")
+    args = parser.parse_args()
+
+    if args.wavs:
+        source = WavFileSource.from_files(args.wavs, realtime=args.realtime)
+    else:
+        source = WavFileSource(synthetic_corpus(args.synthetic, pauses=not args.continuous), realtime=args.realtime)
+    # The other sources play the same PCM, each from its own position.
+    make_source = lambda: WavFileSource(source.pcm, realtime=args.realtime)
+
+    with MockTranscriptionServer(latency=args.latency, seconds_per_mb=args.seconds_per_mb) as server:
+        recorder = AudioRecorder(
+            args.energy_threshold, args.record_timeout, 1.5, 0, "Bearer benchmark", "",
+            transcription_service="whisperInt", whisperInt_url=server.url, transcription_workers=args.workers,
+            upload_format=args.upload_format, metrics_file=None,
+            sources=[SourceSpec(0, label=f"source {i}") for i in range(args.sources)], segment_on_changes=not args.no_segmentation,
+            backlog_policy=args.backlog_policy, max_backlog_segments=args.max_backlog, max_lag_seconds=args.max_lag,
+            compact_silence=not args.no_compaction,
+        )
+        devices = {}
+        def source_factory(capture):
+            if capture is not recorder.sources[0]:
+                return make_source()
+            # Switched devices pick up the audio where the current one is.
+            current = devices.get("current", source)
+            devices["current"] = current.device_copy() if current.started_at is not None else current
+            return devices["current"]
+        recorder.source_factory = source_factory
+        gaps = []
+        on_device_switched = recorder.on_device_switched
+        def record_gap(capture, gap_ms):
+            gaps.append(gap_ms)
+            on_device_switched(capture, gap_ms)
+        recorder.on_device_switched = record_gap
+        for capture in recorder.sources:
+            capture.recorder.adjust_for_ambient_noise = lambda source, duration=1: None  # keep the fixed threshold
+        texts = []
+        recorder.update_text.connect(lambda text, label, generation: texts.append(text), Qt.DirectConnection)
+
+        wall_start = time.monotonic()
+        cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        recorder.start_recording()
+
+        # The listener stops on its own at the end of the audio, then wait for the last segments to come back.
+        next_switch = time.monotonic() + args.switch_every
+        max_lag = max_waiting = 0
+        while not all(capture.recorder.stream_ended for capture in recorder.sources) or recorder.load_state == "paused":
+            time.sleep(0.05)
+            waiting, _, lag, _ = recorder.load_status()
+            max_lag, max_waiting = max(max_lag, lag), max(max_waiting, waiting)
+            if args.switch_every and time.monotonic() >= next_switch:
+                recorder.set_device(recorder.device_index + 1)
+                next_switch += args.switch_every
+        time.sleep(0.2)
+        while not recorder.data_queue.empty() or recorder.transcription_pool.in_flight() or len(recorder.backlog):
+            time.sleep(0.05)
+        wall = time.monotonic() - wall_start
+        cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+
+        recorder.stop_recording()
+        recorder.shutdown()
+
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    segments = recorder.metrics.summary("total_to_screen") or {"count": 0, "p50": 0, "p95": 0}
+    print(f"audio               {source.duration:10.2f} s x {args.sources} sources")
+    print(f"wall                {wall:10.2f} s")
+    print(f"real-time factor    {wall / source.duration:10.3f}")
+    print(f"segments            {segments['count']:10d} ({segments['count'] / wall:.2f}/s), {server.requests} requests, {server.bytes_received / 1e6:.2f} MB uploaded")
+    print(f"latency to screen   p50 {segments['p50'] or 0:.3f} s  p95 {segments['p95'] or 0:.3f} s")
+    print(f"CPU                 {cpu:10.2f} s ({cpu / source.duration * 100:.2f}% of audio time, {cpu / source.duration / args.sources * 100:.2f}% per source)")
+    print(f"peak memory         {cpu_end.ru_maxrss / 1024:10.1f} MB")
+    removed = recorder.metrics.summary("silence_removed")
+    if removed:
+        print(f"silence removed     {recorder.silence_removed:10.2f} s, {recorder.silence_removed / max(1, removed['count']):.2f} s per segment")
+    print(f"backlog             max {max_waiting} waiting, lag max {max_lag:.2f} s, {recorder.backlog.coalesced} coalesced, "
+          f"{recorder.backlog.dropped} dropped ({recorder.shed_seconds:.1f} s of audio)")
+    measured = sorted(gap for gap in gaps if gap is not None)
+    if gaps:
+        print(f"device switches     {len(gaps):10d}, capture gap max {max(measured, default=float('nan')):.2f} ms, median {measured[len(measured) // 2] if measured else float('nan'):.2f} ms")
+    print(f"threads at exit     {threading.active_count():10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+import speech_recognition as sr
+from speech_recognition import AudioSource
+
+import custom_recorder
+from pcm_ring_buffer import PCMRingBuffer
+from resampler import PolyphaseResampler, downmix
+from transcript_stitcher import TranscriptStitcher
+
+
+class SourceSpec:
+    """
+    One input to capture: a device, optionally one channel of it, and the label its text is tagged with.
+    Written as device[:channel][=label] in the sources setting, e.g. "2:0=Host, 2:1=Guest, 5=Room".
+    """
+    def __init__(self, device_index, channel=None, label=None):
+        self.device_index = device_index
+        self.channel = channel
+        self.label = label or (f"{device_index}:{channel}" if channel is not None else f"mic {device_index}")
+
+    @classmethod
+    def parse_list(cls, text, default_device=0):
+        specs = []
+        for item in (text or "").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            device, _, label = item.partition("=")
+            device, _, channel = device.partition(":")
+            specs.append(cls(int(device), int(channel) if channel else None, label.strip() or None))
+        return specs or [cls(default_device)]
+
+    def __repr__(self):
+        return f"SourceSpec({self.device_index}, {self.channel}, {self.label!r})"
+
+
+class MultiChannelInput:
+    """
+    One PyAudio input stream of a multi-channel interface, split into a mono AudioSource per channel.
+    Whichever channel's listener needs data first reads a chunk for all of them, so the device is only
+    read once however many channels are listened to.
+    """
+    def __init__(self, device_index, channels, sample_rate=16000, chunk_size=1024, max_buffered_seconds=10, native_rate=False):
+        self.device_index = device_index
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        # Opened at the device's own rate and resampled to sample_rate here, instead of by the driver.
+        self.native_rate = native_rate
+        self.resampler = None
+        self.read_size = chunk_size
+        # A channel nobody reads for a while (e.g. its listener was stopped) keeps only the newest audio.
+        self.max_buffered = max_buffered_seconds * sample_rate * 2
+        self.buffers = [bytearray() for _ in range(channels)]
+        self.lock = threading.Lock()
+        self.users = 0
+        self.audio = None
+        self.stream = None
+
+    def source(self, channel):
+        return ChannelSource(self, channel)
+
+    def open(self):
+        with self.lock:
+            self.users += 1
+            if self.stream is None:
+                pyaudio = sr.Microphone.get_pyaudio()
+                self.audio = pyaudio.PyAudio()
+                rate = self.sample_rate
+                if self.native_rate:
+                    rate = int(self.audio.get_device_info_by_index(self.device_index)["defaultSampleRate"])
+                if rate != self.sample_rate:
+                    self.resampler = PolyphaseResampler(rate, self.sample_rate, channels=self.channels)
+                    self.read_size = max(1, round(self.chunk_size * rate / self.sample_rate))
+                self.stream = self.audio.open(
+                    input_device_index=self.device_index, channels=self.channels, format=pyaudio.paInt16,
+                    rate=rate, frames_per_buffer=self.read_size, input=True,
+                )
+
+    def close(self):
+        with self.lock:
+            self.users -= 1
+            if self.users == 0 and self.stream is not None:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.audio.terminate()
+                self.stream = self.audio = self.resampler = None
+                for buffer in self.buffers:
+                    buffer.clear()
+
+    def read(self, channel, frames):
+        size = frames * 2
+        with self.lock:
+            buffer = self.buffers[channel]
+            while len(buffer) < size and self.stream is not None:
+                data = self.stream.read(self.read_size, exception_on_overflow=False)
+                samples = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+                if self.resampler is not None:
+                    samples = self.resampler.process(samples)
+                for other, other_buffer in enumerate(self.buffers):
+                    other_buffer += samples[:, other].tobytes()
+                    if len(other_buffer) > self.max_buffered:
+                        del other_buffer[:len(other_buffer) - self.max_buffered]
+            data = bytes(buffer[:size])
+            del buffer[:size]
+        return data
+
+
+class NativeRateStream:
+    def __init__(self, source, pyaudio_stream, read_size):
+        self.source = source
+        self.pyaudio_stream = pyaudio_stream
+        self.read_size = read_size
+        self.buffer = bytearray()
+
+    def read(self, frames):
+        # frames of converted audio, read from the device in its own chunks, or in whatever it already has
+        # if that is enough, so reading what get_read_available reported never waits for the device.
+        size = frames * 2
+        source = self.source
+        while len(self.buffer) < size:
+            available = self.pyaudio_stream.get_read_available()
+            native_frames = min(self.read_size, available) if available > 0 else self.read_size
+            data = self.pyaudio_stream.read(native_frames, exception_on_overflow=False)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype=np.int16).reshape(-1, source.channels)
+            if source.channels > 1 or source.resampler is not None:
+                mono = downmix(samples)
+                samples = source.resampler.process(mono) if source.resampler is not None else np.rint(mono).astype(np.int16)
+            self.buffer += samples.tobytes()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def get_read_available(self):
+        # In converted frames, what is buffered here plus what the device's unread frames are sure to give.
+        native = self.pyaudio_stream.get_read_available()
+        resampler = self.source.resampler
+        converted = resampler.output_frames(native) if resampler is not None else native
+        return len(self.buffer) // 2 + max(0, converted)
+
+
+class NativeRateMicrophone(AudioSource):
+    """
+    A microphone opened at its own sample rate and channel count (up to max_channels) instead of making
+    PortAudio or the driver convert, which some hardware can't do or does with extra latency. What it
+    reads is downmixed and resampled to sample_rate mono here with PolyphaseResampler, so the listener,
+    its VAD and the encoders see the same 16 kHz mono stream as with sr.Microphone.
+    """
+    def __init__(self, device_index=None, sample_rate=16000, chunk_size=1024, max_channels=2):
+        self.device_index = device_index
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = chunk_size
+        self.max_channels = max_channels
+        self.audio = None
+        self.stream = None
+
+    def __enter__(self):
+        pyaudio = sr.Microphone.get_pyaudio()
+        self.audio = pyaudio.PyAudio()
+        try:
+            if self.device_index is None:
+                info = self.audio.get_default_input_device_info()
+            else:
+                info = self.audio.get_device_info_by_index(self.device_index)
+            self.native_rate = int(info["defaultSampleRate"])
+            self.channels = max(1, min(int(info["maxInputChannels"]), self.max_channels))
+            self.resampler = PolyphaseResampler(self.native_rate, self.SAMPLE_RATE) if self.native_rate != self.SAMPLE_RATE else None
+            read_size = max(1, round(self.CHUNK * self.native_rate / self.SAMPLE_RATE))
+            pyaudio_stream = self.audio.open(
+                input_device_index=self.device_index, channels=self.channels, format=pyaudio.paInt16,
+                rate=self.native_rate, frames_per_buffer=read_size, input=True,
+            )
+        except Exception:
+            self.audio.terminate()
+            self.audio = None
+            raise
+        logging.info(f"Opened device {self.device_index} at {self.native_rate} Hz, {self.channels} channels, converted to {self.SAMPLE_RATE} Hz mono")
+        self.stream = NativeRateStream(self, pyaudio_stream, read_size)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            sr.Microphone.MicrophoneStream(self.stream.pyaudio_stream).close()
+        finally:
+            self.stream = None
+            self.audio.terminate()
+            self.audio = None
+
+
+class ChannelStream:
+    def __init__(self, source):
+        self.source = source
+
+    def read(self, size):
+        return self.source.input.read(self.source.channel, size)
+
+
+class ChannelSource(AudioSource):
+    def __init__(self, multi_channel_input, channel):
+        self.input = multi_channel_input
+        self.channel = channel
+        self.SAMPLE_RATE = multi_channel_input.sample_rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = multi_channel_input.chunk_size
+        self.stream = None
+
+    def __enter__(self):
+        self.input.open()
+        self.stream = ChannelStream(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+        self.input.close()
+
+
+def read_available(audio_source):
+    # Frames the device has captured that nobody has read yet, None if the source can't tell. A stream that
+    # converts what it reads counts in converted frames, sr.Microphone's only has its PyAudio stream to ask.
+    stream = audio_source.stream
+    available = getattr(stream, "get_read_available", None) or getattr(getattr(stream, "pyaudio_stream", None), "get_read_available", None)
+    return available() if available is not None else None
+
+
+def read_unread(audio_source):
+    # Everything captured that nobody has read yet, converted audio left over from a whole chunk included,
+    # without waiting for the device. None if the source can't tell what it has.
+    available = read_available(audio_source)
+    if available is None:
+        return None
+    data = audio_source.stream.read(available) if available else b""
+    leftover = getattr(audio_source.stream, "buffer", None)
+    if leftover:
+        data += bytes(leftover)
+        leftover.clear()
+    return data
+
+
+class SwitchableSource(AudioSource):
+    """
+    An AudioSource whose device can be swapped while a listener reads it. switch_to() opens the new device
+    right away (make), the listener's next read swaps it in and closes the old one (break), so the listener,
+    the phrase it is recording and everything already queued carry on as if nothing happened.
+
+    At the swap the old device's unread audio is drained and returned first and the audio the new one
+    buffered since it was opened is dropped, so the only audio lost is what was captured between those two
+    calls. on_switch(gap_ms) is called with that time, or None if the devices can't tell what they buffered.
+    """
+    def __init__(self, inner, on_switch=None):
+        self.inner = inner
+        self.on_switch = on_switch
+        self.SAMPLE_RATE = inner.SAMPLE_RATE
+        self.SAMPLE_WIDTH = inner.SAMPLE_WIDTH
+        self.CHUNK = inner.CHUNK
+        self.lock = threading.Lock()
+        self.pending = None
+        self.carry = b""
+        self.stream = None
+
+    def __enter__(self):
+        self.inner.__enter__()
+        self.stream = SwitchableStream(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+        with self.lock:
+            pending, self.pending = self.pending, None
+        for source in (self.inner, pending):
+            if source is not None:
+                source.__exit__(None, None, None)
+
+    def switch_to(self, audio_source):
+        if audio_source.SAMPLE_RATE != self.SAMPLE_RATE or audio_source.SAMPLE_WIDTH != self.SAMPLE_WIDTH:
+            raise ValueError(f"Can't switch to a {audio_source.SAMPLE_RATE} Hz source in a {self.SAMPLE_RATE} Hz pipeline")
+        audio_source.__enter__()
+        with self.lock:
+            replaced, self.pending = self.pending, audio_source
+        if replaced is not None:
+            replaced.__exit__(None, None, None)
+
+    def swap(self, new):
+        # On the listener thread, between two reads.
+        old = self.inner
+        backlog = read_unread(old)
+        if backlog:
+            self.carry += backlog
+        drained_at = time.perf_counter()
+        stale = read_unread(new)
+        swapped_at = time.perf_counter()
+        self.inner = new
+        # Closing a PortAudio stream can take a while, the listener doesn't wait for it.
+        threading.Thread(target=old.__exit__, args=(None, None, None), name="close-device", daemon=True).start()
+        gap_ms = (swapped_at - drained_at) * 1000 if backlog is not None and stale is not None else None
+        if self.on_switch is not None:
+            self.on_switch(gap_ms)
+
+    def read(self, frames):
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is not None:
+            self.swap(pending)
+        size = frames * self.SAMPLE_WIDTH
+        if not self.carry:
+            return self.inner.stream.read(frames)
+        data, self.carry = self.carry[:size], self.carry[size:]
+        if len(data) < size:
+            data += self.inner.stream.read((size - len(data)) // self.SAMPLE_WIDTH)
+        return data
+
+
+class SwitchableStream:
+    def __init__(self, source):
+        self.source = source
+
+    def read(self, size):
+        return self.source.read(size)
+
+
+class CaptureSource:
+    """
+    Everything the recorder keeps per input: the ring buffer its listener writes to, the listener with its
+    own VAD and threshold, the utterance being segmented and the stitcher for its transcripts.
+    """
+    def __init__(self, spec, ring_seconds, energy_threshold):
+        self.spec = spec
+        self.label = spec.label
+        self.ring_buffer = PCMRingBuffer.for_duration(ring_seconds, 16000, 2)
+        self.recorder = custom_recorder.CustomBackgroundRecorder(self.ring_buffer)
+        self.recorder.energy_threshold = energy_threshold
+        self.recorder.dynamic_energy_threshold = False
+        # So the listener callbacks, which get the recognizer, can find their way back here.
+        self.recorder.capture_source = self
+        self.stitcher = TranscriptStitcher()
+        self.audio_source = None
+        self.background_listening = None
+        # Utterance state, see AudioRecorder.dispatch_segments.
+        self.utterance_start = self.utterance_end = None
+        self.committed_position = 0
+        self.phrase_time = None
+        self.new_utterance = True
+        # Bumped at every phrase end (under the recorder's partial_lock), partials of finished phrases are
+        # dropped. utterance_generation is the one the newest queued phrase ended.
+        self.phrase_generation = 0
+        self.utterance_generation = 0
+
+
+def open_audio_sources(specs, sample_rate=16000, native_rate=True):
+    """
+    Returns an AudioSource per spec. Channels of the same device share one MultiChannelInput. With
+    native_rate devices are opened at their own rate and converted to sample_rate here.
+    """
+    channels_needed = collections.defaultdict(int)
+    for spec in specs:
+        if spec.channel is not None:
+            channels_needed[spec.device_index] = max(channels_needed[spec.device_index], spec.channel + 1)
+    inputs = {device: MultiChannelInput(device, channels, sample_rate, native_rate=native_rate) for device, channels in channels_needed.items()}
+    sources = []
+    for spec in specs:
+        if spec.channel is None:
+            if native_rate:
+                sources.append(NativeRateMicrophone(spec.device_index, sample_rate))
+            else:
+                sources.append(sr.Microphone(sample_rate=sample_rate, device_index=spec.device_index))
+        else:
+            sources.append(inputs[spec.device_index].source(spec.channel))
+    if inputs:
+        logging.info(f"Capturing channels of {', '.join(f'device {d} ({n} channels)' for d, n in channels_needed.items())}")
+    return sources
@@ -0,0 +1,76 @@
+import numpy as np
+
+from vad import VoiceActivityDetector
+
+
+class CompactedAudio:
+    """
+    What is left of a segment after compaction: the pieces of the original PCM to upload, in order, and
+    the byte ranges of the original they came from.
+    """
+    def __init__(self, pcm, kept, bytes_per_second):
+        self.pieces = [pcm[start:end] for start, end in kept]
+        self.kept = kept
+        self.bytes_per_second = bytes_per_second
+        self.original_seconds = len(pcm) / bytes_per_second
+        self.seconds = sum(end - start for start, end in kept) / bytes_per_second
+
+    @property
+    def saved_seconds(self):
+        return self.original_seconds - self.seconds
+
+
+class SilenceCompactor:
+    """
+    Cuts what doesn't need to be uploaded out of a segment: the silence before the first and after the
+    last speech frame is trimmed to keep_seconds, and pauses inside it longer than max_pause_seconds are
+    shortened to that, half of it kept on each side. Speech and non-speech are the VoiceActivityDetector's
+    frame decisions at the listener's energy threshold, the same ones that closed the phrase.
+    """
+    def __init__(self, sample_rate=16000, sample_width=2, keep_seconds=0.2, max_pause_seconds=0.5):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.keep_seconds = keep_seconds
+        self.max_pause_seconds = max_pause_seconds
+
+    def decisions(self, pcm, energy_threshold):
+        # Speech decision per VAD frame, a fresh detector so the hangover of other segments doesn't leak in.
+        vad = VoiceActivityDetector(self.sample_rate)
+        return vad.frame_decisions(pcm, energy_threshold), vad.frame_length * self.sample_width
+
+    def speech_seconds(self, pcm, energy_threshold):
+        if len(pcm) < 2 * self.sample_width:
+            return 0.0
+        decisions, frame_bytes = self.decisions(pcm, energy_threshold)
+        return int(decisions.sum()) * frame_bytes / (self.sample_rate * self.sample_width)
+
+    def compact(self, pcm, energy_threshold):
+        """
+        Returns a CompactedAudio for the segment pcm (a memoryview), with no pieces if there is no speech in it.
+        """
+        pcm = memoryview(pcm).cast("B")
+        bytes_per_second = self.sample_rate * self.sample_width
+        if len(pcm) < 2 * self.sample_width:
+            return CompactedAudio(pcm, [], bytes_per_second)
+        decisions, frame_bytes = self.decisions(pcm, energy_threshold)
+        speech = np.flatnonzero(decisions)
+        if not len(speech):
+            return CompactedAudio(pcm, [], bytes_per_second)
+
+        keep = int(self.keep_seconds * bytes_per_second) // self.sample_width * self.sample_width
+        half_pause = int(self.max_pause_seconds / 2 * bytes_per_second) // self.sample_width * self.sample_width
+        # Runs of speech frames as [first, last] frame indices.
+        breaks = np.flatnonzero(np.diff(speech) > 1)
+        firsts = np.concatenate(([speech[0]], speech[breaks + 1]))
+        lasts = np.concatenate((speech[breaks], [speech[-1]]))
+        kept = []
+        start = max(0, firsts[0] * frame_bytes - keep)
+        for last, next_first in zip(lasts[:-1], firsts[1:]):
+            pause_start, pause_end = (last + 1) * frame_bytes, next_first * frame_bytes
+            if pause_end - pause_start > 2 * half_pause:
+                kept.append((int(start), int(pause_start + half_pause)))
+                start = pause_end - half_pause
+        # The last frame also covers whatever didn't fill a whole one.
+        end = len(pcm) if lasts[-1] == len(decisions) - 1 else min(len(pcm), (lasts[-1] + 1) * frame_bytes + keep)
+        kept.append((int(start), int(end)))
+        return CompactedAudio(pcm, kept, bytes_per_second)
@@ -1,19 +1,61 @@
 from speech_recognition import Recognizer, AudioSource, WaitTimeoutError, AudioData
 import threading
+import time
 import os
 import math
 import collections
-import audioop
+
+from pcm_ring_buffer import PCMRingBuffer
+from vad import VoiceActivityDetector
 
 class CustomBackgroundRecorder(Recognizer):
-    def __init__(self):
+    def __init__(self, ring_buffer=None):
         super().__init__()
         # Set to true from another thread and can return from listen on command, basically.
         self.force_stop = False
+        # Set once the source has no more audio to give, only happens with finite sources like files.
+        self.stream_ended = False
+        # Captured audio is written here instead of being joined into a new bytes object per phrase.
+        # 2 minutes of 16 kHz 16 bit audio unless the owner shares its own buffer.
+        self.ring_buffer = ring_buffer if ring_buffer is not None else PCMRingBuffer.for_duration(120, 16000, 2)
+        # Decides speech / non-speech per chunk in place of audioop.rms > energy_threshold.
+        self.vad = VoiceActivityDetector()
+        # Called as partial_callback(self, (start, end)) with the ring span of the phrase so far every
+        # partial_interval seconds of audio while a phrase is going on, for streaming provisional text.
+        self.partial_callback = None
+        self.partial_interval = 0.5
+        # Optional segmenter.ChangePointSegmenter that cuts long phrases at speaker changes and valleys.
+        # The audio after its cut starts the next phrase, carry_position is where.
+        self.segmenter = None
+        self.carry_position = None
+
+    def adjust_for_ambient_noise(self, source, duration=1):
+        """
+        Same as Recognizer's, but measuring energy with the VAD instead of audioop.
+        """
+        assert isinstance(source, AudioSource), "Source must be an audio source"
+        assert source.stream is not None, "Audio source must be entered before adjusting, see documentation for ``AudioSource``; are you using ``source`` outside of a ``with`` statement?"
+        assert self.pause_threshold >= self.non_speaking_duration >= 0
+
+        seconds_per_buffer = (source.CHUNK + 0.0) / source.SAMPLE_RATE
+        elapsed_time = 0
+
+        # adjust energy threshold until a phrase starts
+        while True:
+            elapsed_time += seconds_per_buffer
+            if elapsed_time > duration: break
+            buffer = source.stream.read(source.CHUNK)
+            energy = self.vad.rms(buffer)  # energy of the audio signal
+
+            # dynamically adjust the energy threshold using asymmetric weighted average
+            damping = self.dynamic_energy_adjustment_damping ** seconds_per_buffer  # account for different chunk sizes and rates
+            target_energy = energy * self.dynamic_energy_ratio
+            self.energy_threshold = self.energy_threshold * damping + target_energy * (1 - damping)
 
     def listen(self, source, timeout=None, phrase_time_limit=None, snowboy_configuration=None):
         """
         while loops coondition is now self.force_stop, so we can return as if phrase_time_limit had been reached, but on command and at any point if change such value from a another thread.
+        Audio goes into self.ring_buffer, the returned AudioData's frame_data is a memoryview over it and its span is in ring_span.
         """
         assert isinstance(source, AudioSource), "Source must be an audio source"
         assert source.stream is not None, "Audio source must be entered before listening, see documentation for ``AudioSource``; are you using ``source`` outside of a ``with`` statement?"
@@ -29,12 +71,22 @@ class CustomBackgroundRecorder(Recognizer):
         non_speaking_buffer_count = int(math.ceil(self.non_speaking_duration / seconds_per_buffer))  # maximum number of buffers of non-speaking audio to retain before and after a phrase
 
         # read audio input for phrases until there is a phrase that is long enough
+        self.vad.reset()
         elapsed_time = 0  # number of seconds of audio read
         buffer = b""  # an empty buffer means that the stream has ended and there is no data left to read
+        ring = self.ring_buffer
+        frames, pause_count = collections.deque(), 0  # so a force_stop set before we got here returns empty audio
+        cut = None
         while not self.force_stop:
-            frames = collections.deque()
-
-            if snowboy_configuration is None:
+            frames = collections.deque()  # start positions in the ring buffer of the buffers kept so far
+            carried_seconds = 0
+
+            if self.carry_position is not None and ring.is_available(self.carry_position):
+                # The segmenter cut the previous phrase while it was still going, this one starts right at the cut.
+                frames.append(self.carry_position)
+                carried_seconds = (ring.write_position - self.carry_position) / (source.SAMPLE_RATE * source.SAMPLE_WIDTH)
+                self.carry_position = None
+            elif snowboy_configuration is None:
                 # store audio input until the phrase starts
                 while not self.force_stop:
                     # handle waiting too long for phrase by raising an exception
@@ -43,14 +95,14 @@ class CustomBackgroundRecorder(Recognizer):
                         raise WaitTimeoutError("listening timed out while waiting for phrase to start")
 
                     buffer = source.stream.read(source.CHUNK)
-                    if len(buffer) == 0: break  # reached end of the stream
-                    frames.append(buffer)
+                    if len(buffer) == 0: self.stream_ended = True; break  # reached end of the stream
+                    frames.append(ring.write(buffer)[0])
                     if len(frames) > non_speaking_buffer_count:  # ensure we only keep the needed amount of non-speaking buffers
                         frames.popleft()
 
                     # detect whether speaking has started on audio input
-                    energy = audioop.rms(buffer, source.SAMPLE_WIDTH)  # energy of the audio signal
-                    if energy > self.energy_threshold: break
+                    if self.vad.is_speech(buffer, self.energy_threshold): break
+                    energy = self.vad.last_energy  # energy of the audio signal
 
                     # dynamically adjust the energy threshold using asymmetric weighted average
                     if self.dynamic_energy_threshold:
@@ -63,11 +115,18 @@ class CustomBackgroundRecorder(Recognizer):
                 buffer, delta_time = self.snowboy_wait_for_hot_word(snowboy_location, snowboy_hot_word_files, source, timeout)
                 elapsed_time += delta_time
                 if len(buffer) == 0: break  # reached end of the stream
-                frames.append(buffer)
+                frames.append(ring.write(buffer)[0])
+
+            self.carry_position = None
+            if self.segmenter is not None:
+                self.segmenter.reset()
+                if carried_seconds:
+                    self.segmenter.add(ring.view(frames[0], ring.write_position), frames[0])
 
             # read audio input until the phrase ends
-            pause_count, phrase_count = 0, 0
-            phrase_start_time = elapsed_time
+            pause_count, phrase_count = 0, int(carried_seconds / seconds_per_buffer)
+            phrase_start_time = elapsed_time - carried_seconds
+            next_partial_time = self.partial_interval
             while not self.force_stop:
                 # handle phrase being too long by cutting off the audio
                 elapsed_time += seconds_per_buffer
@@ -75,50 +134,72 @@ class CustomBackgroundRecorder(Recognizer):
                     break
 
                 buffer = source.stream.read(source.CHUNK)
-                if len(buffer) == 0: break  # reached end of the stream
-                frames.append(buffer)
+                if len(buffer) == 0: self.stream_ended = True; break  # reached end of the stream
+                frames.append(ring.write(buffer)[0])
                 phrase_count += 1
 
+                # hand out the phrase so far for a provisional transcription
+                if self.partial_callback is not None and elapsed_time - phrase_start_time >= next_partial_time:
+                    next_partial_time += self.partial_interval
+                    self.partial_callback(self, (frames[0], ring.write_position))
+
                 # check if speaking has stopped for longer than the pause threshold on the audio input
-                energy = audioop.rms(buffer, source.SAMPLE_WIDTH)  # unit energy of the audio signal within the buffer
-                if energy > self.energy_threshold:
+                if self.vad.is_speech(buffer, self.energy_threshold):
                     pause_count = 0
                 else:
                     pause_count += 1
                 if pause_count > pause_buffer_count:  # end of the phrase
                     break
 
+                # or cut it short at a speaker change or a valley between words, the rest goes to the next phrase
+                if self.segmenter is not None:
+                    self.segmenter.add(buffer, frames[-1])
+                    cut = self.segmenter.cut_position()
+                    if cut is not None:
+                        pause_count = 0
+                        break
+
             # check how long the detected phrase is, and retry listening if the phrase is too short
             phrase_count -= pause_count  # exclude the buffers for the pause before the phrase
             if phrase_count >= phrase_buffer_count or len(buffer) == 0: break  # phrase is long enough or we've reached the end of the stream, so stop listening
 
         # obtain frame data
-        for i in range(pause_count - non_speaking_buffer_count): frames.pop()  # remove extra non-speaking frames at the end
-        frame_data = b"".join(frames)
+        end = ring.write_position
+        for i in range(pause_count - non_speaking_buffer_count): end = frames.pop()  # remove extra non-speaking frames at the end
+        if cut is not None and not self.force_stop:
+            end = self.carry_position = cut
+        start = frames[0] if frames else end
+        # Frames were written back to back, so the phrase is one contiguous span of the ring buffer.
+        start = max(start, ring.oldest_position)
 
         self.force_stop = False  # Reset the force_stop attribute after recording is done
-        return AudioData(frame_data, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        audio = AudioData(ring.view(start, end), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        audio.ring_span = (start, end)
+        audio.captured_at = time.monotonic()
+        audio.vad_seconds = pause_count * seconds_per_buffer  # non-speech heard before the phrase was closed
+        return audio
 
 
     def listen_in_background(self, source, callback, phrase_time_limit=None):
         """
-        just like original just have a 1/10 instead of 1 as timeout for self.listen call on threa loop.
+        just like original, but self.listen is called without a timeout instead of waking up every second to
+        check if it should stop, the stopper ends the current listen with force_stop instead.
+        Stops on its own when the source's stream ends, e.g. for an AudioFile.
         """
         assert isinstance(source, AudioSource), "Source must be an audio source"
         running = [True]
 
         def threaded_listen():
+            self.stream_ended = False
             with source as s:
                 while running[0]:
-                    try:  # listen for 1 second, then check again if the stop function has been called
-                        audio = self.listen(s, 1/10, phrase_time_limit)
-                    except WaitTimeoutError:  # listening timed out, just try again
-                        pass
-                    else:
-                        if running[0]: callback(self, audio)
+                    audio = self.listen(s, None, phrase_time_limit)
+                    if running[0] and len(audio.frame_data): callback(self, audio)
+                    if self.stream_ended: break
 
         def stopper(wait_for_stop=True):
             running[0] = False
+            self.force_stop = True  # return from the listen call in progress right away
             if wait_for_stop:
                 listener_thread.join()  # block until the background thread is done, which can take around 1 second
 
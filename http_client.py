@@ -0,0 +1,97 @@
+import threading
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code, body):
+        super().__init__(f"HTTP {status_code}: {body[:200]}")
+        self.status_code = status_code
+        # Overloaded or rate limited endpoints are worth trying again, bad requests aren't.
+        self.retryable = status_code == 429 or status_code >= 500
+
+
+def http2_available():
+    # HTTP/2 needs httpx with its h2 extra, neither is a hard dependency.
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TranscriptionHTTPClient:
+    """
+    Persistent, connection pooled client for an HTTP transcription endpoint. Segments reuse warm
+    keep-alive connections instead of paying a TCP+TLS handshake each. Uses httpx over HTTP/2 when asked
+    to and it's installed, requests.Session otherwise.
+    """
+    def __init__(self, url, pool_size=4, keep_alive=True, http2=False, timeout=15):
+        self.url = url
+        self.timeout = timeout
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logging.info("HTTP/2 requested but httpx[http2] is not installed, using HTTP/1.1")
+
+        if self.http2:
+            import httpx
+            self.session = httpx.Client(
+                http2=True,
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size if keep_alive else 0,
+                ),
+            )
+        else:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+            if not keep_alive:
+                self.session.headers["Connection"] = "close"
+
+    def post(self, data, headers=None, timeout=None):
+        """
+        POSTs data (bytes or a file-like such as WavStream, streamed with its length) and returns the decoded JSON response. Timeouts are raised as TimeoutError whichever
+        library is underneath, error statuses as HTTPStatusError.
+        """
+        timeout = timeout or self.timeout
+        if hasattr(data, "seek"):
+            data.seek(0)
+        if self.http2:
+            import httpx
+            # httpx would send a file-like body chunked and line by line, hand it the bytes instead.
+            if hasattr(data, "read"):
+                data = data.read()
+            try:
+                response = self.session.post(self.url, headers=headers, content=data, timeout=timeout)
+            except httpx.TimeoutException as e:
+                raise TimeoutError(f"Request timed out after {timeout} seconds") from e
+        else:
+            try:
+                response = self.session.post(self.url, headers=headers, data=data, timeout=timeout)
+            except requests.Timeout as e:
+                raise TimeoutError(f"Request timed out after {timeout} seconds") from e
+        if response.status_code >= 400:
+            raise HTTPStatusError(response.status_code, response.text)
+        return response.json()
+
+    def warm_up(self, headers=None):
+        """
+        Opens a connection in the background so the first phrase doesn't pay the cold connect latency.
+        """
+        def warm():
+            try:
+                self.session.head(self.url, headers=headers, timeout=self.timeout)
+                logging.info(f"Warmed up connection to {self.url}")
+            except Exception as e:
+                logging.info(f"Connection warm up to {self.url} failed: {e}")
+
+        threading.Thread(target=warm, daemon=True).start()
+
+    def close(self):
+        self.session.close()
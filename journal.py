@@ -0,0 +1,278 @@
+"""
+Append-only journal of every segment sent for transcription, failed ones included, so a session survives
+the app exiting or crashing and can be looked up, replayed or re-transcribed later.
+
+Each session is a directory with
+    segments.jsonl  one JSON record per segment (times, text, backend, where its audio is)
+    audio.bin       the segments' encoded audio back to back, when audio is journaled
+    index.bin       (end time, record offset) pairs for binary search by time
+
+    python journal.py list
+    python journal.py show journal/session-20240101-120000 --from 12:05 --to 12:10
+    python journal.py retranscribe journal/session-20240101-120000 --backend local
+"""
+from array import array
+import argparse
+import bisect
+import io
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+from audio_encoders import create_encoder
+
+# Segment end as unix time, offset of its record in segments.jsonl. Ends are indexed because they follow
+# the capture order of the phrases, so they never go back.
+INDEX_ENTRY = struct.Struct("<dQ")
+
+
+class SessionJournal:
+    """
+    Writes segments on its own thread: record only queues them, the writer takes whatever is queued within
+    flush_interval, encodes the audio, appends and fsyncs the batch, then adds the batch to the index.
+    """
+    def __init__(self, directory, store_audio=False, audio_format="flac", flush_interval=1.0, max_batch=64):
+        self.path = os.path.join(directory, time.strftime("session-%Y%m%d-%H%M%S"))
+        os.makedirs(self.path, exist_ok=True)
+        self.encoder = create_encoder(audio_format) if store_audio else None
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.segments = open(os.path.join(self.path, "segments.jsonl"), "ab")
+        self.index = open(os.path.join(self.path, "index.bin"), "ab")
+        self.audio = open(os.path.join(self.path, "audio.bin"), "ab") if store_audio else None
+        self.segments_end = self.segments.tell()
+        self.audio_end = self.audio.tell() if self.audio else 0
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name="journal", daemon=True)
+        self.writer.start()
+        logging.info(f"Journaling the session to {self.path}")
+
+    @property
+    def store_audio(self):
+        return self.encoder is not None
+
+    def record(self, sequence, start, duration, text, transcript=None, backend=None, pcm=None, sample_rate=16000, sample_width=2, source=None, error=None):
+        """
+        Queues a segment, start is its unix time. pcm must be a copy the caller won't touch again, it is
+        only encoded on the writer thread. error says why a segment has no transcript, if it failed.
+        """
+        entry = {
+            "sequence": sequence,
+            "start": start,
+            "duration": duration,
+            "text": text,
+            "transcript": transcript if transcript is not None else text,
+            "backend": backend,
+            "source": source,
+            "sample_rate": sample_rate,
+            "sample_width": sample_width,
+            "error": error,
+        }
+        self.queue.put((entry, pcm if self.store_audio else None))
+
+    def write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            batch = [item for item in batch if item is not None]
+            if batch:
+                try:
+                    self.write_batch(batch)
+                except Exception:
+                    logging.exception(f"Couldn't write {len(batch)} segments to the journal")
+            if stopping:
+                return
+
+    def write_batch(self, batch):
+        index = bytearray()
+        for entry, pcm in batch:
+            if pcm is not None:
+                encoded = self.encoder.encode(memoryview(pcm), entry["sample_rate"], entry["sample_width"])
+                encoded.seek(0)
+                data = encoded.read()
+                self.audio.write(data)
+                entry["audio"] = {"offset": self.audio_end, "length": len(data), "format": self.encoder.name}
+                self.audio_end += len(data)
+            line = json.dumps(entry).encode() + b"\n"
+            index += INDEX_ENTRY.pack(entry["start"] + entry["duration"], self.segments_end)
+            self.segments.write(line)
+            self.segments_end += len(line)
+        # Data before index, so the index never points past what is on disk.
+        for f in (self.audio, self.segments):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        self.index.write(index)
+        self.index.flush()
+        os.fsync(self.index.fileno())
+
+    def close(self, timeout=10):
+        self.queue.put(None)
+        self.writer.join(timeout)
+        for f in (self.segments, self.index, self.audio):
+            if f is not None:
+                f.close()
+
+
+class JournalReader:
+    """
+    Reads a session written by SessionJournal. Records the index doesn't cover yet (a crash between the
+    data and the index fsync) are recovered from segments.jsonl, a torn last line is ignored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.ends = array("d")
+        self.offsets = array("Q")
+        with open(os.path.join(path, "index.bin"), "rb") as f:
+            data = f.read()
+        # A torn last entry is dropped, recover_unindexed finds its record again.
+        for end, offset in INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]):
+            self.ends.append(end)
+            self.offsets.append(offset)
+        self.segments = open(os.path.join(path, "segments.jsonl"), "rb")
+        self.recover_unindexed()
+        audio_path = os.path.join(path, "audio.bin")
+        self.audio_file = open(audio_path, "rb") if os.path.exists(audio_path) else None
+
+    def recover_unindexed(self):
+        position = 0
+        if self.offsets:
+            self.segments.seek(self.offsets[-1])
+            position = self.offsets[-1] + len(self.segments.readline())
+        self.segments.seek(position)
+        for line in self.segments:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            self.ends.append(entry["start"] + entry["duration"])
+            self.offsets.append(position)
+            position += len(line)
+
+    @staticmethod
+    def sessions(directory):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if os.path.exists(os.path.join(directory, name, "segments.jsonl"))
+        )
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def entry(self, index):
+        self.segments.seek(self.offsets[index])
+        return json.loads(self.segments.readline())
+
+    def between(self, start=None, end=None):
+        # Segments overlapping [start, end), by unix time.
+        entries = []
+        for i in range(0 if start is None else bisect.bisect_right(self.ends, start), len(self.ends)):
+            entry = self.entry(i)
+            if end is not None and entry["start"] >= end:
+                break
+            entries.append(entry)
+        return entries
+
+    def audio(self, entry):
+        # The segment's 16 bit PCM, or None if its audio wasn't journaled.
+        if "audio" not in entry or self.audio_file is None:
+            return None
+        import numpy as np
+        import soundfile
+        self.audio_file.seek(entry["audio"]["offset"])
+        data = self.audio_file.read(entry["audio"]["length"])
+        samples, _ = soundfile.read(io.BytesIO(data), dtype="int16")
+        return np.ascontiguousarray(samples).tobytes()
+
+    def close(self):
+        self.segments.close()
+        if self.audio_file is not None:
+            self.audio_file.close()
+
+
+def parse_time(value, session_start):
+    # HH:MM[:SS] on the session's day, or a unix time.
+    if ":" not in value:
+        return float(value)
+    parts = [int(part) for part in value.split(":")] + [0]
+    day = time.localtime(session_start)
+    return time.mktime((day.tm_year, day.tm_mon, day.tm_mday, parts[0], parts[1], parts[2], 0, 0, -1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="list the journaled sessions")
+    list_parser.add_argument("directory", nargs="?", default="journal")
+    for name in ("show", "retranscribe"):
+        command = commands.add_parser(name)
+        command.add_argument("session", help="session directory")
+        command.add_argument("--from", dest="start", help="HH:MM[:SS] or unix time")
+        command.add_argument("--to", dest="end", help="HH:MM[:SS] or unix time")
+        if name == "retranscribe":
+            command.add_argument("--backend", help="registered transcription backend, the configured one by default")
+            command.add_argument("--config", default="config.ini")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for path in JournalReader.sessions(args.directory):
+            reader = JournalReader(path)
+            if len(reader):
+                span = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.entry(0)['start']))} - {time.strftime('%H:%M:%S', time.localtime(reader.ends[-1]))}"
+            else:
+                span = "empty"
+            print(f"{path}  {len(reader)} segments  {span}  audio: {'yes' if reader.audio_file else 'no'}")
+            reader.close()
+        return
+
+    reader = JournalReader(args.session)
+    if not len(reader):
+        raise SystemExit(f"{args.session} has no segments")
+    start = parse_time(args.start, reader.entry(0)['start']) if args.start else None
+    end = parse_time(args.end, reader.entry(0)['start']) if args.end else None
+    entries = reader.between(start, end)
+
+    if args.command == "show":
+        for entry in entries:
+            source = f" {entry['source']}" if entry.get("source") else ""
+            text = f"[{entry['error']}]" if entry.get("error") else entry['text'].strip()
+            print(f"[{time.strftime('%H:%M:%S', time.localtime(entry['start']))}{source}] {text}")
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        from batch_transcribe import backend_from_settings
+        from settings_manager import SettingsManager
+        from transcription_backends import SegmentMeta, TranscriptionError
+        backend = backend_from_settings(SettingsManager(args.config), args.backend, workers=1)
+        if backend is None:
+            raise SystemExit("No usable transcription backend, pass --backend")
+        try:
+            for entry in entries:
+                pcm = reader.audio(entry)
+                if pcm is None:
+                    logging.warning(f"Segment {entry['sequence']} has no journaled audio")
+                    continue
+                meta = SegmentMeta(entry["sample_rate"], entry["sample_width"], len(pcm) / (entry["sample_rate"] * entry["sample_width"]))
+                try:
+                    text = backend.transcribe(memoryview(pcm), meta)
+                except (TimeoutError, TranscriptionError) as e:
+                    text = f"[{e}]"
+                print(f"[{time.strftime('%H:%M:%S', time.localtime(entry['start']))}] {text.strip()}")
+        finally:
+            backend.close()
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
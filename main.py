@@ -1,27 +1,31 @@
 # Standard library imports
 import sys
+import html
 import logging
+import logging.handlers
 
 # Third-party imports
-from PyQt5.QtGui import QFont
+from PyQt5.QtGui import QFont, QTextCursor
 from PyQt5.QtWidgets import (
     QSizePolicy, QApplication, QMainWindow,
-    QTextEdit, QVBoxLayout, QMenuBar, QAction, QPushButton, QWidget,
+    QPlainTextEdit, QVBoxLayout, QMenuBar, QAction, QPushButton, QWidget, QFileDialog, QLabel,
     )
 
-from PyQt5.QtCore import pyqtSignal, QObject
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer, QEvent, Qt
 
-# Replaced keyboard library with pynput for hotkeys
-from pynput import keyboard
-
-from recorder import AudioRecorder
 # from player import AudioPlayer
 from settings_manager import SettingsManager
-from preferences_dialogue import PreferencesDialog
+from transcript_store import TranscriptStore
+from audio_devices import DeviceList
 # from audio_stream_processor import AudioStreamProcessor
+# The recorder, the backends, the preferences dialog and pynput are imported where they are first used,
+# they pull in speech_recognition, numpy, requests and openai, none of which the window needs to show up.
 
-# Configure logging
-logging.basicConfig(filename='app.log', filemode='w', level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging, rotated instead of wiped on every start so earlier sessions' timings survive
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.handlers.RotatingFileHandler('app.log', maxBytes=5_000_000, backupCount=3)],
+)
 
 class Communicate(QObject):
     force_transcribe_signal = pyqtSignal()
@@ -31,20 +35,33 @@ class MainWindow(QMainWindow):
         super().__init__()
         logging.info('Initializing MainWindow')
         self.settings_manager = SettingsManager()
-        self.initUI()
         self.audio_recorder = None
-        self.init_audio_recorder()
+        self.device_list = DeviceList(self)
+        # Everything else waits until the window has been painted, see eventFilter.
+        self.startup_finished = False
+        self.initUI()
         self.installEventFilter(self)  # Install an event filter to capture key events globally
 
-        # Set up keyboard hotkeys for toggling the mic and transcribe buttons
-        self.setup_keyboard_hotkeys()
-
         # Initialize communication signal
         self.comm = Communicate()
         self.comm.force_transcribe_signal.connect(self.force_transcribe)
 
+    def eventFilter(self, obj, event):
+        if obj is self and event.type() == QEvent.Paint and not self.startup_finished:
+            self.startup_finished = True
+            QTimer.singleShot(0, self.finish_startup)
+        return super().eventFilter(obj, event)
+
+    def finish_startup(self):
+        # Ready by the time the preferences are opened.
+        self.device_list.refresh()
+        self.init_audio_recorder()
+        # Set up keyboard hotkeys for toggling the mic and transcribe buttons
+        self.setup_keyboard_hotkeys()
+
     def setup_keyboard_hotkeys(self):
-        # Set up hotkeys using pynput
+        # Set up hotkeys using pynput, replaced keyboard library
+        from pynput import keyboard
         self.listener = keyboard.GlobalHotKeys({
             '<ctrl>+k': lambda: self.comm.force_transcribe_signal.emit(),
         })
@@ -53,41 +70,96 @@ class MainWindow(QMainWindow):
 
     def open_preferences(self):
         logging.info('Opening preferences dialog')
-        dialog = PreferencesDialog(self.settings_manager, self)
-        dialog.preferencesUpdated.connect(self.apply_new_preferences)
+        from preferences_dialogue import PreferencesDialog
+        dialog = PreferencesDialog(self.settings_manager, self, device_list=self.device_list)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
         dialog.exec_()  # This will show the dialog as a modal window
 
-    def apply_new_preferences(self):
-        # Apply new preferences without the need to restart the application
-        logging.info('Applying new preferences')
-        if self.audio_recorder:
-            self.audio_recorder.openai_api_key = self.settings_manager.get_setting('DEFAULT', 'openai_api_key')
-            self.audio_recorder.huggingface_auth_header = self.settings_manager.get_setting('DEFAULT', 'whisperInt_auth_header')
-            self.audio_recorder.device_index = self.settings_manager.get_setting('DEFAULT', 'device_index', value_type=int)
-
-        font_size = self.settings_manager.get_setting('DEFAULT', 'font_size', fallback=12, value_type=int)
-        font = QFont("Arial", font_size)
-        self.text_edit.setFont(font)
+    def apply_font_size(self, changes):
+        self.text_edit.setFont(QFont("Arial", changes['font_size']))
 
     def init_audio_recorder(self):
         logging.info('Initializing audio recorder')
+        from recorder import AudioRecorder
         if self.audio_recorder:
             self.audio_recorder.stop_recording()
+        # A new recorder counts phrase generations from 0 again.
+        self.final_generation = {}
     
+        get = self.settings_manager.get_setting
         self.audio_recorder = AudioRecorder(
-            energy_threshold=self.settings_manager.get_setting('DEFAULT', 'energy_threshold', fallback=1000, value_type=int),
-            record_timeout=self.settings_manager.get_setting('DEFAULT', 'record_timeout', fallback=18, value_type=int),
-            phrase_timeout=self.settings_manager.get_setting('DEFAULT', 'phrase_timeout', fallback=1/10, value_type=float),
-            device_index=self.settings_manager.get_setting('DEFAULT', 'device_index', fallback=0, value_type=int),
-            whisperInt_auth_header=self.settings_manager.get_setting('DEFAULT', 'whisperInt_auth_header'),
-            openai_api_key=self.settings_manager.get_setting('DEFAULT', 'openai_api_key'),
-            transcription_service=self.settings_manager.get_setting('DEFAULT', 'transcription_service', fallback="whisperInt"),
+            energy_threshold=get('DEFAULT', 'energy_threshold'),
+            record_timeout=get('DEFAULT', 'record_timeout'),
+            phrase_timeout=get('DEFAULT', 'phrase_timeout'),
+            device_index=get('DEFAULT', 'device_index'),
+            whisperInt_auth_header=get('DEFAULT', 'whisperInt_auth_header'),
+            openai_api_key=get('DEFAULT', 'openai_api_key'),
+            transcription_service=get('DEFAULT', 'transcription_service'),
+            overlap_seconds=get('DEFAULT', 'overlap_seconds'),
+            transcription_workers=get('DEFAULT', 'transcription_workers'),
+            request_timeout=get('DEFAULT', 'request_timeout'),
+            http_pool_size=get('DEFAULT', 'http_pool_size'),
+            http2=get('DEFAULT', 'http2'),
+            warm_up_connection=get('DEFAULT', 'warm_up_connection'),
+            upload_format=get('DEFAULT', 'upload_format'),
+            opus_bitrate=get('DEFAULT', 'opus_bitrate'),
+            local_model=get('DEFAULT', 'local_model'),
+            streaming_partials=get('DEFAULT', 'streaming_partials'),
+            partial_interval_ms=get('DEFAULT', 'partial_interval_ms'),
+            metrics_file=get('DEFAULT', 'metrics_file'),
+            metrics_port=get('DEFAULT', 'metrics_port'),
+            cache_entries=get('DEFAULT', 'cache_entries'),
+            cache_disk_path=get('DEFAULT', 'cache_disk_path'),
+            cache_disk_mb=get('DEFAULT', 'cache_disk_mb'),
+            request_retries=get('DEFAULT', 'request_retries'),
+            hedge_service=get('DEFAULT', 'hedge_service'),
+            journal_dir=get('DEFAULT', 'journal_dir') or None,
+            journal_audio=get('DEFAULT', 'journal_audio'),
+            journal_audio_format=get('DEFAULT', 'journal_audio_format'),
+            sources=get('DEFAULT', 'sources'),
+            segment_on_changes=get('DEFAULT', 'segment_on_changes'),
+            segment_min_seconds=get('DEFAULT', 'segment_min_seconds'),
+            segment_max_seconds=get('DEFAULT', 'segment_max_seconds'),
+            speaker_change_threshold=get('DEFAULT', 'speaker_change_threshold'),
+            valley_db=get('DEFAULT', 'valley_db'),
+            native_rate_capture=get('DEFAULT', 'native_rate_capture'),
+            backlog_policy=get('DEFAULT', 'backlog_policy'),
+            max_backlog_segments=get('DEFAULT', 'max_backlog_segments'),
+            max_lag_seconds=get('DEFAULT', 'max_lag_seconds'),
+            downgrade_service=get('DEFAULT', 'downgrade_service'),
+            compact_silence=get('DEFAULT', 'compact_silence'),
+            keep_silence_seconds=get('DEFAULT', 'keep_silence_seconds'),
+            max_pause_seconds=get('DEFAULT', 'max_pause_seconds'),
+            min_speech_seconds=get('DEFAULT', 'min_speech_seconds'),
         )
 
+        # Changed preferences go straight to the parts of the recorder they affect.
+        self.audio_recorder.follow_settings(self.settings_manager)
         self.audio_recorder.update_text.connect(self.update_text)
+        self.audio_recorder.update_partial.connect(self.update_partial)
+        self.audio_recorder.phrase_finished.connect(self.finish_phrase)
+        self.audio_recorder.transcription_failed.connect(lambda message: self.statusBar().showMessage(message, 10000))
+        self.audio_recorder.device_switched.connect(lambda message: self.statusBar().showMessage(message, 5000))
+        self.audio_recorder.load_shed.connect(lambda message: self.statusBar().showMessage(message, 10000))
+        if get('DEFAULT', 'show_latency'):
+            self.audio_recorder.latency_updated.connect(self.statusBar().showMessage)
         self.audio_recorder.started_listening.connect(self.on_recording_started)
         self.audio_recorder.stopped_listening.connect(self.on_recording_stopped)
 
+    def update_load_indicator(self):
+        # How far transcription is behind, so a slow backend doesn't go unnoticed.
+        if not self.audio_recorder or not self.audio_recorder.running:
+            self.load_label.hide()
+            return
+        waiting, in_flight, lag, state = self.audio_recorder.load_status()
+        text = f'Queue {waiting} + {in_flight} in flight, {lag:.1f} s behind'
+        if state != 'ok':
+            text += f' ({state})'
+        behind = state != 'ok' or lag > self.audio_recorder.backlog.max_lag_seconds / 2
+        self.load_label.setStyleSheet('QLabel { color: #C04000; }' if behind else '')
+        self.load_label.setText(text)
+        self.load_label.show()
+
     def on_recording_started(self):
         logging.info('Recording started')
         self.start_button.setText('Stop Listening')
@@ -97,6 +169,8 @@ class MainWindow(QMainWindow):
         logging.info('Recording stopped')
         self.start_button.setText('Start Listening')
         self.start_button.setStyleSheet("QPushButton { background-color: none; }")
+        # Nothing will finish the phrase it is a draft of any more.
+        self.remove_partial_text()
 
     def toggle_recording(self):
         logging.info('Toggling recording')
@@ -107,13 +181,75 @@ class MainWindow(QMainWindow):
                 self.init_audio_recorder()
             self.audio_recorder.start_recording()
 
-    def update_text(self, text):
-        self.text_edit.append(text)
+    def update_text(self, text, source=None, generation=None):
+        # Final text replaces the provisional line of its own source's phrase, any other one moves below it.
+        partial = self.showing_partial
+        self.remove_partial_text()
+        self.transcript.append(text)
+        self.text_edit.appendPlainText(text)
+        if source is not None:
+            self.final_generation[source] = max(generation, self.final_generation.get(source, 0))
+        if partial and not self.partial_replaced_by(partial, source, generation):
+            self.update_partial(*partial)
+
+    def update_partial(self, text, source=None, generation=0):
+        # Provisional text of the phrase still being spoken, shown as a replaceable last line. A late one
+        # of a phrase whose final text is already in is dropped.
+        if source is not None and generation < self.final_generation.get(source, 0):
+            return
+        self.remove_partial_text()
+        self.text_edit.appendHtml(f'<i style="color: gray">{html.escape(text)}</i>')
+        self.showing_partial = (text, source, generation)
+
+    def finish_phrase(self, source, generation):
+        # A phrase that ended without new text takes its partial with it.
+        self.final_generation[source] = max(generation, self.final_generation.get(source, 0))
+        if self.showing_partial and self.partial_replaced_by(self.showing_partial, source, generation):
+            self.remove_partial_text()
+
+    def partial_replaced_by(self, partial, source, generation):
+        _, partial_source, partial_generation = partial
+        return source is not None and partial_source == source and partial_generation < generation
+
+    def clear_text(self):
+        self.text_edit.clear()
+        self.transcript.clear()
+        self.showing_partial = None
+
+    def save_transcript(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Save Transcript', 'transcript.txt', 'Text files (*.txt);;All files (*)')
+        if path:
+            self.transcript.export(path)
+            self.statusBar().showMessage(f'Saved {len(self.transcript)} segments to {path}', 5000)
+
+    def remove_partial_text(self):
+        if self.showing_partial:
+            cursor = self.text_edit.textCursor()
+            cursor.movePosition(QTextCursor.End)
+            cursor.select(QTextCursor.BlockUnderCursor)
+            cursor.removeSelectedText()
+            self.showing_partial = None
+
+    def transcribe_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Transcribe File', '', 'Audio files (*.wav *.flac);;All files (*)')
+        if not path:
+            return
+        logging.info(f'Transcribing file {path}')
+        from batch_transcribe import BatchTranscriptionThread
+        self.batch_thread = BatchTranscriptionThread(path, self.settings_manager, self)
+        self.batch_thread.progress.connect(lambda done, total: self.statusBar().showMessage(f'Transcribing {path}: {done}/{total} chunks'))
+        self.batch_thread.finished_transcript.connect(self.update_text)
+        self.batch_thread.finished_transcript.connect(lambda _: self.statusBar().showMessage(f'Transcribed {path}', 5000))
+        self.batch_thread.failed.connect(self.statusBar().showMessage)
+        self.batch_thread.start()
 
     def closeEvent(self, event):
         logging.info('Closing MainWindow')
         if self.audio_recorder:
             self.audio_recorder.stop_recording()
+            self.audio_recorder.shutdown()
+        self.transcript.close()
+        self.settings_manager.flush()
         super().closeEvent(event)
 
     def force_transcribe(self):
@@ -137,23 +273,54 @@ class MainWindow(QMainWindow):
         file_menu = top_bar.addMenu('File')
         main_layout.setMenuBar(top_bar)
 
+        # Every segment goes to the transcript store, the text edit only keeps the last transcript_view_lines
+        # lines so memory stays flat however long the session gets. An append isn't any cheaper for it, Qt
+        # trims a block each time once the view is full.
+        self.transcript = TranscriptStore(
+            self.settings_manager.get_setting('DEFAULT', 'transcript_log') or None,
+            memory_segments=self.settings_manager.get_setting('DEFAULT', 'transcript_memory_segments'),
+        )
+
         # Text edit area for displaying transcriptions
-        self.text_edit = QTextEdit(self)
+        self.text_edit = QPlainTextEdit(self)
         self.text_edit.setReadOnly(True)  # Make the text_edit read-only
-        font = QFont("Arial", self.settings_manager.get_setting('DEFAULT', 'font_size', fallback='default', value_type=int))
+        self.text_edit.setMaximumBlockCount(self.settings_manager.get_setting('DEFAULT', 'transcript_view_lines'))
+        font = QFont("Arial", self.settings_manager.get_setting('DEFAULT', 'font_size'))
         self.text_edit.setFont(font)
+        self.settings_manager.subscribe(['font_size'], self.apply_font_size)
         upper_layout.addWidget(self.text_edit, 1)  # Set stretch factor to 1
 
         # Clear Text edit action on top bar.
         clear_action = QAction('Clear Text', self)
-        clear_action.triggered.connect(self.text_edit.clear)
+        clear_action.triggered.connect(self.clear_text)
+        # (text, source, generation) of the provisional last line, None while there is none.
+        self.showing_partial = None
+        self.final_generation = {}
         file_menu.addAction(clear_action)
 
+        # Transcribe a recording from disk instead of the microphone.
+        transcribe_file_action = QAction('Transcribe File...', self)
+        transcribe_file_action.triggered.connect(self.transcribe_file)
+        file_menu.addAction(transcribe_file_action)
+
+        # Save the whole session, including what scrolled out of the view.
+        save_transcript_action = QAction('Save Transcript...', self)
+        save_transcript_action.triggered.connect(self.save_transcript)
+        file_menu.addAction(save_transcript_action)
+
         # Preferences dialog button on top bar.
         settings_action = QAction('Preferences', self)
         settings_action.triggered.connect(self.open_preferences)
         file_menu.addAction(settings_action)
         
+        # Queue depth and lag behind real time while recording.
+        self.load_label = QLabel(self)
+        self.load_label.hide()
+        self.statusBar().addPermanentWidget(self.load_label)
+        self.load_timer = QTimer(self)
+        self.load_timer.timeout.connect(self.update_load_indicator)
+        self.load_timer.start(500)
+
         # Buttons layout for recording controls
         buttons_layout = QVBoxLayout()  # Changed to QVBoxLayout for stacking
 
@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import collections
+import json
+import logging
+import logging.handlers
+import threading
+import time
+
+
+class SegmentTimings:
+    """
+    Timeline of one segment, from the moment the listener closed the phrase to the moment its text was
+    emitted. Stages measured elsewhere (encode, network) are added with stage().
+    """
+    def __init__(self, captured_at=None, vad_seconds=0.0, audio_seconds=0.0):
+        self.captured_at = captured_at or time.monotonic()
+        self.audio_seconds = audio_seconds
+        self.marks = {}
+        # Trailing non-speech audio the VAD had to hear before deciding the phrase was over.
+        self.durations = {"vad_decision": vad_seconds}
+        # Seconds of silence compaction cut out of the upload, None if it didn't run.
+        self.silence_removed = None
+        # cache_id of the backend whose transcript the segment got, set once it has been sent.
+        self.backend = None
+
+    def mark(self, name):
+        self.marks[name] = time.monotonic()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.monotonic() - start
+
+    def as_record(self):
+        record = dict(self.durations)
+        if "job_start" in self.marks:
+            record["queue_wait"] = self.marks["job_start"] - self.captured_at
+        if "emitted" in self.marks:
+            record["total_to_screen"] = self.marks["emitted"] - self.captured_at
+        return record
+
+
+class LatencyHistogram:
+    """
+    Cumulative buckets for export plus a window of the most recent values for percentiles.
+    """
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, float("inf"))
+
+    def __init__(self, window=1000):
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.recent = collections.deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, p):
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    def summary(self):
+        return {"count": self.count, "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99)}
+
+
+class SegmentMetrics:
+    """
+    Collects SegmentTimings into a histogram per stage, writes every segment as a JSON line to a rotating
+    file and can serve the histograms Prometheus style on a local port.
+    """
+    def __init__(self, jsonl_path="metrics.jsonl", max_bytes=5_000_000, backup_count=3, prometheus_port=None):
+        self.lock = threading.Lock()
+        self.histograms = collections.defaultdict(LatencyHistogram)
+        self.gauges = {}
+        self.file_logger = None
+        if jsonl_path:
+            self.file_logger = logging.getLogger("whisperInt.metrics")
+            self.file_logger.propagate = False  # keep them out of app.log
+            self.file_logger.setLevel(logging.INFO)
+            if not self.file_logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(jsonl_path, maxBytes=max_bytes, backupCount=backup_count)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self.file_logger.addHandler(handler)
+        self.server = None
+        if prometheus_port:
+            self.serve_prometheus(prometheus_port)
+
+    def record(self, timings, **fields):
+        stages = timings.as_record()
+        with self.lock:
+            for name, value in stages.items():
+                self.histograms[name].observe(value)
+        if self.file_logger:
+            self.file_logger.info(json.dumps({"time": time.time(), "audio_seconds": timings.audio_seconds, **fields, **stages}))
+
+    def observe(self, name, value):
+        # For metrics that aren't part of a segment's timeline.
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def set_gauge(self, name, value):
+        # Current values, like the queue depth, exported as they are instead of as a histogram.
+        with self.lock:
+            self.gauges[name] = value
+
+    def summary(self, name=None):
+        with self.lock:
+            if name is not None:
+                return self.histograms[name].summary() if name in self.histograms else None
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"whisperint_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.BUCKETS, histogram.counts):
+                    cumulative += count
+                    label = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{le="{label}"}} {cumulative}')
+                lines.append(f"{metric}_sum {histogram.total}")
+                lines.append(f"{metric}_count {histogram.count}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE whisperint_{name} gauge")
+                lines.append(f"whisperint_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Serving latency metrics on http://{host}:{port}/metrics")
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,63 @@
+import threading
+
+
+class PCMRingBuffer:
+    """
+    Preallocated, fixed capacity buffer for captured PCM shared by the listener and the recorder thread.
+
+    Positions are absolute byte counts since the buffer was created, so a span (start, end) stays
+    meaningful while the buffer wraps around. The storage is mirrored (every byte is written at offset
+    and offset + capacity) so any span up to capacity bytes long is contiguous and can be handed out as a
+    memoryview without copying. A view is only valid until the writer laps it, check with is_available.
+    """
+    def __init__(self, capacity, sample_width=2):
+        # Keep whole samples at the wrap point.
+        self.capacity = capacity - capacity % sample_width
+        self.sample_width = sample_width
+        self._data = bytearray(self.capacity * 2)
+        self._view = memoryview(self._data)
+        self._lock = threading.Lock()
+        self.write_position = 0
+
+    @classmethod
+    def for_duration(cls, seconds, sample_rate, sample_width):
+        return cls(int(seconds * sample_rate) * sample_width, sample_width)
+
+    @property
+    def oldest_position(self):
+        return max(0, self.write_position - self.capacity)
+
+    def write(self, data):
+        """
+        Appends data and returns its (start, end) span. Of data longer than the capacity only the newest
+        capacity bytes are kept, and the span is theirs.
+        """
+        data = memoryview(data).cast('B')
+        with self._lock:
+            if len(data) > self.capacity:
+                self.write_position += len(data) - self.capacity
+                data = data[-self.capacity:]
+            start = self.write_position
+            offset = self.write_position % self.capacity
+            first = min(len(data), self.capacity - offset)
+            self._view[offset:offset + first] = data[:first]
+            self._view[offset + self.capacity:offset + self.capacity + first] = data[:first]
+            rest = len(data) - first
+            if rest:
+                self._view[0:rest] = data[first:]
+                self._view[self.capacity:self.capacity + rest] = data[first:]
+            self.write_position += len(data)
+            return start, self.write_position
+
+    def is_available(self, start):
+        return start >= self.oldest_position
+
+    def view(self, start, end):
+        """
+        Returns a zero copy memoryview over the span [start, end).
+        """
+        with self._lock:
+            if not (self.oldest_position <= start <= end <= self.write_position):
+                raise ValueError(f"Span ({start}, {end}) is not available in the ring buffer (oldest {self.oldest_position}, newest {self.write_position})")
+            offset = start % self.capacity
+            return self._view[offset:offset + end - start]
@@ -1,15 +1,15 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QComboBox, QSpinBox
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QComboBox, QSpinBox, QCheckBox
 
-import speech_recognition as sr
-import sounddevice as sd
+from audio_devices import DeviceList
+from audio_encoders import ENCODERS
+from transcription_backends import available_backends
 
 class PreferencesDialog(QDialog):
-    preferencesUpdated = pyqtSignal()
-
-    def __init__(self, settings_manager, parent=None):
+    def __init__(self, settings_manager, parent=None, device_list=None):
         super().__init__(parent)
         self.settings_manager = settings_manager
+        # Device names come from the list the main window keeps, refreshed in the background while this is open.
+        self.device_list = device_list or DeviceList(self)
         self.initUI()
         self.setWindowTitle('Preferences')  # Set window title to 'Preferences'
         self.resize(self.width() * 6, self.height())  # Make the window twice as wide
@@ -22,7 +22,7 @@ class PreferencesDialog(QDialog):
         api_key_label = QLabel('OpenAI Whisper API Key:', self)
         self.api_key_input = QLineEdit(self)
         self.api_key_input.setEchoMode(QLineEdit.Password)  # Set the echo mode to password to hide the API key
-        self.api_key_input.setText(self.settings_manager.get_setting('DEFAULT', 'openai_api_key', fallback=''))
+        self.api_key_input.setText(self.settings_manager.get_setting('DEFAULT', 'openai_api_key'))
         self.show_api_key_button = QPushButton('Show', self)  # Button to toggle visibility of the API key
         self.show_api_key_button.setCheckable(True)
         self.show_api_key_button.toggled.connect(self.toggle_api_key_visibility)
@@ -36,7 +36,7 @@ class PreferencesDialog(QDialog):
         whisperInt_api_key_label = QLabel('WhisperInt API Key:', self)
         self.whisperInt_api_key_input = QLineEdit(self)
         self.whisperInt_api_key_input.setEchoMode(QLineEdit.Password)  # Set the echo mode to password to hide the API key
-        self.whisperInt_api_key_input.setText(self.settings_manager.get_setting('DEFAULT', 'whisperInt_auth_header', fallback=''))
+        self.whisperInt_api_key_input.setText(self.settings_manager.get_setting('DEFAULT', 'whisperInt_auth_header'))
         self.show_whisperInt_api_key_button = QPushButton('Show', self)  # Button to toggle visibility of the API key
         self.show_whisperInt_api_key_button.setCheckable(True)
         self.show_whisperInt_api_key_button.toggled.connect(lambda checked: self.whisperInt_api_key_input.setEchoMode(QLineEdit.Normal if checked else QLineEdit.Password))
@@ -49,11 +49,10 @@ class PreferencesDialog(QDialog):
         device_name_layout = QHBoxLayout()
         device_name_label = QLabel('Device Name:', self)
         self.device_name_input = QComboBox(self)
-        device_names = sr.Microphone.list_microphone_names()
-        self.device_name_input.addItems(device_names)
-        device_name_setting = self.settings_manager.get_setting('DEFAULT', 'device_name', fallback='')
-        current_device_index = device_names.index(device_name_setting) if device_name_setting in device_names else self.settings_manager.get_setting('DEFAULT', 'device_index', fallback=0, value_type=int)
-        self.device_name_input.setCurrentIndex(current_device_index)
+        self.devices_loaded = False
+        self.set_device_names(self.device_list.names)
+        self.device_list.updated.connect(self.set_device_names)
+        self.device_list.refresh()
         device_name_layout.addWidget(device_name_label)
         device_name_layout.addWidget(self.device_name_input)
         layout.addLayout(device_name_layout)
@@ -62,44 +61,93 @@ class PreferencesDialog(QDialog):
         transcription_service_layout = QHBoxLayout()
         transcription_service_label = QLabel('Transcription Service:', self)
         self.transcription_service_dropdown = QComboBox(self)
-        transcription_services = ['whisper', 'whisperInt']
+        transcription_services = available_backends()
         self.transcription_service_dropdown.addItems(transcription_services)
-        self.transcription_service_dropdown.setCurrentText(self.settings_manager.get_setting('DEFAULT', 'transcription_service', fallback='none'))
+        self.transcription_service_dropdown.setCurrentText(self.settings_manager.get_setting('DEFAULT', 'transcription_service'))
         transcription_service_layout.addWidget(transcription_service_label)
         transcription_service_layout.addWidget(self.transcription_service_dropdown)
         layout.addLayout(transcription_service_layout)
 
+        # Upload Format
+        upload_format_layout = QHBoxLayout()
+        upload_format_label = QLabel('Upload Format:', self)
+        self.upload_format_dropdown = QComboBox(self)
+        self.upload_format_dropdown.addItems(list(ENCODERS))
+        self.upload_format_dropdown.setCurrentText(self.settings_manager.get_setting('DEFAULT', 'upload_format'))
+        opus_bitrate_label = QLabel('Opus Bitrate (kbps):', self)
+        self.opus_bitrate_spinbox = QSpinBox(self)
+        self.opus_bitrate_spinbox.setRange(6, 256)
+        self.opus_bitrate_spinbox.setValue(self.settings_manager.get_setting('DEFAULT', 'opus_bitrate'))
+        upload_format_layout.addWidget(upload_format_label)
+        upload_format_layout.addWidget(self.upload_format_dropdown)
+        upload_format_layout.addWidget(opus_bitrate_label)
+        upload_format_layout.addWidget(self.opus_bitrate_spinbox)
+        layout.addLayout(upload_format_layout)
+
+        # Streaming partial results
+        partials_layout = QHBoxLayout()
+        self.streaming_partials_checkbox = QCheckBox('Show partial results while speaking', self)
+        self.streaming_partials_checkbox.setChecked(self.settings_manager.get_setting('DEFAULT', 'streaming_partials'))
+        partial_interval_label = QLabel('Every (ms):', self)
+        self.partial_interval_spinbox = QSpinBox(self)
+        self.partial_interval_spinbox.setRange(200, 5000)
+        self.partial_interval_spinbox.setSingleStep(100)
+        self.partial_interval_spinbox.setValue(self.settings_manager.get_setting('DEFAULT', 'partial_interval_ms'))
+        partials_layout.addWidget(self.streaming_partials_checkbox)
+        partials_layout.addWidget(partial_interval_label)
+        partials_layout.addWidget(self.partial_interval_spinbox)
+        layout.addLayout(partials_layout)
+
         # Font Size
         font_size_layout = QHBoxLayout()
         font_size_label = QLabel('Font Size:', self)
         self.font_size_spinbox = QSpinBox(self)
         self.font_size_spinbox.setRange(8, 32)  # Assuming a reasonable range for font sizes
-        self.font_size_spinbox.setValue(self.settings_manager.get_setting('DEFAULT', 'font_size', fallback=16, value_type=int))
+        self.font_size_spinbox.setValue(self.settings_manager.get_setting('DEFAULT', 'font_size'))
         font_size_layout.addWidget(font_size_label)
         font_size_layout.addWidget(self.font_size_spinbox)
         layout.addLayout(font_size_layout)
 
-        # Restart App Label
-        restart_app_label = QLabel('You might need to either stop and restart listening or close and re-open the app for some setup preferences changes to apply.', self)
-        layout.addWidget(restart_app_label)
-
         # Save Button
         save_button = QPushButton('Save', self)
         save_button.clicked.connect(self.save_preferences)
         layout.addWidget(save_button)
 
     def save_preferences(self):
-        # Update settings with the new values from the input fields
-        self.settings_manager.set_setting('DEFAULT', 'openai_api_key', self.api_key_input.text())
-        self.settings_manager.set_setting('DEFAULT', 'whisperInt_auth_header', self.whisperInt_api_key_input.text())
-        self.settings_manager.set_setting('DEFAULT', 'device_name', self.device_name_input.currentText())
-        self.settings_manager.set_setting('DEFAULT', 'device_index', self.device_name_input.currentIndex())
-        self.settings_manager.set_setting('DEFAULT', 'transcription_service', self.transcription_service_dropdown.currentText())
-        self.settings_manager.set_setting('DEFAULT', 'font_size', self.font_size_spinbox.value())
-        self.settings_manager.save_config()
+        # Update settings with the new values from the input fields, all at once so they are written to disk
+        # once and whoever follows them hears about them together.
+        values = {
+            'openai_api_key': self.api_key_input.text(),
+            'whisperInt_auth_header': self.whisperInt_api_key_input.text(),
+            'transcription_service': self.transcription_service_dropdown.currentText(),
+            'font_size': self.font_size_spinbox.value(),
+            'upload_format': self.upload_format_dropdown.currentText(),
+            'opus_bitrate': self.opus_bitrate_spinbox.value(),
+            'streaming_partials': self.streaming_partials_checkbox.isChecked(),
+            'partial_interval_ms': self.partial_interval_spinbox.value(),
+        }
+        if self.devices_loaded:
+            values['device_name'] = self.device_name_input.currentText()
+            values['device_index'] = self.device_name_input.currentIndex()
+        self.settings_manager.update('DEFAULT', values)
         self.accept()
-        
-        self.preferencesUpdated.emit()
+
+    def set_device_names(self, device_names):
+        if device_names is None:
+            self.device_name_input.addItem('Looking for devices...')
+            self.device_name_input.setEnabled(False)
+            return
+        # Keep what was picked in the dialog so far, the saved device otherwise.
+        if self.devices_loaded:
+            device_name_setting = self.device_name_input.currentText()
+        else:
+            device_name_setting = self.settings_manager.get_setting('DEFAULT', 'device_name')
+        current_device_index = device_names.index(device_name_setting) if device_name_setting in device_names else self.settings_manager.get_setting('DEFAULT', 'device_index')
+        self.device_name_input.clear()
+        self.device_name_input.addItems(device_names)
+        self.device_name_input.setCurrentIndex(current_device_index)
+        self.device_name_input.setEnabled(True)
+        self.devices_loaded = True
 
     def toggle_api_key_visibility(self, checked):
         if checked:
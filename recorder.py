@@ -1,190 +1,761 @@
 # Standard library imports
 from datetime import datetime, timedelta
-from queue import Queue
-from tempfile import NamedTemporaryFile
+from queue import Empty, Queue
+from concurrent.futures import ThreadPoolExecutor
 
 import time
 import threading
-import io
-import requests
 import logging
 
 # Third-party imports
 from PyQt5.QtCore import QThread, pyqtSignal
 import speech_recognition as sr
 
-from openai import OpenAI
-
-import custom_recorder
+from capture_sources import CaptureSource, SourceSpec, SwitchableSource, open_audio_sources
+from segmenter import ChangePointSegmenter
+from compaction import SilenceCompactor
+from transcription_pool import OrderedTranscriptionPool
+from audio_encoders import create_encoder
+from transcription_backends import SegmentMeta, TranscriptionError, create_backend, WHISPERINT_URL
+from request_policy import RequestPolicy
+from backlog import PendingSegment, SegmentBacklog
+from journal import SessionJournal
+from transcription_cache import TranscriptionCache, audio_key
+from metrics import SegmentMetrics, SegmentTimings
 
 
 class AudioRecorder(QThread):
-    update_text = pyqtSignal(str)
+    # Text, source label and phrase generation: a final replaces the partials of its source's phrases
+    # before that generation.
+    update_text = pyqtSignal(str, str, int)
+    update_partial = pyqtSignal(str, str, int)
+    # Source label and generation of every phrase that is done with, text or not, so its partial goes too.
+    phrase_finished = pyqtSignal(str, int)
+    latency_updated = pyqtSignal(str)
+    transcription_failed = pyqtSignal(str)
     started_listening = pyqtSignal()
     stopped_listening = pyqtSignal()
     force_transcribe_signal = pyqtSignal()
+    device_switched = pyqtSignal(str)
+    load_shed = pyqtSignal(str)
 
-    def __init__(self, energy_threshold, record_timeout, phrase_timeout, device_index, whisperInt_auth_header, openai_api_key, transcription_service="whisperInt"):
+    def __init__(self, energy_threshold, record_timeout, phrase_timeout, device_index, whisperInt_auth_header, openai_api_key, transcription_service="whisperInt", overlap_seconds=1.0, transcription_workers=3, request_timeout=15, http_pool_size=None, http2=False, warm_up_connection=True, whisperInt_url=WHISPERINT_URL, upload_format="wav", opus_bitrate=24, local_model="base", streaming_partials=False, partial_interval_ms=500, partial_window_seconds=8, metrics_file="metrics.jsonl", metrics_port=0, cache_entries=256, cache_disk_path=None, cache_disk_mb=50, request_retries=2, hedge_service=None, journal_dir=None, journal_audio=False, journal_audio_format="flac", sources=None, segment_on_changes=True, segment_min_seconds=3.0, segment_max_seconds=10.0, speaker_change_threshold=0.3, valley_db=12.0, native_rate_capture=True, backlog_policy="coalesce", max_backlog_segments=6, max_lag_seconds=20.0, downgrade_service="local", compact_silence=True, keep_silence_seconds=0.2, max_pause_seconds=0.5, min_speech_seconds=0.3):
         super().__init__()
         self.energy_threshold = energy_threshold
         self.record_timeout = record_timeout
         self.phrase_timeout = phrase_timeout
         self.device_index = device_index
         self.MIN_DURATION = 2
+        # Leading, trailing and long inner silences are cut out of what is uploaded (see SilenceCompactor),
+        # and an utterance shorter than MIN_DURATION still goes out once it's over if it has min_speech_seconds of speech.
+        self.compactor = SilenceCompactor(keep_seconds=keep_silence_seconds, max_pause_seconds=max_pause_seconds)
+        self.compact_silence = compact_silence
+        self.min_speech_seconds = min_speech_seconds
+        self.silence_removed = 0.0
         self.running = False
-        self.temp_file = NamedTemporaryFile(suffix=".wav").name
         self.data_queue = Queue()
-        self.background_listening = None
+        # source_factory(capture_source) builds the AudioSource to listen to instead of the configured
+        # devices, e.g. a file for offline benchmarks.
+        self.source_factory = None
+        # Devices are opened at their own rate and channel count and converted to 16 kHz mono by the
+        # capture stage, instead of asking PortAudio for 16 kHz.
+        self.native_rate_capture = native_rate_capture
         self.whisperInt_auth_header = whisperInt_auth_header
         self.openai_api_key = openai_api_key
         self.transcription_service = transcription_service
+        # Seconds of already committed audio re-sent in front of new audio so words cut at the boundary are recovered.
+        self.overlap_seconds = overlap_seconds
+        self.request_timeout = request_timeout
+        # Transcription runs here instead of on this thread, results come back in order through on_transcription_result.
+        # No more segments than workers, the rest wait in the backlog where they can still be coalesced or dropped.
+        self.transcription_pool = OrderedTranscriptionPool(self.on_transcription_result, max_workers=transcription_workers, max_pending=transcription_workers)
+        # Everything any backend might need, each one takes what it uses.
+        self.backend_options = dict(
+            whisperInt_url=whisperInt_url,
+            request_timeout=request_timeout,
+            # One keep-alive connection per worker by default, so no segment has to open a new one.
+            http_pool_size=http_pool_size or transcription_workers,
+            http2=http2,
+            local_model=local_model,
+            transcription_workers=transcription_workers,
+        )
+        self.backend = self.create_transcription_backend()
+        # Held while a backend is picked and acquired, so set_transcription_backend can't retire it in between.
+        self.backend_lock = threading.Lock()
+        # Timeouts from observed latency, retries, and hedging to a second backend when the first is slow.
+        self.request_policy = RequestPolicy(
+            default_timeout=request_timeout,
+            retries=request_retries,
+            hedge_backend=self.create_transcription_backend(hedge_service) if hedge_service else None,
+            max_workers=2 * transcription_workers + 2,
+        )
+        self.warm_up_connection = warm_up_connection
+        # Segments wait here for a worker instead of blocking dispatch, see SegmentBacklog for what happens
+        # when the backend falls behind. load_state is "ok", "downgraded" or "paused".
+        self.backlog = SegmentBacklog(max_backlog_segments, backlog_policy, max_lag_seconds)
+        self.downgrade_service = downgrade_service
+        self.downgraded_backend = None
+        self.load_state = "ok"
+        self.in_flight_captured = {}  # sequence: capture time of the segment's oldest audio
+        self.shed_seconds = 0.0
+        # Provisional transcriptions of the phrase in progress, one at a time on their own worker so they
+        # never hold up final segments. Only the newest window waits while one is running.
+        self.streaming_partials = streaming_partials
+        self.partial_interval = partial_interval_ms / 1000
+        self.partial_window_seconds = partial_window_seconds
+        # Per segment stage timings, exported to metrics_file and optionally on http://127.0.0.1:metrics_port/metrics
+        self.metrics = SegmentMetrics(metrics_file, prometheus_port=metrics_port or None)
+        # Transcripts of audio that was already sent, so resubmitting the same PCM doesn't pay for it again.
+        self.cache = TranscriptionCache(cache_entries, disk_path=cache_disk_path or None, disk_max_bytes=cache_disk_mb * 1_000_000) if cache_entries else None
+        # Every segment, failed and empty ones too, and its audio if journal_audio, is journaled to disk off the capture thread.
+        self.journal = SessionJournal(journal_dir, store_audio=journal_audio, audio_format=journal_audio_format) if journal_dir else None
+        self.partial_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="partial")
+        self.partial_lock = threading.Lock()
+        self.partial_busy = False
+        self.pending_partial = None
+        # Turns segment PCM into what gets uploaded, WAV, FLAC or Opus.
+        self.upload_format = upload_format
+        self.opus_bitrate = opus_bitrate
+        self.encoder = create_encoder(upload_format, bitrate=opus_bitrate)
 
-        self.recorder = custom_recorder.CustomBackgroundRecorder()
-        self.recorder.energy_threshold = self.energy_threshold
-        self.recorder.dynamic_energy_threshold = False
-
-        self.client = OpenAI(
-            api_key=self.openai_api_key,
+        # One CaptureSource per device or channel (sources is a list of SourceSpec or the sources setting,
+        # the device_index microphone by default). Each one's listener writes to its own ring buffer and
+        # runs its own VAD, they all share the transcription pool so the backend load stays bounded.
+        # A ring has to hold at least a full phrase plus the overlap window.
+        specs = sources if isinstance(sources, list) else SourceSpec.parse_list(sources, device_index)
+        self.sources = [CaptureSource(spec, max(120, 3 * self.record_timeout), self.energy_threshold) for spec in specs]
+        # Continuous talk is cut at speaker changes and pauses between words instead of going out in
+        # record_timeout long segments, so segments stay short and spread over the workers.
+        self.segment_options = dict(
+            segment_on_changes=segment_on_changes, min_segment_seconds=segment_min_seconds,
+            max_segment_seconds=segment_max_seconds, valley_db=valley_db, change_threshold=speaker_change_threshold,
         )
-        
+        self.set_segmenters()
+        self.source = None
+        self.settings_subscription = None
+        # Changes made while recording wait here for the recorder thread, see queue_settings.
+        self.settings_lock = threading.Lock()
+        self.pending_settings = {}
+        self.settings_on_thread = False
+
         self.force_transcribe_signal.connect(self.force_transcribe)
+
+    @property
+    def recorder(self):
+        # The listener of the first, usually only, source.
+        return self.sources[0].recorder
+
+    @property
+    def ring_buffer(self):
+        return self.sources[0].ring_buffer
         
     def force_transcribe(self):
         # Set the force_callback flag to True to ensure the next audio sample is processed
-        self.recorder.force_stop = True
+        for source in self.sources:
+            source.recorder.force_stop = True
 
 
     def start_listening(self):
-        # Find the index of the microphone by name (since device names tend to change less)
-        self.source = sr.Microphone(sample_rate=16000, device_index=self.device_index)
+        if self.source_factory is not None:
+            audio_sources = [self.source_factory(source) for source in self.sources]
+        else:
+            audio_sources = open_audio_sources([source.spec for source in self.sources], native_rate=self.native_rate_capture)
 
-        with self.source as mic:
-            self.recorder.adjust_for_ambient_noise(mic)
+        for source, audio_source in zip(self.sources, audio_sources):
+            # Switchable so set_device can move the listener to another device without stopping it.
+            source.audio_source = SwitchableSource(audio_source, on_switch=lambda gap_ms, source=source: self.on_device_switched(source, gap_ms))
+            with audio_source as mic:
+                source.recorder.adjust_for_ambient_noise(mic)
+        # Every source is captured at the same rate and width, this one stands for all of them.
+        self.source = self.sources[0].audio_source
 
-        if self.background_listening is None:
-            self.background_listening = self.recorder.listen_in_background(
-                self.source, self.record_callback, phrase_time_limit=self.record_timeout
-            )
+        self.set_streaming_partials(self.streaming_partials, self.partial_interval * 1000)
+        self.start_listeners()
+
+    def start_listeners(self):
+        for source in self.sources:
+            if source.background_listening is None:
+                source.background_listening = source.recorder.listen_in_background(
+                    source.audio_source, self.record_callback, phrase_time_limit=self.record_timeout
+                )
 
     def stop_listening(self):
-        if self.background_listening is not None:
-            self.background_listening(wait_for_stop=False)
-            self.background_listening = None
-
-    def transcribe_with_whisper(self, audio_file, duration):
-        transcript = None
-        start_time = datetime.now()
-        def transcription_thread():
-            nonlocal transcript
+        for source in self.sources:
+            if source.background_listening is not None:
+                source.background_listening(wait_for_stop=False)
+                source.background_listening = None
+
+    def set_segmenters(self):
+        # A listener picks up its new segmenter with the next chunk, the phrase in progress is measured from there.
+        options = dict(self.segment_options)
+        enabled = options.pop('segment_on_changes')
+        for source in self.sources:
+            source.recorder.segmenter = ChangePointSegmenter(**options) if enabled else None
+        # Coalesced segments don't get any longer than the segmenter would have let a phrase get (16 kHz 16 bit).
+        longest = options['max_segment_seconds'] if enabled else self.record_timeout
+        self.backlog.max_coalesced_bytes = int(longest * 16000) * 2
+
+    def set_device(self, device_index):
+        """
+        Moves the default microphone source to another device. A running listener keeps going: the new device
+        is opened first and swapped in between two reads (see SwitchableSource), so the phrase being spoken
+        and the segments already queued aren't lost. device_switched reports the gap in the captured audio.
+        """
+        self.device_index = device_index
+        source = self.sources[0]
+        if len(self.sources) > 1 or source.spec.channel is not None:
+            logging.info(f"Not switching to device {device_index}, the sources setting decides the devices")
+            return
+        previous, source.spec.device_index = source.spec.device_index, device_index
+        if previous == device_index or source.background_listening is None:
+            return  # otherwise opened the next time listening starts
+        try:
+            if self.source_factory is not None:
+                audio_source = self.source_factory(source)
+            else:
+                audio_source = open_audio_sources([source.spec], native_rate=self.native_rate_capture)[0]
+            source.audio_source.switch_to(audio_source)
+        except (OSError, ValueError) as e:
+            source.spec.device_index = previous
+            logging.error(f"Couldn't switch {source.label} to device {device_index}: {e}")
+            self.device_switched.emit(f"Couldn't switch to device {device_index}: {e}")
+
+    def on_device_switched(self, source, gap_ms):
+        # Called on the listener thread right after the swap.
+        gap = f"{gap_ms:.1f} ms" if gap_ms is not None else "unknown"
+        logging.info(f"Switched {source.label} to device {source.spec.device_index}, capture gap {gap}")
+        self.device_switched.emit(f"Switched to device {source.spec.device_index} (capture gap {gap})")
+
+    def follow_settings(self, settings_manager):
+        """
+        Applies changes to the settings from now on, see apply_settings.
+        """
+        self.settings_subscription = settings_manager.subscribe(None, self.queue_settings)
+        self.settings_manager = settings_manager
+
+    def queue_settings(self, changes):
+        # Called on the thread that changed them, usually the GUI thread. While recording they are applied
+        # on the recorder thread, switching devices opens PortAudio streams and shouldn't freeze the window.
+        with self.settings_lock:
+            if self.settings_on_thread:
+                self.pending_settings.update(changes)
+                self.data_queue.put(None)  # wakes dispatch_segments
+                return
+        self.apply_settings(changes)
+
+    def apply_pending_settings(self):
+        with self.settings_lock:
+            changes, self.pending_settings = self.pending_settings, {}
+        if changes:
+            self.apply_settings(changes)
+
+    def apply_settings(self, changes):
+        """
+        Applies changed settings ({option: value}) to just the parts they affect, without rebuilding the
+        recorder or stopping it. Whatever isn't handled here takes effect the next time the app starts.
+        """
+        applied = set()
+        if changes.keys() & {'openai_api_key', 'whisperInt_auth_header', 'transcription_service'}:
+            self.openai_api_key = changes.get('openai_api_key', self.openai_api_key)
+            self.whisperInt_auth_header = changes.get('whisperInt_auth_header', self.whisperInt_auth_header)
+            self.transcription_service = changes.get('transcription_service', self.transcription_service)
+            self.set_transcription_backend(self.create_transcription_backend())
+            applied |= {'openai_api_key', 'whisperInt_auth_header', 'transcription_service'}
+        if 'energy_threshold' in changes:
+            # Read by the listeners for every chunk.
+            self.energy_threshold = changes['energy_threshold']
+            for source in self.sources:
+                source.recorder.energy_threshold = self.energy_threshold
+            applied.add('energy_threshold')
+        if 'device_index' in changes:
+            self.set_device(changes['device_index'])
+            applied.add('device_index')
+        if changes.keys() & {'streaming_partials', 'partial_interval_ms'}:
+            self.set_streaming_partials(
+                changes.get('streaming_partials', self.streaming_partials),
+                changes.get('partial_interval_ms', self.partial_interval * 1000),
+            )
+            applied |= {'streaming_partials', 'partial_interval_ms'}
+        if changes.keys() & {'upload_format', 'opus_bitrate'}:
+            self.upload_format = changes.get('upload_format', self.upload_format)
+            self.opus_bitrate = changes.get('opus_bitrate', self.opus_bitrate)
+            self.encoder = create_encoder(self.upload_format, bitrate=self.opus_bitrate)
+            applied |= {'upload_format', 'opus_bitrate'}
+        segment_settings = {'segment_on_changes': 'segment_on_changes', 'segment_min_seconds': 'min_segment_seconds',
+                            'segment_max_seconds': 'max_segment_seconds', 'valley_db': 'valley_db',
+                            'speaker_change_threshold': 'change_threshold'}
+        if changes.keys() & segment_settings.keys():
+            for option, name in segment_settings.items():
+                self.segment_options[name] = changes.get(option, self.segment_options[name])
+            self.set_segmenters()
+            applied |= segment_settings.keys()
+        if 'keep_silence_seconds' in changes:
+            self.compactor.keep_seconds = changes['keep_silence_seconds']
+        if 'max_pause_seconds' in changes:
+            self.compactor.max_pause_seconds = changes['max_pause_seconds']
+        applied |= {'keep_silence_seconds', 'max_pause_seconds'}
+        for option in ('overlap_seconds', 'phrase_timeout', 'compact_silence', 'min_speech_seconds'):
+            if option in changes:
+                setattr(self, option, changes[option])
+                applied.add(option)
+        if 'request_retries' in changes:
+            self.request_policy.retries = changes['request_retries']
+            applied.add('request_retries')
+        if changes.keys() & applied:
+            logging.info(f"Applied {', '.join(sorted(changes.keys() & applied))} to the running recorder")
+
+    def create_transcription_backend(self, service=None):
+        return create_backend(
+            service or self.transcription_service,
+            openai_api_key=self.openai_api_key,
+            whisperInt_auth_header=self.whisperInt_auth_header,
+            **self.backend_options,
+        )
+
+    def set_transcription_backend(self, backend):
+        # Segments already being transcribed finish on the old backend, it is closed once the last of them is done.
+        with self.backend_lock:
+            previous, self.backend = self.backend, backend
+            if previous is not None:
+                self.request_policy.retire(previous)
+
+    def acquire_backend(self, downgraded=False):
+        # The backend to transcribe with, to be released with request_policy.release once done. None if there is none.
+        with self.backend_lock:
+            backend = self.downgraded_backend if downgraded and self.downgraded_backend is not None else self.backend
+            return self.request_policy.acquire(backend) if backend is not None else None
+
+    def shutdown(self):
+        if self.settings_subscription is not None:
+            self.settings_manager.unsubscribe(self.settings_subscription)
+            self.settings_subscription = None
+        self.transcription_pool.shutdown(wait=False)
+        self.partial_executor.shutdown(wait=False, cancel_futures=True)
+        self.request_policy.shutdown()
+        for backend in (self.backend, self.request_policy.hedge_backend, self.downgraded_backend):
+            if backend is not None:
+                backend.close()
+        self.metrics.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    def process_audio_data(self, raw_data, backend, timings=None, energy_threshold=None, use_cache=True):
+        if timings is not None:
+            timings.mark("job_start")
+        duration = len(raw_data) / (self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH)
+        compaction = None
+        if self.compact_silence and energy_threshold is not None:
+            compaction = self.compactor.compact(raw_data, energy_threshold)
+            if timings is not None:
+                timings.silence_removed = compaction.saved_seconds
+            if not compaction.pieces:
+                logging.info(f"No speech in {duration:.2f} seconds of audio, not uploaded")
+                return ""
+            if compaction.saved_seconds > 0:
+                logging.info(f"Compacted {duration:.2f} to {compaction.seconds:.2f} seconds of audio ({compaction.saved_seconds:.2f} seconds of silence removed)")
+            raw_data, duration = compaction.pieces, compaction.seconds
+        meta = SegmentMeta(self.source.SAMPLE_RATE, self.source.SAMPLE_WIDTH, duration, encoder=self.encoder, timings=timings, compaction=compaction)
+
+        transcript = ""
+        if backend is not None:
+            # The hedge backend instead if it answers first, see RequestPolicy.
+            meta.timings.backend = backend.cache_id
+            # Partials are drafts of audio that is still growing, they would only push finals out of the cache.
+            key = audio_key(raw_data, backend.cache_id, self.encoder) if self.cache is not None and use_cache else None
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                return cached
             try:
-                transcript = str(self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text",
-                ))
-            except Exception as e:
-                transcript = "Problem with transcription: " + str(e)
-
-        t = threading.Thread(target=transcription_thread)
-        t.start()
-        t.join(timeout=3.5)
-        if t.is_alive():
-            transcript = "Transcription timed out after 5 seconds."
-            t.join()  # Ensure thread is cleaned up even if it has timed out
-        latency = datetime.now() - start_time
-        seconds = latency.total_seconds()
-        logging.info(f"Whisper transcription latency: {seconds} seconds for {duration} seconds of audio ({seconds/duration})")
+                transcript = self.request_policy.transcribe(backend, raw_data, meta)
+            except (TimeoutError, TranscriptionError) as e:
+                # Failures are reported, never shown as if they were the transcript. None tells them apart
+                # from audio without words in it.
+                logging.warning(f"Giving up on {duration:.2f} seconds of audio: {e}")
+                self.transcription_failed.emit(str(e))
+                return None
+            if key is not None and transcript:
+                self.cache.put(key, transcript)
+        if transcript:
+            logging.info(f"Transcription length: {len(transcript.split())} words, duration: {duration:.2f} seconds, proportion: {len(transcript.split()) / duration:.2f} words per second")
         return transcript
 
+    def process_new_audio(self, source, new_utterance, timings=None, utterance_over=False):
+        """
+        Queues the audio of the source's current utterance that hasn't been committed yet, plus a short
+        overlap of committed audio, for transcription. The words that weren't emitted before are emitted by
+        on_transcription_result once the segment's turn comes.
+        """
+        bytes_per_second = self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH
+        duration = (source.utterance_end - source.utterance_start) / bytes_per_second
+        if duration < self.MIN_DURATION:
+            # Keep it uncommitted, it will go out together with the next piece of the utterance. If there is
+            # none it still goes out, unless there is hardly any speech in it.
+            source.held_timings = timings
+            if not utterance_over:
+                return new_utterance
+            view = source.ring_buffer.view(max(source.committed_position, source.ring_buffer.oldest_position), source.utterance_end)
+            if self.compactor.speech_seconds(view, source.recorder.energy_threshold) < self.min_speech_seconds:
+                self.phrase_finished.emit(source.label, source.utterance_generation)
+                return new_utterance
+
+        overlap_bytes = int(self.overlap_seconds * self.source.SAMPLE_RATE) * self.source.SAMPLE_WIDTH
+        window_start = max(source.utterance_start, source.committed_position - overlap_bytes, source.ring_buffer.oldest_position)
+        segment = PendingSegment(source, window_start, source.committed_position, source.utterance_end, new_utterance, timings, source.utterance_generation)
+        source.committed_position = source.utterance_end
+        source.new_utterance = False
+        for dropped in self.backlog.push(segment):
+            self.shed(dropped)
+        return source.new_utterance
 
-    def transcribe_with_huggingface(self, audio_file, auth_header, duration):
-        transcript = None
-        API_URL = "https://y63omv344x74unnb.us-east-1.aws.endpoints.huggingface.cloud"
-        headers = {
-            "Authorization": auth_header,
-            "Content-Type": "audio/wav"
-        }
-
-        def transcription_thread():
-            nonlocal transcript
-            start_time = datetime.now()
-            with open(audio_file, "rb") as f:
-                data = f.read()
-            response = requests.post(API_URL, headers=headers, data=data)
-            latency = datetime.now() - start_time
-            seconds = latency.total_seconds()
-            logging.info(f"HuggingFace transcription latency: {seconds} seconds for {duration} seconds of audio ({seconds/duration})")
-            transcript = response.json().get("text", "No transcription available")
-
-        t = threading.Thread(target=transcription_thread)
-        t.start()
-        t.join(timeout=3.5)
-        if t.is_alive():
-            transcript = "Transcription timed out after 5 seconds."
-            t.join()  # Ensure thread is cleaned up even if it has timed out
+    def submit_backlog(self):
+        # As many waiting segments as the pool takes without blocking, the rest wait for the next result.
+        while self.transcription_pool.has_room():
+            segment = self.backlog.pop()
+            if segment is None:
+                break
+            self.submit_segment(segment)
+        self.update_load()
+
+    def submit_segment(self, segment):
+        source = segment.source
+        bytes_per_second = self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH
+        # A segment that waited long enough may have lost the start of its audio to the ring.
+        oldest = source.ring_buffer.oldest_position
+        if oldest >= segment.end:
+            self.shed(segment)
+            return
+        if oldest > segment.start:
+            self.shed(segment, end=oldest)
+            segment.start = oldest
+        window_start = max(segment.window_start, oldest)
+        if segment.timings is None:
+            # Where the journal and metrics find out which backend transcribed it.
+            segment.timings = SegmentTimings(segment.captured_at)
+        backend = self.acquire_backend(downgraded=self.load_state == "downgraded")
+        sequence = self.transcription_pool.submit(
+            self.transcribe_segment, source, window_start, segment.end, backend, segment.timings,
+            context=(source, segment.new_utterance, segment.timings, (segment.start, segment.end), segment.generation),
+        )
+        with self.partial_lock:
+            self.in_flight_captured[sequence] = segment.captured_at
+        logging.info(f"Queued segment {sequence} of {source.label}: {(segment.end - window_start) / bytes_per_second:.2f} seconds of utterance audio")
+
+    def transcribe_segment(self, source, start, end, backend, timings):
+        # On a transcription worker. The ring keeps being written meanwhile, if it lapped the segment before
+        # the backend was done reading it what was uploaded isn't the segment's audio any more.
+        lapped = not source.ring_buffer.is_available(start)
+        try:
+            if not lapped:
+                transcript = self.process_audio_data(source.ring_buffer.view(start, end), backend, timings, source.recorder.energy_threshold)
+                lapped = not source.ring_buffer.is_available(start)
+        finally:
+            if backend is not None:
+                self.request_policy.release(backend)
+        if lapped:
+            self.report_shed(source, (end - start) / (self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH))
+            return None
         return transcript
 
+    def shed(self, segment, end=None):
+        """
+        Gives up on the new audio of segment, or only on what of it comes before end if the ring overwrote
+        just its start. The stitcher has nothing to line what comes next up with, so that starts an utterance.
+        """
+        end = segment.end if end is None else end
+        self.report_shed(segment.source, (end - segment.start) / (self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH))
+        if end < segment.end:
+            segment.new_utterance = True
+            return
+        if not self.backlog.restart_utterance(segment.source):
+            segment.source.new_utterance = True
+        self.phrase_finished.emit(segment.source.label, segment.generation)
+
+    def report_shed(self, source, seconds):
+        with self.partial_lock:
+            self.shed_seconds += seconds
+        logging.warning(f"Dropped {seconds:.2f} seconds of {source.label} audio, transcription is falling behind")
+        self.load_shed.emit(f"Skipped {seconds:.1f} s of audio, transcription is falling behind")
+
+    def lag_seconds(self):
+        # How far the oldest audio not on screen yet is behind real time.
+        oldest = self.backlog.oldest_captured_at()
+        with self.partial_lock:
+            in_flight = min(self.in_flight_captured.values(), default=None)
+        oldest = min((t for t in (oldest, in_flight) if t is not None), default=None)
+        return time.monotonic() - oldest if oldest is not None else 0.0
 
-    def process_audio_data(self, raw_data):
-        audio_data = sr.AudioData(raw_data, self.source.SAMPLE_RATE, self.source.SAMPLE_WIDTH)
-        duration = len(audio_data.frame_data) / (audio_data.sample_rate * audio_data.sample_width)
-
-        if duration >= self.MIN_DURATION:
-            with open(self.temp_file, 'w+b') as f:
-                f.write(io.BytesIO(audio_data.get_wav_data()).read())
-                f.seek(0)
-                transcript = ""
-                if self.transcription_service == 'whisper':
-                    # Use OpenAI Whisper for transcription
-                    transcript = self.transcribe_with_whisper(f, duration)
-                elif self.transcription_service == 'whisperInt':
-                    # Use HuggingFace endpoint for transcription
-                    transcript = self.transcribe_with_huggingface(self.temp_file, self.whisperInt_auth_header, duration)
-                if transcript:
-                    self.update_text.emit(transcript+"\n")
-                    logging.info(f"Transcription length: {len(transcript.split())} words, duration: {duration:.2f} seconds, proportion: {len(transcript.split()) / duration:.2f} words per second")
+    def load_status(self):
+        return len(self.backlog), self.transcription_pool.in_flight(), self.lag_seconds(), self.load_state
+
+    def update_load(self):
+        """
+        Applies the backlog policy once there are too many waiting segments or the transcript is too far
+        behind, and undoes it once the backlog has cleared.
+        """
+        waiting, in_flight, lag, _ = self.load_status()
+        self.metrics.set_gauge("queue_depth", waiting)
+        self.metrics.set_gauge("in_flight_segments", in_flight)
+        self.metrics.set_gauge("lag_seconds", round(lag, 3))
+        self.metrics.set_gauge("shed_audio_seconds", round(self.shed_seconds, 3))
+        overloaded = waiting >= self.backlog.max_segments or lag > self.backlog.max_lag_seconds
+        caught_up = waiting == 0 and lag < self.backlog.max_lag_seconds / 2
+        policy = self.backlog.policy
+        if self.load_state == "ok" and overloaded:
+            if policy in ("drop_oldest", "coalesce") and lag > self.backlog.max_lag_seconds:
+                # Coalescing can't bound the lag by itself, it only makes fewer and longer requests.
+                while lag > self.backlog.max_lag_seconds:
+                    segment = self.backlog.drop_oldest()
+                    if segment is None:
+                        break
+                    self.shed(segment)
+                    lag = self.lag_seconds()
+            elif policy == "downgrade":
+                if self.downgraded_backend is None:
+                    backend = self.create_transcription_backend(self.downgrade_service) if self.downgrade_service else None
+                    if backend is None or not backend.is_available():
+                        # Only the backlog's own bound is left.
+                        logging.warning(f"Can't downgrade to {self.downgrade_service!r}, it isn't available")
+                        self.backlog.policy = "coalesce"
+                        return
+                    self.downgraded_backend = backend
+                self.load_state = "downgraded"
+                logging.warning(f"Transcription is {lag:.1f} seconds behind, sending to {self.downgrade_service} until it catches up")
+            elif policy == "pause" and self.running:
+                self.load_state = "paused"
+                logging.warning(f"Transcription is {lag:.1f} seconds behind, pausing capture until it catches up")
+                self.pause_capture()
+        elif self.load_state != "ok" and caught_up:
+            logging.info(f"Transcription caught up, no longer {self.load_state}")
+            if self.load_state == "paused" and self.running:
+                self.start_listeners()
+            self.load_state = "ok"
+
+    def pause_capture(self):
+        # Waits for the listeners to stop so they are free to start again once the backlog clears.
+        for source in self.sources:
+            if source.background_listening is not None:
+                source.background_listening(wait_for_stop=True)
+                source.background_listening = None
+
+    def set_streaming_partials(self, enabled, interval_ms):
+        # The listeners pick these up with the next chunk they read.
+        self.streaming_partials = enabled
+        self.partial_interval = interval_ms / 1000
+        for source in self.sources:
+            source.recorder.partial_interval = self.partial_interval
+            source.recorder.partial_callback = self.partial_callback if enabled else None
+
+    def tagged(self, source, text):
+        # With several sources every line says whose it is.
+        return f"[{source.label}] {text}" if len(self.sources) > 1 else text
+
+    def partial_callback(self, recognizer, span):
+        # Called on the listener thread, so it only hands the window over.
+        if not self.running:
+            return
+        source = recognizer.capture_source
+        with self.partial_lock:
+            job = (source, source.phrase_generation, span)
+            if self.partial_busy:
+                self.pending_partial = job
+                return
+            self.partial_busy = True
+        self.partial_executor.submit(self.transcribe_partials, job)
+
+    def transcribe_partials(self, job):
+        bytes_per_second = self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH
+        while job is not None:
+            source, generation, (start, end) = job
+            # Only the last few seconds, so partials of a long phrase don't re-upload all of it every time.
+            window_bytes = int(self.partial_window_seconds * self.source.SAMPLE_RATE) * self.source.SAMPLE_WIDTH
+            start = max(start, end - window_bytes, source.ring_buffer.oldest_position)
+            if self.partial_is_current(source, generation) and end - start >= 0.3 * bytes_per_second:
+                backend = self.acquire_backend()
+                try:
+                    text = self.process_audio_data(source.ring_buffer.view(start, end), backend, energy_threshold=source.recorder.energy_threshold, use_cache=False)
+                except Exception:
+                    logging.exception("Partial transcription failed")
+                    text = ""
+                finally:
+                    if backend is not None:
+                        self.request_policy.release(backend)
+                if text and self.partial_is_current(source, generation):
+                    self.update_partial.emit(self.tagged(source, text.strip()), source.label, generation)
+            with self.partial_lock:
+                job, self.pending_partial = self.pending_partial, None
+                if job is None:
+                    self.partial_busy = False
+
+    def partial_is_current(self, source, generation):
+        # Still the phrase being spoken, the listener thread bumps the generation when it ends.
+        with self.partial_lock:
+            return generation == source.phrase_generation
+
+    def on_transcription_result(self, sequence, context, transcript):
+        # Called by the pool in sequence order, so the stitcher always sees segments in the order they were spoken.
+        source, new_utterance, timings, span, generation = context
+        with self.partial_lock:
+            self.in_flight_captured.pop(sequence, None)
+        if len(self.backlog) or self.load_state != "ok":
+            self.data_queue.put(None)  # dispatch_segments submits the next waiting segment
+        if new_utterance or transcript is None:
+            # After a failed segment the committed words end before the audio the next one overlaps, lining
+            # it up with them could only drop words that were never shown.
+            source.stitcher.reset()
+        new_text = ""
+        if transcript:
+            new_text = source.stitcher.stitch(transcript)
+            if new_text:
+                self.update_text.emit(self.tagged(source, new_text)+"\n", source.label, generation)
+        if not new_text:
+            # Failed, empty or all overlap, nothing replaces its partial but it is still done.
+            self.phrase_finished.emit(source.label, generation)
+        if self.journal is not None:
+            # Failed and empty segments too, they are the ones worth transcribing again later.
+            self.journal_segment(source, sequence, span, timings, new_text, transcript)
+        if timings is not None:
+            timings.mark("emitted")
+            self.metrics.record(timings, sequence=sequence, backend=timings.backend, source=source.label, silence_removed=timings.silence_removed)
+            if timings.silence_removed is not None:
+                self.silence_removed += timings.silence_removed
+                self.metrics.observe("silence_removed", timings.silence_removed)
+                self.metrics.set_gauge("silence_removed_seconds_total", round(self.silence_removed, 3))
+            total = self.metrics.summary("total_to_screen")
+            self.latency_updated.emit(f"Latency p50 {total['p50']:.2f}s  p95 {total['p95']:.2f}s  p99 {total['p99']:.2f}s  ({total['count']} segments)")
+
+    def journal_segment(self, source, sequence, span, timings, text, transcript):
+        # Only the newly committed audio, the overlap in front of it is already journaled with the previous segment.
+        start, end = span
+        bytes_per_second = self.source.SAMPLE_RATE * self.source.SAMPLE_WIDTH
+        duration = (end - start) / bytes_per_second
+        captured_at = timings.captured_at if timings is not None else time.monotonic()
+        wall_end = time.time() - (time.monotonic() - captured_at)
+        pcm = None
+        if self.journal.store_audio and source.ring_buffer.is_available(start):
+            # Copied now, the ring will have moved on by the time the journal thread encodes it.
+            pcm = bytes(source.ring_buffer.view(start, end))
+        self.journal.record(
+            sequence, wall_end - duration, duration, text, transcript=transcript or "", backend=timings.backend if timings is not None else None,
+            pcm=pcm, sample_rate=self.source.SAMPLE_RATE, sample_width=self.source.SAMPLE_WIDTH, source=source.label,
+            error="transcription failed" if transcript is None else None,
+        )
 
     def run(self):
-        self.start_listening()
-        DELTA = timedelta(seconds=self.phrase_timeout)
-        phrase_time = None
-        self.last_sample = bytes()
+        with self.settings_lock:
+            self.settings_on_thread = True
+        try:
+            self.start_listening()
+            self.started_listening.emit()
+            self.dispatch_segments()
+        finally:
+            with self.settings_lock:
+                self.settings_on_thread = False
+            self.apply_pending_settings()
+
+    def dispatch_segments(self):
+        """
+        Hands phrases from the listener to transcription as soon as record_callback queues them. Blocks on
+        the queue while idle, stop_recording wakes it up with a None.
+        """
+        for source in self.sources:
+            # The current utterance is the ring buffer span from its first phrase to its last one.
+            source.utterance_start = source.utterance_end = None
+            # Ring position up to which the utterance was already transcribed, it is never sent again except for the overlap.
+            source.committed_position = 0
+            source.phrase_time = None
+            source.new_utterance = True
+            source.held_timings = None
         self.english_transcript_buffer = []
         self.spanish_transcript_buffer = []
 
-        self.started_listening.emit()
-
         while self.running:
-            try:
-                now = datetime.utcnow()
-                if not self.data_queue.empty():
-                    if phrase_time and (now - phrase_time) > DELTA:
-                        self.last_sample = bytes()
-                    phrase_time = now
+            spans = self.wait_for_spans()
+            self.apply_pending_settings()
+            now = datetime.utcnow()
+            # Read every time, it can be changed while recording.
+            phrase_timeout = timedelta(seconds=self.phrase_timeout)
+            self.finish_held_utterances(now, phrase_timeout)
+            if not spans:
+                self.submit_backlog()
+                continue
+
+            newest_timings = {}
+            for source, start, end, timings, generation in spans:
+                if source not in newest_timings:
+                    if source.utterance_start is None or (source.phrase_time and (now - source.phrase_time) > phrase_timeout):
+                        source.utterance_start = source.utterance_end = None
+                        # The stitcher is reset when the first segment of the new utterance comes back.
+                        source.new_utterance = True
+                    source.phrase_time = now
+                if source.utterance_start is None:
+                    source.utterance_start = source.committed_position = start
+                source.utterance_end = end
+                source.utterance_generation = generation
+                newest_timings[source] = timings
+
+            for source, timings in newest_timings.items():
+                # The segment is timed from the capture end of its newest phrase.
+                source.new_utterance = self.process_new_audio(source, source.new_utterance, timings)
+            self.submit_backlog()
+
+
+    def wait_for_spans(self):
+        # Woken by every result while segments are waiting, the timeout keeps the lag checked anyway.
+        try:
+            if len(self.backlog) or self.load_state != "ok":
+                timeout = 0.5
+            elif any(self.holding_audio(source) for source in self.sources):
+                timeout = self.phrase_timeout  # to send it once its utterance is over
+            else:
+                timeout = None
+            spans = [self.data_queue.get(timeout=timeout)]
+        except Empty:
+            spans = []
+        while not self.data_queue.empty():
+            spans.append(self.data_queue.get_nowait())
+        return [span for span in spans if span is not None]
 
-                    while not self.data_queue.empty():
-                        self.last_sample += self.data_queue.get()
-                    
-                    self.process_audio_data(self.last_sample)
-            except sr.WaitTimeoutError:
-                pass
-            time.sleep(1/10)
+    def holding_audio(self, source):
+        return source.utterance_end is not None and source.utterance_end > source.committed_position
 
+    def finish_held_utterances(self, now, phrase_timeout):
+        # Utterances that were too short to send and have now ended go out on their own if there is speech in them.
+        for source in self.sources:
+            if self.holding_audio(source) and source.phrase_time and now - source.phrase_time > phrase_timeout:
+                self.process_new_audio(source, source.new_utterance, source.held_timings, utterance_over=True)
+                source.utterance_start = source.utterance_end = None
+                source.new_utterance = True
 
     def start_recording(self):
         if not self.running:
             self.running = True
+            self.load_state = "ok"
+            if self.warm_up_connection and self.backend is not None:
+                self.backend.warm_up()
             self.start()
 
     def stop_recording(self):
         if self.running:
             self.running = False
             self.stop_listening()
+            self.data_queue.put(None)  # wake up dispatch_segments so it sees running is False
             self.wait()
+            with self.partial_lock:
+                # Partials still being transcribed are of phrases that won't end now, they are dropped.
+                for source in self.sources:
+                    source.phrase_generation += 1
             self.stopped_listening.emit()
         
     # Threaded callback function to recieve audio data when recordings finish.
-    def record_callback(self, _, audio:sr.AudioData) -> None:
+    def record_callback(self, recognizer, audio:sr.AudioData) -> None:
         if self.running:# If running.
-            # Grab the raw bytes and push it into the thread safe queue.
-            self.data_queue.put( audio.get_raw_data() )
\ No newline at end of file
+            source = recognizer.capture_source
+            with self.partial_lock:
+                source.phrase_generation += 1
+                generation = source.phrase_generation
+            # Push the ring buffer span of the phrase into the thread safe queue, the audio itself stays in the ring.
+            start, end = audio.ring_span
+            timings = SegmentTimings(audio.captured_at, audio.vad_seconds, (end - start) / (audio.sample_rate * audio.sample_width))
+            self.data_queue.put( (source, start, end, timings, generation) )
\ No newline at end of file
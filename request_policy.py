@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import collections
+import copy
+import logging
+import random
+import threading
+import time
+
+from metrics import LatencyHistogram, SegmentTimings
+from transcription_backends import TranscriptionError
+
+
+class RequestPolicy:
+    """
+    Wraps backend calls with timeouts derived from the latencies seen so far, retries with jittered
+    exponential backoff and optionally a hedged request to a second backend once the first one is slower
+    than its usual p95.
+
+    Every call runs on the policy's own threads and the caller only waits for it up to the timeout, counted
+    from when the call starts running, so a request that hangs past it is abandoned (its late result is
+    discarded) instead of blocking anyone. Abandoned calls get max_abandoned threads of their own on top of
+    max_workers, so live requests don't queue behind them, and while a backend has that many still hanging
+    no new request is sent to it.
+
+    It also keeps count of who is using which backend (acquire / release, every call holds its backend
+    until it has finished too), so a replaced backend can be retired and is closed once the last request on
+    it is done instead of under it.
+    """
+    def __init__(self, default_timeout=15, min_timeout=2.0, max_timeout=60, timeout_multiplier=2.0,
+                 retries=2, backoff_base=0.25, backoff_max=4.0, hedge_backend=None, max_workers=8, min_samples=5,
+                 max_abandoned=4):
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_backend = hedge_backend
+        self.min_samples = min_samples
+        self.max_abandoned = max_abandoned
+        self.abandoned = collections.Counter()  # per backend
+        self.executor = ThreadPoolExecutor(max_workers=max_workers + max_abandoned, thread_name_prefix="request")
+        self.lock = threading.Lock()
+        # Seconds of latency per second of audio, per backend, so segments of any length can be compared.
+        self.latency_ratio = collections.defaultdict(LatencyHistogram)
+        self.users = collections.Counter()
+        self.retired = set()
+
+    def expected_latency(self, backend, duration):
+        # p95 of what this backend took for this much audio, None until there is enough history.
+        with self.lock:
+            histogram = self.latency_ratio.get(backend.cache_id)
+            if histogram is None or len(histogram.recent) < self.min_samples:
+                return None
+            return histogram.percentile(95) * duration
+
+    def timeout_for(self, backend, duration):
+        expected = self.expected_latency(backend, duration)
+        if expected is None:
+            return self.default_timeout
+        return min(self.max_timeout, max(self.min_timeout, expected * self.timeout_multiplier))
+
+    def record_latency(self, backend, seconds, duration):
+        with self.lock:
+            self.latency_ratio[backend.cache_id].observe(seconds / max(duration, 0.1))
+
+    def acquire(self, backend):
+        with self.lock:
+            self.users[backend] += 1
+        return backend
+
+    def release(self, backend):
+        with self.lock:
+            self.users[backend] -= 1
+            if self.users[backend] > 0:
+                return
+            del self.users[backend]
+            if backend not in self.retired:
+                return
+            self.retired.discard(backend)
+        self.close_backend(backend)
+
+    def retire(self, backend):
+        # Closes backend once nothing uses it any more, right away if nothing does.
+        with self.lock:
+            if self.users[backend] > 0:
+                self.retired.add(backend)
+                return
+        self.close_backend(backend)
+
+    def close_backend(self, backend):
+        try:
+            backend.close()
+        except Exception:
+            logging.exception(f"Closing the {backend.name} backend failed")
+
+    def transcribe(self, backend, buffer, meta):
+        """
+        Transcribes with retries, returns the transcript or raises the last TranscriptionError / TimeoutError.
+        """
+        # Loading a model can take longer than any request should, it is neither timed nor retried.
+        backend.prepare()
+        for attempt in range(self.retries + 1):
+            try:
+                return self.hedged_call(backend, buffer, meta)
+            except (TimeoutError, TranscriptionError) as e:
+                if attempt == self.retries or not getattr(e, "retryable", True):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logging.info(f"{backend.name} transcription failed ({e}), retrying in {delay:.2f} seconds")
+                time.sleep(delay)
+
+    def submit(self, backend, buffer, meta, timeout, hedge=False):
+        meta = copy.copy(meta)
+        meta.timeout = timeout
+        if hedge:
+            # The segment's own timeline keeps the primary request's stages.
+            meta.timings = SegmentTimings(audio_seconds=meta.duration)
+        # Set once the call runs (started.at is when), or once it is cancelled before it could.
+        started = threading.Event()
+
+        def call():
+            started.at = time.monotonic()
+            started.set()
+            try:
+                transcript = backend.transcribe(buffer, meta)
+            except TimeoutError:
+                # At least this slow, still worth knowing for the next timeout.
+                self.record_latency(backend, time.monotonic() - started.at, meta.duration)
+                raise
+            # Late results still count, they are what tells the next timeout how slow this backend is.
+            self.record_latency(backend, time.monotonic() - started.at, meta.duration)
+            return transcript
+
+        # Held until the call is done or cancelled, an abandoned call still uses the backend.
+        self.acquire(backend)
+        future = self.executor.submit(call)
+        future.started = started
+        future.timeout = timeout
+        future.add_done_callback(lambda _: started.set())
+        future.add_done_callback(lambda _: self.release(backend))
+        return future
+
+    def abandon(self, future, backend):
+        # Counted until it finishes, cancelled if it hasn't started.
+        if future.cancel():
+            return
+        with self.lock:
+            self.abandoned[backend] += 1
+
+        def finished(_):
+            with self.lock:
+                self.abandoned[backend] -= 1
+        future.add_done_callback(finished)
+
+    def hedged_call(self, backend, buffer, meta):
+        with self.lock:
+            hanging = self.abandoned[backend]
+        if hanging >= self.max_abandoned:
+            raise TimeoutError(f"{hanging} timed out {backend.name} requests are still running, not sending another one yet")
+        timeout = self.timeout_for(backend, meta.duration)
+        primary = self.submit(backend, buffer, meta, timeout)
+        futures = {primary: backend}
+        # Callers never wait long for a thread, but the time they do isn't the backend's.
+        primary.started.wait()
+        started_at = getattr(primary.started, "at", time.monotonic())
+
+        hedge_after = self.expected_latency(backend, meta.duration)
+        if self.hedge_backend is not None and hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=max(0, started_at + hedge_after - time.monotonic()))
+            if not done:
+                logging.info(f"{backend.name} passed its p95 of {hedge_after:.2f} seconds, hedging with {self.hedge_backend.name}")
+                # A timeout of its own, what is left of the slow primary's would hardly give it a chance.
+                hedge_timeout = self.timeout_for(self.hedge_backend, meta.duration)
+                futures[self.submit(self.hedge_backend, buffer, meta, hedge_timeout, hedge=True)] = self.hedge_backend
+
+        error = None
+        timed_out = False
+        while futures:
+            first_deadline = min(self.deadline(future) for future in futures)
+            done, _ = wait(futures, timeout=max(0, first_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = futures.pop(future)
+                try:
+                    transcript = future.result()
+                except (TimeoutError, TranscriptionError) as e:
+                    error = e
+                    continue
+                except Exception as e:
+                    error = TranscriptionError(f"Problem with transcription: {e}")
+                    continue
+                # Whichever answers first wins, the other one finishes in the background and is ignored,
+                # counted as abandoned since it still holds a thread.
+                for loser, loser_backend in futures.items():
+                    self.abandon(loser, loser_backend)
+                meta.timings.backend = winner.cache_id
+                return transcript
+            now = time.monotonic()
+            for future in [future for future in futures if self.deadline(future) <= now]:
+                self.abandon(future, futures.pop(future))
+                timed_out = True
+        if timed_out:
+            raise TimeoutError(f"Transcription timed out after {timeout:.1f} seconds")
+        raise error
+
+    def deadline(self, future):
+        # Counted from when the call started running, a hedge still waiting for a thread gets all of its time.
+        started_at = getattr(future.started, "at", None)
+        return (started_at if started_at is not None else time.monotonic()) + future.timeout
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            retired, self.retired = self.retired, set()
+        for backend in retired:
+            self.close_backend(backend)
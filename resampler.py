@@ -0,0 +1,71 @@
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler, from_rate to to_rate, for blocks of int16 samples shaped (frames, channels).
+    Upsamples by up, low-pass filters and keeps every down-th sample, all done as one polyphase filter:
+    each output sample is a taps_per_phase dot product with the newest input samples, computed for a whole
+    block at once. The filter state carries over between blocks, so blocks can be any size, and the only
+    latency added is half the filter, taps_per_phase / 2 input samples.
+    """
+    def __init__(self, from_rate, to_rate=16000, channels=1, taps_per_phase=None, cutoff=0.9):
+        divisor = gcd(from_rate, to_rate)
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        self.channels = channels
+        # The filter has to span about as many output samples whatever the ratio, so more input samples when
+        # decimating.
+        taps_per_phase = taps_per_phase or 16 * -(-from_rate // to_rate) + 8
+        self.taps = taps_per_phase
+        # Windowed sinc at the upsampled rate, cut off a bit under the lower Nyquist frequency.
+        length = taps_per_phase * self.up
+        band = cutoff * min(from_rate, to_rate) / (from_rate * self.up)  # cycles per upsampled sample, times 2
+        n = np.arange(length) - (length - 1) / 2
+        h = self.up * band * np.sinc(band * n) * np.kaiser(length, 8.0)
+        # weights[p] are the taps of phase p, oldest input first.
+        self.weights = h.reshape(taps_per_phase, self.up).T[:, ::-1].astype(np.float32)
+        self.reset()
+
+    def reset(self):
+        self.history = np.zeros((self.taps - 1, self.channels), dtype=np.float32)
+        self.consumed = 0  # input samples seen so far
+        self.produced = 0  # output samples made so far
+
+    @property
+    def delay_seconds(self):
+        return self.taps / 2 / self.from_rate
+
+    def output_frames(self, input_frames):
+        # How many output samples input_frames more input samples are guaranteed to give.
+        return ((self.consumed + input_frames) * self.up - 1) // self.down + 1 - self.produced
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self.channels)
+        if not len(block):
+            return np.zeros((0, self.channels), dtype=np.int16)
+        x = np.concatenate((self.history, block))
+        total = self.consumed + len(block)
+        # Output n needs input n * down // up, which has to be in by now.
+        outputs = np.arange(self.produced, ((total * self.up) - 1) // self.down + 1)
+        inputs = outputs * self.down // self.up
+        phases = outputs * self.down % self.up
+        # The window ending at input i starts at x[i - consumed], x[0] being taps - 1 samples before consumed.
+        windows = sliding_window_view(x, self.taps, axis=0)[inputs - self.consumed]
+        y = np.einsum("nck,nk->nc", windows, self.weights[phases])
+        self.history = x[len(x) - (self.taps - 1):]
+        self.consumed = total
+        self.produced += len(outputs)
+        return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+
+def downmix(samples):
+    # int16 (frames, channels) to float32 (frames, 1), the average of the channels.
+    if samples.shape[1] == 1:
+        return samples.astype(np.float32)
+    return samples.mean(axis=1, dtype=np.float32, keepdims=True)
@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class ChangePointSegmenter:
+    """
+    Picks where to cut a phrase that is still going on, so continuous talk goes out in short segments
+    instead of waiting for a pause or the phrase time limit.
+
+    The listener feeds it every chunk of the phrase. Once the segment is min_segment_seconds long it is
+    cut at the next spectral change between the last two context_seconds windows (usually another
+    speaker) or the next low-energy valley between words, valley_db under the segment's typical level.
+    At max_segment_seconds it is cut at the quietest point found since min_segment_seconds.
+
+    Each chunk costs one FFT: log band energies with the overall level taken out serve as a cheap
+    speaker embedding, compared by cosine distance.
+    """
+    def __init__(self, sample_rate=16000, chunk_size=1024, min_segment_seconds=3.0, max_segment_seconds=10.0,
+                 valley_db=12.0, change_threshold=0.3, context_seconds=1.5, bands=24):
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        seconds_per_chunk = chunk_size / sample_rate
+        self.min_chunks = max(1, int(min_segment_seconds / seconds_per_chunk))
+        self.max_chunks = max(self.min_chunks + 1, int(max_segment_seconds / seconds_per_chunk))
+        self.context_chunks = max(2, int(context_seconds / seconds_per_chunk))
+        self.valley_db = valley_db
+        self.change_threshold = change_threshold
+        self.window = np.hanning(chunk_size).astype(np.float32)
+        # Log spaced bands from 100 Hz to 4 kHz, where voices differ the most.
+        frequencies = np.fft.rfftfreq(chunk_size, 1 / sample_rate)
+        edges = np.geomspace(100, min(4000, sample_rate / 2), bands + 1)
+        self.band_of_bin = np.digitize(frequencies, edges) - 1
+        self.bands = bands
+        self.reset()
+
+    def reset(self):
+        self.positions = []
+        self.energies = []
+        self.embeddings = []
+        self.change_peak = None  # (score, boundary) of a spectral change above the threshold
+        self.cut_reason = None
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.pending_position = 0
+
+    def add(self, buffer, position):
+        # buffer starts at ring position position, it is scored in chunk_size pieces whatever size the source reads.
+        samples = np.frombuffer(buffer, dtype=np.int16)
+        if len(self.pending) and self.pending_position + 2 * len(self.pending) == position:
+            samples = np.concatenate((self.pending, samples))
+            position = self.pending_position
+        used = len(samples) - len(samples) % self.chunk_size
+        for offset in range(0, used, self.chunk_size):
+            self.add_chunk(samples[offset:offset + self.chunk_size], position + 2 * offset)
+        self.pending = samples[used:].copy()
+        self.pending_position = position + 2 * used
+
+    def add_chunk(self, samples, position):
+        chunk = samples.astype(np.float32)
+        power = np.abs(np.fft.rfft(chunk * self.window)) ** 2
+        in_band = self.band_of_bin >= 0
+        bands = np.bincount(self.band_of_bin[in_band], weights=power[in_band], minlength=self.bands + 1)[:self.bands]
+        log_bands = np.log(bands + 1e-3)
+        embedding = log_bands - log_bands.mean()
+        norm = np.linalg.norm(embedding)
+        self.positions.append(position)
+        self.energies.append(10 * np.log10(np.mean(chunk * chunk) + 1.0))
+        self.embeddings.append(embedding / norm if norm else embedding)
+
+    def cut_position(self):
+        """
+        Ring position to end the segment at, or None to keep going. cut_reason says why.
+        """
+        count = len(self.positions)
+        if count <= self.min_chunks:
+            return None
+        energies = np.asarray(self.energies)
+        # Moving average over 3 chunks so a single quiet chunk inside a word isn't a valley, smoothed[i]
+        # is centered on chunk i + 1.
+        smoothed = np.convolve(energies, np.ones(3) / 3, mode="valid")
+        typical = np.percentile(energies, 75)
+
+        boundary = count - self.context_chunks
+        if boundary >= self.min_chunks and boundary >= self.context_chunks:
+            voiced = energies > typical - self.valley_db
+            left = self.mean_embedding(boundary - self.context_chunks, boundary, voiced)
+            right = self.mean_embedding(boundary, count, voiced)
+            score = 1 - float(left @ right) if left is not None and right is not None else 0.0
+            if score > self.change_threshold and (self.change_peak is None or score >= self.change_peak[0]):
+                # Still rising while the new voice fills the right window, cut once it has peaked.
+                self.change_peak = (score, boundary)
+            elif self.change_peak is not None:
+                self.cut_reason = "change"
+                return self.positions[self.change_peak[1]]
+
+        # The newest chunk with smoothed values on both sides.
+        candidate = len(smoothed) - 2
+        if candidate + 1 >= self.min_chunks and smoothed[candidate] <= smoothed[candidate - 1] and smoothed[candidate] <= smoothed[candidate + 1] \
+                and smoothed[candidate] < typical - self.valley_db:
+            self.cut_reason = "valley"
+            return self.middle_of(candidate + 1)
+
+        if count >= self.max_chunks:
+            self.cut_reason = "max"
+            return self.middle_of(self.min_chunks + int(np.argmin(smoothed[self.min_chunks - 1:])))
+        return None
+
+    def mean_embedding(self, start, stop, voiced):
+        chosen = [self.embeddings[i] for i in range(start, stop) if voiced[i]]
+        if len(chosen) < max(2, (stop - start) // 3):
+            return None
+        mean = np.mean(chosen, axis=0)
+        norm = np.linalg.norm(mean)
+        return mean / norm if norm else None
+
+    def middle_of(self, index):
+        return self.positions[index] + self.chunk_size  # half a chunk of 16 bit samples, in bytes
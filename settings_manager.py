@@ -1,84 +1,283 @@
+import atexit
 import configparser
+import io
+import logging
 import os
+import threading
+import time
+
+# Every known setting and its default, the type of the default is the setting's type.
+DEFAULTS = {
+    'openai_api_key': '',
+    'whisperInt_auth_header': '',
+    'device_name': 'Default Device',
+    'device_index': 0,
+    'transcription_service': 'none',
+    'energy_threshold': 1000,
+    'record_timeout': 23,
+    'phrase_timeout': 1.5,
+    'font_size': 12,
+    'overlap_seconds': 1.0,
+    'transcription_workers': 3,
+    'request_timeout': 15.0,
+    'http_pool_size': 0,
+    'http2': False,
+    'warm_up_connection': True,
+    'upload_format': 'wav',
+    'opus_bitrate': 24,
+    'local_model': 'base',
+    'streaming_partials': False,
+    'partial_interval_ms': 500,
+    'metrics_file': 'metrics.jsonl',
+    'metrics_port': 0,
+    'show_latency': True,
+    'cache_entries': 256,
+    'cache_disk_path': '',
+    'cache_disk_mb': 50,
+    'request_retries': 2,
+    'hedge_service': '',
+    'batch_workers': 4,
+    'batch_max_chunk_seconds': 30,
+    'transcript_log': '',
+    'transcript_memory_segments': 2000,
+    'transcript_view_lines': 5000,
+    'journal_dir': 'journal',
+    'journal_audio': False,
+    'journal_audio_format': 'flac',
+    'sources': '',
+    'segment_on_changes': True,
+    'segment_min_seconds': 3.0,
+    'segment_max_seconds': 10.0,
+    'speaker_change_threshold': 0.3,
+    'valley_db': 12.0,
+    'native_rate_capture': True,
+    'backlog_policy': 'coalesce',
+    'max_backlog_segments': 6,
+    'max_lag_seconds': 20.0,
+    'downgrade_service': 'local',
+    'compact_silence': True,
+    'keep_silence_seconds': 0.2,
+    'max_pause_seconds': 0.5,
+    'min_speech_seconds': 0.3,
+}
+
+
+def parse_value(value, value_type):
+    # Raises ValueError like configparser's getint/getfloat/getboolean did.
+    if value_type == bool:
+        if isinstance(value, bool):
+            return value
+        text = str(value).lower()
+        if text not in configparser.ConfigParser.BOOLEAN_STATES:
+            raise ValueError(f"Not a boolean: {value}")
+        return configparser.ConfigParser.BOOLEAN_STATES[text]
+    if value_type == int:
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, bool):
+            return int(value)
+        return int(value) if isinstance(value, int) else int(str(value).strip())
+    if value_type == float:
+        return float(value)
+    return format_value(value)
+
+
+def format_value(value):
+    # As it is written to config.ini.
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
 
 class SettingsManager:
-    def __init__(self, config_file='config.ini'):
-        self.config = configparser.ConfigParser()
+    """
+    The settings, parsed once into typed values and kept in memory. Changing one doesn't touch the disk
+    right away: writes are debounced on a background thread, so a burst of changes (the preferences dialog
+    saves a dozen) ends up as a single write, done to a temp file that then replaces config.ini so a crash
+    never leaves it half written.
+
+    subscribe() gets a callback called with {option: new value} whenever any of the options it listens to
+    change, once per update() however many of them changed.
+    """
+    def __init__(self, config_file='config.ini', write_delay=0.5):
         self.config_file = config_file
+        self.write_delay = write_delay
+        self.sections = {'DEFAULT': {}}
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.write_condition = threading.Condition(self.lock)
+        self.dirty_since = None
+        self.last_change = None
+        self.write_lock = threading.Lock()
+        self.writer = threading.Thread(target=self.write_loop, name="settings-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.flush)
         if not os.path.exists(config_file):
             self.create_default_config()
         self.load_settings()
 
     def create_default_config(self):
         # Set default values for the configuration
-        self.config['DEFAULT'] = {
-            'openai_api_key': '',
-            'whisperInt_auth_header': '',
-            'device_name': 'Default Device',
-            'device_index': '0',
-            'transcription_service': 'none',
-            'energy_threshold': '1000',
-            'record_timeout': '23',
-            'phrase_timeout': '1.5',
-            'font_size': '12'
-        }
-        self.save_config()
+        with self.lock:
+            self.sections['DEFAULT'] = dict(DEFAULTS)
+        self.flush(force=True)
 
     def load_settings(self):
+        # No interpolation, a % in an API key is just a %.
+        config = configparser.ConfigParser(interpolation=None)
         try:
-            self.config.read(self.config_file)
-            self.openai_api_key = self.config.get('DEFAULT', 'openai_api_key', fallback='')
-            self.huggingface_auth_header = self.config.get('DEFAULT', 'whisperInt_auth_header', fallback='')
-            self.device_name = self.config.get('DEFAULT', 'device_name', fallback='Default Device')
-            self.device_index = self.config.getint('DEFAULT', 'device_index', fallback=0)
-            self.translation_service = self.config.get('DEFAULT', 'transcription_service', fallback='none')
-            self.energy_threshold = self.config.getint('DEFAULT', 'energy_threshold', fallback=1000)
-            self.record_timeout = self.config.getint('DEFAULT', 'record_timeout', fallback=23)
-            self.phrase_timeout = self.config.getfloat('DEFAULT', 'phrase_timeout', fallback=1.5)
-            self.phrase_timeout = self.config.getint('DEFAULT', 'font_size', fallback=16)
+            config.read(self.config_file)
         except configparser.Error as e:
-            print(f"Error reading configuration file: {e}")
+            logging.error(f"Error reading configuration file: {e}")
             self.create_default_config()
+            return
+        sections = {'DEFAULT': self.typed(config.defaults())}
+        for section in config.sections():
+            # configparser lists the defaults in every section too, only what the section changes is kept.
+            sections[section] = self.typed({option: value for option, value in config.items(section)
+                                            if config.defaults().get(option) != value})
+        with self.lock:
+            self.sections = sections
+
+    def typed(self, values):
+        result = {}
+        for option, text in values.items():
+            # configparser lowercases option names.
+            option = next((known for known in DEFAULTS if known.lower() == option), option)
+            value_type = type(DEFAULTS[option]) if option in DEFAULTS else str
+            try:
+                result[option] = parse_value(text, value_type)
+            except ValueError as e:
+                logging.warning(f"Ignoring setting {option}={text!r}: {e}")
+        return result
 
     def save_config(self):
-        with open(self.config_file, 'w') as configfile:
-            self.config.write(configfile)
+        # Written by the background thread once the changes settle, flush() writes right away.
+        with self.lock:
+            self.mark_dirty()
+
+    def mark_dirty(self):
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+        self.last_change = time.monotonic()
+        self.write_condition.notify()
 
-    def get_setting(self, section, option, fallback=None, value_type=str):
+    def flush(self, force=False):
+        # Snapshot and write under write_lock, so an older snapshot can never land after a newer one.
+        with self.write_lock:
+            with self.lock:
+                if self.dirty_since is None and not force:
+                    return
+                self.dirty_since = None
+                text = self.serialize()
+            self.write_file(text)
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while self.dirty_since is None:
+                    self.write_condition.wait()
+                # Wait until nothing changed for write_delay, but never put a write off for more than ten times that.
+                while self.dirty_since is not None:
+                    now = time.monotonic()
+                    due = min(self.last_change + self.write_delay, self.dirty_since + 10 * self.write_delay)
+                    if now >= due:
+                        break
+                    self.write_condition.wait(due - now)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Saving the settings failed")
+
+    def serialize(self):
+        config = configparser.ConfigParser(interpolation=None)
+        config.optionxform = str  # keep whisperInt_auth_header as it is
+        config.read_dict({section: {option: format_value(value) for option, value in values.items()}
+                          for section, values in self.sections.items()})
+        buffer = io.StringIO()
+        config.write(buffer)
+        return buffer.getvalue()
+
+    def write_file(self, text):
+        temp_file = f"{self.config_file}.tmp"
         try:
-            if value_type == int:
-                return self.config.getint(section, option, fallback=fallback)
-            elif value_type == float:
-                return self.config.getfloat(section, option, fallback=fallback)
-            elif value_type == bool:
-                return self.config.getboolean(section, option, fallback=fallback)
+            with open(temp_file, 'w') as configfile:
+                configfile.write(text)
+                configfile.flush()
+                os.fsync(configfile.fileno())
+            os.replace(temp_file, self.config_file)
+        except OSError as e:
+            logging.error(f"Couldn't save {self.config_file}: {e}")
+
+    def get_setting(self, section, option, fallback=None, value_type=None):
+        """
+        The option's value from section, else from DEFAULT, else its entry in DEFAULTS, so a config.ini
+        from before the option existed still gets its default. fallback is only for unknown options.
+        value_type defaults to the option's own type.
+        """
+        if value_type is None:
+            value_type = type(DEFAULTS[option]) if option in DEFAULTS else str
+        with self.lock:
+            values = self.sections.get(section, {})
+            if option in values:
+                value = values[option]
+            elif option in self.sections['DEFAULT']:
+                value = self.sections['DEFAULT'][option]
+            elif option in DEFAULTS:
+                value = DEFAULTS[option]
             else:
-                return self.config.get(section, option, fallback=fallback)
+                return fallback
+        if type(value) is value_type:
+            return value
+        try:
+            return parse_value(value, value_type)
         except ValueError as e:
-            print(f"Error casting setting value: {e}")
-            return fallback
-        except configparser.NoOptionError:
-            return fallback
-        except configparser.NoSectionError:
-            if section != 'DEFAULT':
-                self.config.add_section(section)
+            logging.warning(f"Error casting setting value: {e}")
             return fallback
 
     def set_setting(self, section, option, value):
-        if section not in self.config:
-            self.config.add_section(section)
-        if isinstance(value, bool):
-            self.config.set(section, option, str(value).lower())
-        elif isinstance(value, int) or isinstance(value, float):
-            self.config.set(section, option, str(value))
-        else:
-            self.config.set(section, option, str(value))
-        # Update the corresponding attribute if it exists
-        attribute_name = option.lower()
-        if hasattr(self, attribute_name):
-            if isinstance(value, int) or isinstance(value, float):
-                setattr(self, attribute_name, value)
-            else:
-                setattr(self, attribute_name, str(value))
-        self.save_config()
+        self.update(section, {option: value})
+
+    def update(self, section, values):
+        """
+        Sets several options at once, subscribers hear about all of them together.
+        """
+        changes = {}
+        with self.lock:
+            stored = self.sections.setdefault(section, {})
+            for option, value in values.items():
+                if option in DEFAULTS:
+                    try:
+                        value = parse_value(value, type(DEFAULTS[option]))
+                    except ValueError as e:
+                        logging.warning(f"Not setting {option}: {e}")
+                        continue
+                if option not in stored or stored[option] != value:
+                    stored[option] = value
+                    changes[option] = value
+            if changes:
+                self.mark_dirty()
+            subscribers = list(self.subscribers)
+        if section != 'DEFAULT':
+            return changes
+        for options, callback in subscribers:
+            relevant = {option: value for option, value in changes.items() if options is None or option in options}
+            if relevant:
+                try:
+                    callback(relevant)
+                except Exception:
+                    logging.exception(f"Applying settings {', '.join(relevant)} failed")
+        return changes
+
+    def subscribe(self, options, callback):
+        """
+        Calls callback({option: value}) on the thread that changed them whenever any of options (any
+        option if None) changes. Returns a token for unsubscribe.
+        """
+        entry = (set(options) if options is not None else None, callback)
+        with self.lock:
+            self.subscribers.append(entry)
+        return entry
 
+    def unsubscribe(self, token):
+        with self.lock:
+            if token in self.subscribers:
+                self.subscribers.remove(token)
@@ -0,0 +1,63 @@
+from backlog import PendingSegment, SegmentBacklog
+
+
+class Source:
+    pass
+
+
+def segment(source, start, end, new_utterance=False):
+    return PendingSegment(source, start, start, end, new_utterance, None)
+
+
+def test_coalesce_merges_contiguous_segments_of_a_source():
+    backlog = SegmentBacklog(max_segments=6, policy="coalesce")
+    source = Source()
+    assert backlog.push(segment(source, 0, 100, new_utterance=True)) == []
+    assert backlog.push(segment(source, 100, 250)) == []
+    assert len(backlog) == 1
+    assert backlog.coalesced == 1
+    merged = backlog.pop()
+    assert (merged.start, merged.end, merged.new_utterance) == (0, 250, True)
+
+
+def test_coalesce_keeps_gaps_and_other_sources_apart():
+    backlog = SegmentBacklog(max_segments=6, policy="coalesce")
+    first, second = Source(), Source()
+    backlog.push(segment(first, 0, 100))
+    backlog.push(segment(first, 200, 300))  # a new utterance after a pause
+    backlog.push(segment(second, 300, 400))
+    assert len(backlog) == 3
+    assert backlog.coalesced == 0
+
+
+def test_coalesced_segment_is_bounded():
+    backlog = SegmentBacklog(max_segments=6, policy="coalesce", max_coalesced_bytes=250)
+    source = Source()
+    for start in range(0, 500, 100):
+        backlog.push(segment(source, start, start + 100))
+    spans = [(s.start, s.end) for s in iter(backlog.pop, None)]
+    assert spans == [(0, 200), (200, 400), (400, 500)]
+
+
+def test_more_than_max_segments_drops_the_oldest():
+    backlog = SegmentBacklog(max_segments=2, policy="drop_oldest")
+    source = Source()
+    backlog.push(segment(source, 0, 100))
+    backlog.push(segment(source, 100, 200))
+    dropped = backlog.push(segment(source, 200, 300))
+    assert [(s.start, s.end) for s in dropped] == [(0, 100)]
+    assert len(backlog) == 2
+    assert backlog.dropped == 1
+
+
+def test_drop_oldest_and_restart_utterance():
+    backlog = SegmentBacklog(max_segments=6, policy="drop_oldest")
+    source = Source()
+    backlog.push(segment(source, 0, 100))
+    backlog.push(segment(source, 100, 200))
+    assert backlog.drop_oldest().start == 0
+    assert backlog.restart_utterance(source)
+    assert backlog.pop().new_utterance
+    assert backlog.drop_oldest() is None
+    assert not backlog.restart_utterance(source)
+    assert backlog.dropped == 1
@@ -0,0 +1,93 @@
+import numpy as np
+from speech_recognition import AudioSource
+
+from capture_sources import NativeRateStream, SwitchableSource, read_available
+from resampler import PolyphaseResampler, downmix
+
+
+class FakePyAudioStream:
+    """
+    Plays samples back like a PyAudio input stream: captured frames are what the device has recorded so
+    far, a read of more than that would wait for the device, which is counted in waits instead.
+    """
+    def __init__(self, samples, captured):
+        self.samples = samples
+        self.captured = captured
+        self.position = 0
+        self.waits = 0
+
+    def get_read_available(self):
+        return self.captured - self.position
+
+    def read(self, frames, exception_on_overflow=True):
+        if frames > self.get_read_available():
+            self.waits += 1
+            self.captured = self.position + frames
+        data = self.samples[self.position:self.position + frames]
+        self.position += len(data)
+        return data.tobytes()
+
+
+class FakeDevice(AudioSource):
+    def __init__(self, samples, rate, captured, chunk_size=1024):
+        self.SAMPLE_RATE = 16000
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = chunk_size
+        self.channels = samples.shape[1]
+        self.resampler = PolyphaseResampler(rate, 16000) if rate != 16000 else None
+        self.read_size = max(1, round(chunk_size * rate / 16000))
+        self.pyaudio_stream = FakePyAudioStream(samples, captured)
+        self.stream = None
+        self.closed = False
+
+    def __enter__(self):
+        self.stream = NativeRateStream(self, self.pyaudio_stream, self.read_size)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.closed = True
+
+
+def stereo_tone(frames, rate, frequency=440):
+    t = np.arange(frames) / rate
+    left = 8000 * np.sin(2 * np.pi * frequency * t)
+    return np.stack((left, left / 2), axis=1).astype(np.int16)
+
+
+def converted(samples, rate):
+    return PolyphaseResampler(rate, 16000).process(downmix(samples)).tobytes()
+
+
+def test_reading_what_is_available_never_waits():
+    device = FakeDevice(stereo_tone(48000, 48000), 48000, captured=500).__enter__()
+    available = read_available(device)
+    assert available == PolyphaseResampler(48000, 16000).output_frames(500)
+    data = device.stream.read(available)
+    assert len(data) == 2 * available
+    assert device.pyaudio_stream.waits == 0
+    assert data == converted(device.pyaudio_stream.samples[:500], 48000)
+
+
+def test_switch_keeps_the_old_devices_audio():
+    old_samples = stereo_tone(48000, 48000)
+    old = FakeDevice(old_samples, 48000, captured=2 * 3072 + 500)
+    new = FakeDevice(stereo_tone(16000, 16000, frequency=1000), 16000, captured=300)
+    switchable = SwitchableSource(old, on_switch=lambda gap_ms: gaps.append(gap_ms))
+    gaps = []
+    switchable.__enter__()
+    before = switchable.stream.read(1024) + switchable.stream.read(1024)
+    switchable.switch_to(new)
+    waits = old.pyaudio_stream.waits
+    after = switchable.stream.read(1024)
+
+    # Draining the old device didn't wait for it, and everything it captured came out, in order.
+    assert old.pyaudio_stream.waits == waits
+    old_part = converted(old_samples[:2 * 3072 + 500], 48000)
+    assert (before + after).startswith(old_part)
+    # The new device's stale audio was dropped, what follows is what it captured after the swap.
+    new_part = (before + after)[len(old_part):]
+    frames = len(new_part) // 2
+    assert frames > 0
+    assert new_part == np.rint(downmix(new.pyaudio_stream.samples[300:300 + frames])).astype(np.int16).tobytes()
+    assert len(gaps) == 1 and gaps[0] is not None
+    assert old.closed or switchable.inner is new
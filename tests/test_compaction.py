@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from compaction import SilenceCompactor
+
+RATE = 16000
+# The VAD works in 16 ms frames and keeps calling it speech for 6 frames after it ends.
+FRAME = 256 / RATE
+HANGOVER = 6 * FRAME
+
+
+def tone(seconds, amplitude=6000):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+
+def compact(*parts, keep_seconds=0.2, max_pause_seconds=0.5):
+    pcm = np.concatenate(parts).tobytes()
+    return pcm, SilenceCompactor(keep_seconds=keep_seconds, max_pause_seconds=max_pause_seconds).compact(pcm, 1000)
+
+
+def seconds(kept):
+    return [(start / (2 * RATE), end / (2 * RATE)) for start, end in kept]
+
+
+@pytest.mark.parametrize("keep_seconds", [0.0, 0.2, 0.5])
+def test_silence_around_speech_is_trimmed_to_keep_seconds(keep_seconds):
+    _, result = compact(silence(2), tone(1), silence(2), keep_seconds=keep_seconds)
+    [(start, end)] = seconds(result.kept)
+    assert 2 - keep_seconds - FRAME <= start <= 2 - keep_seconds
+    assert 3 + keep_seconds <= end <= 3 + keep_seconds + HANGOVER + FRAME
+    assert result.original_seconds == pytest.approx(5)
+    assert result.saved_seconds == pytest.approx(5 - result.seconds)
+
+
+def test_long_pause_is_shortened_to_max_pause_seconds():
+    _, result = compact(tone(1), silence(2), tone(1), max_pause_seconds=0.5)
+    (_, first_end), (second_start, _) = seconds(result.kept)
+    left, right = first_end - 1, 3 - second_start
+    assert 0.25 <= left <= 0.25 + HANGOVER + FRAME
+    assert 0.25 <= right <= 0.25 + FRAME
+    assert result.seconds == pytest.approx(2 + left + right)
+
+
+def test_short_pause_is_kept_whole():
+    pcm, result = compact(tone(1), silence(0.3), tone(1), max_pause_seconds=0.5)
+    assert result.kept == [(0, len(pcm))]
+    assert result.saved_seconds == 0
+
+
+def test_pieces_are_the_kept_ranges_of_the_original():
+    pcm, result = compact(silence(0.5), tone(0.5), silence(1.5), tone(0.5), silence(1))
+    assert len(result.pieces) == len(result.kept) == 2
+    for piece, (start, end) in zip(result.pieces, result.kept):
+        assert bytes(piece) == pcm[start:end]
+        assert start % 2 == end % 2 == 0
+    assert result.kept[0][1] < result.kept[1][0]
+
+
+def test_no_speech_leaves_nothing_to_upload():
+    _, result = compact(silence(1))
+    assert result.pieces == [] and result.seconds == 0
+    assert SilenceCompactor().speech_seconds(silence(1).tobytes(), 1000) == 0
@@ -0,0 +1,55 @@
+import pytest
+
+from pcm_ring_buffer import PCMRingBuffer
+
+
+def pattern(start, length):
+    return bytes((start + i) % 251 for i in range(length))
+
+
+def test_spans_are_absolute_positions():
+    ring = PCMRingBuffer(100)
+    assert ring.write(pattern(0, 30)) == (0, 30)
+    assert ring.write(pattern(30, 50)) == (30, 80)
+    assert bytes(ring.view(10, 80)) == pattern(10, 70)
+
+
+def test_views_across_the_wrap_are_contiguous():
+    ring = PCMRingBuffer(100)
+    position = 0
+    for length in (60, 30, 70, 45):
+        ring.write(pattern(position, length))
+        position += length
+    # 205 bytes written, the last 100 kept, wrapping at 200.
+    view = ring.view(position - 100, position)
+    assert isinstance(view, memoryview)
+    assert bytes(view) == pattern(position - 100, 100)
+    assert bytes(ring.view(190, 205)) == pattern(190, 15)
+
+
+def test_overwritten_audio_is_not_available():
+    ring = PCMRingBuffer(100)
+    ring.write(pattern(0, 80))
+    ring.write(pattern(80, 50))
+    assert ring.oldest_position == 30
+    assert not ring.is_available(29)
+    assert ring.is_available(30)
+    with pytest.raises(ValueError):
+        ring.view(20, 60)
+    with pytest.raises(ValueError):
+        ring.view(100, 140)
+
+
+def test_oversized_write_returns_the_span_it_kept():
+    ring = PCMRingBuffer(100)
+    ring.write(pattern(0, 10))
+    start, end = ring.write(pattern(10, 250))
+    assert (start, end) == (160, 260)
+    assert ring.is_available(start)
+    assert bytes(ring.view(start, end)) == pattern(160, 100)
+
+
+def test_capacity_keeps_whole_samples():
+    ring = PCMRingBuffer(101, sample_width=2)
+    assert ring.capacity == 100
+    assert PCMRingBuffer.for_duration(0.5, 16000, 2).capacity == 16000
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from request_policy import RequestPolicy
+from transcription_backends import SegmentMeta, TranscriptionBackend, TranscriptionError
+
+
+class FakeBackend(TranscriptionBackend):
+    """
+    Answers text after delay seconds, or raises the next of errors first if there are any.
+    """
+    model = "fake"
+
+    def __init__(self, name, delay=0.0, text=None, errors=()):
+        self.name = name
+        self.delay = delay
+        self.text = text or name
+        self.errors = list(errors)
+        self.calls = 0
+        self.release = threading.Event()
+
+    def transcribe(self, buffer, meta):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.release.wait(self.delay)
+        return self.text
+
+
+def meta(duration=1.0):
+    return SegmentMeta(16000, 2, duration)
+
+
+def seed(policy, backend, seconds, count=5):
+    for _ in range(count):
+        policy.record_latency(backend, seconds, 1.0)
+
+
+def test_hedge_gets_a_timeout_of_its_own():
+    slow = FakeBackend("slow", delay=5)
+    hedge = FakeBackend("hedge", delay=0.3)
+    policy = RequestPolicy(min_timeout=0.1, timeout_multiplier=2, retries=0, hedge_backend=hedge)
+    seed(policy, slow, 0.2)  # timeout 0.4 s, hedged after 0.2 s
+    seed(policy, hedge, 0.3)  # 0.6 s of its own, only 0.2 s would be left of the primary's
+    try:
+        segment = meta()
+        assert policy.transcribe(slow, b"", segment) == "hedge"
+        assert segment.timings.backend == hedge.cache_id
+        # The primary lost the race but still runs, it counts against the cap.
+        assert policy.abandoned[slow] == 1
+        slow.release.set()
+        time.sleep(0.1)
+        assert policy.abandoned[slow] == 0
+    finally:
+        slow.release.set()
+        policy.shutdown()
+
+
+def test_timeout_follows_the_backends_latency():
+    backend = FakeBackend("adaptive")
+    policy = RequestPolicy(default_timeout=15, min_timeout=2, max_timeout=60, timeout_multiplier=2, min_samples=5)
+    assert policy.timeout_for(backend, 4.0) == 15  # no history yet
+    seed(policy, backend, 1.5, count=4)
+    assert policy.timeout_for(backend, 4.0) == 15
+    seed(policy, backend, 1.5, count=1)
+    # 1.5 s per second of audio, p95 times the multiplier, for 4 s of audio.
+    assert policy.timeout_for(backend, 4.0) == pytest.approx(12, rel=0.1)
+    assert policy.timeout_for(backend, 0.1) == 2
+    assert policy.timeout_for(backend, 100) == 60
+    policy.shutdown()
+
+
+def test_retryable_errors_are_retried():
+    backend = FakeBackend("flaky", errors=[TranscriptionError("503"), TimeoutError("slow")])
+    policy = RequestPolicy(retries=2, backoff_base=0.01)
+    assert policy.transcribe(backend, b"", meta()) == "flaky"
+    assert backend.calls == 3
+    policy.shutdown()
+
+
+def test_non_retryable_errors_and_the_last_attempt_raise():
+    policy = RequestPolicy(retries=2, backoff_base=0.01)
+    rejected = FakeBackend("rejected", errors=[TranscriptionError("401", retryable=False)])
+    with pytest.raises(TranscriptionError):
+        policy.transcribe(rejected, b"", meta())
+    assert rejected.calls == 1
+    down = FakeBackend("down", errors=[TranscriptionError("503")] * 3)
+    with pytest.raises(TranscriptionError):
+        policy.transcribe(down, b"", meta())
+    assert down.calls == 3
+    policy.shutdown()
+
+
+def test_hung_calls_are_abandoned_up_to_max_abandoned():
+    hung = FakeBackend("hung", delay=5)
+    other = FakeBackend("other")
+    policy = RequestPolicy(default_timeout=0.1, retries=0, max_workers=2, max_abandoned=2)
+    try:
+        for _ in range(2):
+            start = time.monotonic()
+            with pytest.raises(TimeoutError):
+                policy.transcribe(hung, b"", meta())
+            assert time.monotonic() - start < 1
+        assert policy.abandoned[hung] == 2
+        calls = hung.calls
+        with pytest.raises(TimeoutError, match="still running"):
+            policy.transcribe(hung, b"", meta())
+        assert hung.calls == calls
+        # Other backends aren't held up by it.
+        assert policy.transcribe(other, b"", meta()) == "other"
+    finally:
+        hung.release.set()
+    time.sleep(0.1)
+    assert policy.abandoned[hung] == 0
+    policy.shutdown()
+
+
+def test_model_is_prepared_outside_the_timeout():
+    class Loading(FakeBackend):
+        prepared = 0
+
+        def prepare(self):
+            time.sleep(0.3)
+            self.prepared += 1
+
+    backend = Loading("loading")
+    policy = RequestPolicy(default_timeout=0.2, retries=0)
+    assert policy.transcribe(backend, b"", meta()) == "loading"
+    assert backend.prepared == 1
+    policy.shutdown()
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from resampler import PolyphaseResampler, downmix
+
+
+def tone(frequency, rate, seconds=1.0, amplitude=8000, channels=1):
+    t = np.arange(int(rate * seconds)) / rate
+    samples = amplitude * np.sin(2 * np.pi * frequency * t)
+    return np.repeat(samples[:, None], channels, axis=1).astype(np.int16)
+
+
+def level(samples, skip):
+    # Amplitude of a sine from its RMS, past the filter's start-up.
+    settled = samples[skip:].astype(np.float64)
+    return np.sqrt(2) * np.sqrt(np.mean(settled ** 2))
+
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000, 96000])
+def test_passband_tone_keeps_its_level(rate):
+    out = PolyphaseResampler(rate, 16000).process(tone(1000, rate))
+    assert len(out) == pytest.approx(16000, abs=1)
+    assert level(out, 1000) == pytest.approx(8000, rel=0.02)
+
+
+@pytest.mark.parametrize("rate", [44100, 48000, 96000])
+def test_tones_above_the_new_nyquist_are_filtered(rate):
+    # 10 kHz would alias to 6 kHz at 16 kHz.
+    out = PolyphaseResampler(rate, 16000).process(tone(10000, rate))
+    assert level(out, 1000) < 0.01 * 8000
+
+
+def test_output_matches_the_input_frequency():
+    out = PolyphaseResampler(44100, 16000).process(tone(1000, 44100))[1000:, 0].astype(np.float64)
+    spectrum = np.abs(np.fft.rfft(out * np.hanning(len(out))))
+    assert np.argmax(spectrum) * 16000 / len(out) == pytest.approx(1000, abs=2)
+
+
+@pytest.mark.parametrize("rate, channels", [(48000, 1), (44100, 2), (8000, 1)])
+def test_split_blocks_give_the_same_output_as_one(rate, channels):
+    samples = np.random.default_rng(0).integers(-20000, 20000, (rate // 2, channels), dtype=np.int16)
+    whole = PolyphaseResampler(rate, 16000, channels=channels).process(samples)
+    resampler = PolyphaseResampler(rate, 16000, channels=channels)
+    sizes = np.random.default_rng(1).integers(0, 2000, 400)
+    pieces, position = [], 0
+    for size in sizes:
+        expected = resampler.output_frames(len(samples[position:position + size]))
+        pieces.append(resampler.process(samples[position:position + size]))
+        assert len(pieces[-1]) == expected
+        position += size
+    pieces.append(resampler.process(samples[position:]))
+    np.testing.assert_array_equal(np.concatenate(pieces), whole)
+
+
+def test_downmix_averages_channels():
+    samples = np.array([[100, 300], [-100, -200]], dtype=np.int16)
+    np.testing.assert_array_equal(downmix(samples), [[200], [-150]])
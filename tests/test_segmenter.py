@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from segmenter import ChangePointSegmenter
+
+RATE = 16000
+CHUNK_SECONDS = 1024 / RATE
+
+
+def voice(pitch, seconds, amplitude=6000):
+    # A pitch and its harmonics, different pitches give different band energies.
+    t = np.arange(int(seconds * RATE)) / RATE
+    samples = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 8))
+    return (amplitude / 2 * samples).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+
+def first_cut(samples, read_size=2048, **options):
+    # Fed like the listener does, in reads that aren't chunk sized.
+    segmenter = ChangePointSegmenter(**options)
+    pcm = samples.tobytes()
+    for position in range(0, len(pcm) - read_size + 1, read_size):
+        segmenter.add(pcm[position:position + read_size], position)
+        cut = segmenter.cut_position()
+        if cut is not None:
+            return cut / (2 * RATE), segmenter.cut_reason
+    return None, None
+
+
+def test_cut_in_a_pause_between_words():
+    cut, reason = first_cut(np.concatenate((voice(150, 4), silence(0.4), voice(150, 4))))
+    assert reason == "valley"
+    assert 4 <= cut <= 4.4
+
+
+def test_cut_where_the_voice_changes():
+    cut, reason = first_cut(np.concatenate((voice(120, 4), voice(900, 4))))
+    assert reason == "change"
+    assert cut == pytest.approx(4, abs=2 * CHUNK_SECONDS)
+
+
+def test_no_cut_before_min_segment_seconds():
+    cut, _ = first_cut(np.concatenate((voice(150, 1), silence(0.4), voice(150, 6))))
+    assert cut is None
+
+
+def test_steady_talk_is_cut_at_max_segment_seconds():
+    cut, reason = first_cut(voice(150, 12), min_segment_seconds=3, max_segment_seconds=10)
+    assert reason == "max"
+    # min_segment_seconds in whole chunks.
+    assert 3 - CHUNK_SECONDS <= cut <= 10
+
+
+def test_reset_starts_a_new_segment():
+    segmenter = ChangePointSegmenter()
+    segmenter.add(voice(150, 1).tobytes(), 0)
+    segmenter.reset()
+    assert segmenter.positions == [] and segmenter.cut_position() is None
@@ -0,0 +1,31 @@
+from settings_manager import DEFAULTS, SettingsManager
+
+
+def test_options_missing_from_an_old_config_get_their_defaults(tmp_path):
+    path = tmp_path / "config.ini"
+    path.write_text("[DEFAULT]\nenergy_threshold = 700\n")
+    settings = SettingsManager(str(path))
+    assert settings.get_setting('DEFAULT', 'energy_threshold') == 700
+    assert settings.get_setting('DEFAULT', 'record_timeout') == DEFAULTS['record_timeout']
+    assert settings.get_setting('DEFAULT', 'phrase_timeout') == DEFAULTS['phrase_timeout']
+    assert settings.get_setting('DEFAULT', 'font_size') == DEFAULTS['font_size']
+    assert settings.get_setting('DEFAULT', 'streaming_partials') is False
+    assert settings.get_setting('DEFAULT', 'not_a_setting', fallback='x') == 'x'
+
+
+def test_values_come_back_as_the_settings_type(tmp_path):
+    path = tmp_path / "config.ini"
+    path.write_text("[DEFAULT]\nhttp2 = yes\nrequest_timeout = 7\n")
+    settings = SettingsManager(str(path))
+    assert settings.get_setting('DEFAULT', 'http2') is True
+    assert settings.get_setting('DEFAULT', 'request_timeout') == 7.0
+    assert settings.get_setting('DEFAULT', 'request_timeout', value_type=str) == "7.0"
+
+
+def test_subscribers_hear_about_changes_together(tmp_path):
+    settings = SettingsManager(str(tmp_path / "config.ini"))
+    heard = []
+    settings.subscribe(['font_size', 'opus_bitrate'], heard.append)
+    settings.update('DEFAULT', {'font_size': '14', 'opus_bitrate': 32, 'energy_threshold': 900})
+    settings.update('DEFAULT', {'font_size': 14})
+    assert heard == [{'font_size': 14, 'opus_bitrate': 32}]
@@ -0,0 +1,59 @@
+from transcript_stitcher import TranscriptStitcher
+
+
+def test_first_window_is_taken_whole():
+    stitcher = TranscriptStitcher()
+    assert stitcher.stitch("the quick brown fox") == "the quick brown fox"
+
+
+def test_exact_overlap_is_dropped():
+    stitcher = TranscriptStitcher()
+    stitcher.stitch("the quick brown fox")
+    assert stitcher.stitch("brown fox jumps over") == "jumps over"
+    assert stitcher.committed_words == "the quick brown fox jumps over".split()
+
+
+def test_overlap_ignores_case_and_punctuation():
+    stitcher = TranscriptStitcher()
+    stitcher.stitch("Jumps over the lazy dog.")
+    assert stitcher.stitch("the lazy Dog, and then") == "and then"
+
+
+def test_misrecognized_edge_word_is_skipped():
+    # The window starts in the middle of "brown", heard as "round".
+    stitcher = TranscriptStitcher(max_skip_words=2)
+    stitcher.stitch("the quick brown fox jumps")
+    assert stitcher.stitch("round fox jumps over the dog") == "over the dog"
+
+
+def test_edge_words_past_max_skip_words_are_kept():
+    stitcher = TranscriptStitcher(max_skip_words=1)
+    stitcher.stitch("the quick brown fox jumps")
+    assert stitcher.stitch("a round fox jumps over") == "a round fox jumps over"
+
+
+def test_no_overlap_keeps_everything():
+    stitcher = TranscriptStitcher()
+    stitcher.stitch("the quick brown fox")
+    assert stitcher.stitch("jumps over the lazy dog") == "jumps over the lazy dog"
+
+
+def test_reset_forgets_the_committed_words():
+    stitcher = TranscriptStitcher()
+    stitcher.stitch("brown fox")
+    stitcher.reset()
+    assert stitcher.committed_words == []
+    assert stitcher.stitch("brown fox again") == "brown fox again"
+
+
+def test_one_word_after_a_skip_is_not_an_overlap():
+    # "that" really is said twice, a lone match after skipping words mustn't drop it.
+    stitcher = TranscriptStitcher()
+    stitcher.stitch("I know that")
+    assert stitcher.stitch("you said that that was fine") == "you said that that was fine"
+
+
+def test_one_word_overlap_at_the_window_start_is_dropped():
+    stitcher = TranscriptStitcher()
+    stitcher.stitch("I know that")
+    assert stitcher.stitch("that was fine") == "was fine"
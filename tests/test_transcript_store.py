@@ -0,0 +1,59 @@
+import pytest
+
+from transcript_store import TranscriptStore
+
+SEGMENTS = ["hello world\n", "second\n", "Chunk one.\nChunk two.\n\nChunk four.", "C:\\path\\n not a newline"]
+
+
+def test_segments_with_line_breaks_survive_a_restart(tmp_path):
+    path = tmp_path / "transcript.log"
+    store = TranscriptStore(str(path), memory_segments=2)
+    for text in SEGMENTS:
+        store.append(text)
+    assert store.segments() == SEGMENTS
+    store.close()
+
+    store = TranscriptStore(str(path), memory_segments=2)
+    assert len(store) == len(SEGMENTS)
+    assert store.segments() == SEGMENTS
+    assert store.segment(2) == SEGMENTS[2]
+    store.append("third session\n")
+    assert store.segment(-1) == "third session\n"
+    store.close()
+    assert TranscriptStore(str(path)).segments() == SEGMENTS + ["third session\n"]
+
+
+def test_spilled_segments_are_read_back_from_the_log():
+    store = TranscriptStore(memory_segments=3)
+    texts = [f"line {i}\nmore {i}\n" for i in range(10)]
+    for text in texts:
+        store.append(text)
+    assert store.segments() == texts
+    assert store.segments(2, 5) == texts[2:5]
+
+
+def test_torn_last_line_is_its_own_segment(tmp_path):
+    path = tmp_path / "transcript.log"
+    store = TranscriptStore(str(path))
+    store.append("whole\n")
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b"torn")
+    store = TranscriptStore(str(path))
+    store.append("next")
+    assert store.segments() == ["whole\n", "torn", "next"]
+
+
+def test_export_is_the_plain_text(tmp_path):
+    store = TranscriptStore()
+    for text in SEGMENTS:
+        store.append(text)
+    store.export(tmp_path / "out.txt")
+    assert (tmp_path / "out.txt").read_text() == "".join(t if t.endswith("\n") else t + "\n" for t in SEGMENTS)
+
+
+def test_segment_out_of_range():
+    store = TranscriptStore()
+    store.append("only")
+    with pytest.raises(IndexError):
+        store.segment(1)
@@ -0,0 +1,32 @@
+import pytest
+
+from transcription_backends import SegmentMeta, TranscriptionError, WhisperIntBackend
+
+
+class FakeClient:
+    def __init__(self, response):
+        self.response = response
+
+    def post(self, data, headers=None, timeout=None):
+        return self.response
+
+    def close(self):
+        pass
+
+
+def transcribe(response):
+    backend = WhisperIntBackend("token")
+    backend.client = FakeClient(response)
+    return backend.transcribe(bytes(3200), SegmentMeta(16000, 2, 0.1))
+
+
+def test_whisperint_returns_the_text():
+    assert transcribe({"text": "hello"}) == "hello"
+    assert transcribe({"text": ""}) == ""
+
+
+@pytest.mark.parametrize("response", [{}, {"text": None}, ["hello"], "hello", None])
+def test_whisperint_response_without_text_is_a_failure(response):
+    with pytest.raises(TranscriptionError) as error:
+        transcribe(response)
+    assert not error.value.retryable
@@ -0,0 +1,29 @@
+from audio_encoders import WavEncoder
+from transcription_cache import TranscriptionCache, audio_key
+
+
+class FakeOpus:
+    name = "opus"
+
+    def __init__(self, bitrate):
+        self.bitrate = bitrate
+
+
+def test_key_depends_on_audio_backend_and_upload_format():
+    pcm = bytes(range(256)) * 8
+    key = audio_key(pcm, "openai:whisper-1", WavEncoder())
+    assert key == audio_key([memoryview(pcm[:100]), memoryview(pcm[100:])], "openai:whisper-1", WavEncoder())
+    assert key != audio_key(pcm[:-2] + b"\1\1", "openai:whisper-1", WavEncoder())
+    assert key != audio_key(pcm, "local:base", WavEncoder())
+    assert key != audio_key(pcm, "openai:whisper-1", FakeOpus(24))
+    assert audio_key(pcm, "openai:whisper-1", FakeOpus(24)) != audio_key(pcm, "openai:whisper-1", FakeOpus(64))
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TranscriptionCache(max_entries=2)
+    cache.put("a", "one")
+    cache.put("b", "two")
+    assert cache.get("a") == "one"
+    cache.put("c", "three")
+    assert cache.get("b") is None
+    assert cache.get("a") == "one" and cache.get("c") == "three"
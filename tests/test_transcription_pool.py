@@ -0,0 +1,66 @@
+import threading
+
+from transcription_pool import OrderedTranscriptionPool
+
+
+def test_results_come_out_in_submission_order():
+    emitted = []
+    pool = OrderedTranscriptionPool(lambda sequence, context, result: emitted.append((sequence, context, result)), max_workers=3)
+    gates = [threading.Event() for _ in range(3)]
+    for i, gate in enumerate(gates):
+        pool.submit(lambda gate, i: gate.wait(5) and f"text {i}", gate, i, context=f"segment {i}")
+    # Finished backwards, nothing can go out before the first one.
+    gates[2].set()
+    gates[1].set()
+    assert not emitted
+    gates[0].set()
+    pool.shutdown()
+    assert emitted == [(0, "segment 0", "text 0"), (1, "segment 1", "text 1"), (2, "segment 2", "text 2")]
+
+
+def test_failed_job_gives_none_and_releases_later_ones():
+    emitted = []
+    pool = OrderedTranscriptionPool(lambda sequence, context, result: emitted.append((sequence, result)), max_workers=2)
+    gate = threading.Event()
+
+    def fail():
+        gate.wait(5)
+        raise RuntimeError("backend down")
+
+    pool.submit(fail)
+    pool.submit(lambda: "later")
+    gate.set()
+    pool.shutdown()
+    assert emitted == [(0, None), (1, "later")]
+
+
+def test_has_room_counts_jobs_not_yet_emitted():
+    pool = OrderedTranscriptionPool(lambda *_: None, max_workers=1, max_pending=2)
+    gate = threading.Event()
+    pool.submit(gate.wait, 5)
+    assert pool.has_room()
+    pool.submit(lambda: "queued")
+    assert not pool.has_room()
+    assert pool.in_flight() == 2
+    gate.set()
+    pool.shutdown()
+    assert pool.has_room() and pool.in_flight() == 0
+
+
+def test_on_result_can_use_the_pool():
+    seen = []
+    done = threading.Event()
+
+    def on_result(sequence, context, result):
+        # Would deadlock if the pool still held its lock here.
+        seen.append((sequence, pool.in_flight(), pool.has_room()))
+        if sequence == 0:
+            pool.submit(lambda: "resubmitted")
+        else:
+            done.set()
+
+    pool = OrderedTranscriptionPool(on_result, max_workers=2)
+    pool.submit(lambda: "first")
+    assert done.wait(5)
+    pool.shutdown()
+    assert [sequence for sequence, _, _ in seen] == [0, 1]
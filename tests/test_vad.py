@@ -0,0 +1,46 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from vad import VoiceActivityDetector
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    audioop = pytest.importorskip("audioop")
+
+
+def tone_chunk(amplitude, frequency=220, length=1024, rate=16000):
+    t = np.arange(length) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16).tobytes()
+
+
+@pytest.mark.parametrize("amplitude", [0, 200, 900, 1300, 1500, 5000, 20000])
+@pytest.mark.parametrize("length", [1024, 1000, 100])
+def test_tones_decide_like_audioop(amplitude, length):
+    chunk = tone_chunk(amplitude, length=length)
+    assert VoiceActivityDetector().is_speech(chunk, 1000) == (audioop.rms(chunk, 2) > 1000)
+
+
+def test_one_loud_frame_in_a_quiet_chunk_is_not_speech():
+    samples = np.zeros(1024, dtype=np.int16)
+    samples[:256] = np.frombuffer(tone_chunk(1500, length=256), dtype=np.int16)
+    chunk = samples.tobytes()
+    assert audioop.rms(chunk, 2) < 1000
+    vad = VoiceActivityDetector()
+    assert not vad.is_speech(chunk, 1000)
+    # No hangover carried into the next, silent, chunk either.
+    assert not vad.is_speech(bytes(2048), 1000)
+
+
+def test_last_energy_is_the_chunks_rms():
+    chunk = tone_chunk(3000)
+    vad = VoiceActivityDetector()
+    vad.is_speech(chunk, 1000)
+    assert vad.last_energy == pytest.approx(audioop.rms(chunk, 2), abs=1)
+
+
+def test_loud_noise_is_not_speech():
+    chunk = np.random.default_rng(0).normal(0, 4000, 1024).astype(np.int16).tobytes()
+    assert audioop.rms(chunk, 2) > 1000
+    assert not VoiceActivityDetector().is_speech(chunk, 1000)
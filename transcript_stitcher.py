@@ -0,0 +1,46 @@
+import re
+
+
+def normalize_word(word):
+    # Compare words ignoring case and punctuation, whisper is not consistent with either at segment edges.
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class TranscriptStitcher:
+    """
+    Keeps the words already committed for the current utterance and merges new transcripts of
+    overlapping audio windows into it, dropping the words the overlap transcribed twice.
+    """
+    def __init__(self, max_overlap_words=16, max_skip_words=2):
+        self.max_overlap_words = max_overlap_words
+        # The first words of a window can be a word cut in half by the window start, allow skipping a few.
+        self.max_skip_words = max_skip_words
+        self.committed_words = []
+
+    def reset(self):
+        self.committed_words = []
+
+    def stitch(self, text):
+        """
+        Returns only the part of text that isn't already at the tail of the committed words, and commits it.
+        """
+        new_words = text.split()
+        tail = [normalize_word(w) for w in self.committed_words[-self.max_overlap_words:]]
+        head = [normalize_word(w) for w in new_words[:self.max_overlap_words + self.max_skip_words]]
+
+        cut = 0
+        # Prefer the longest overlap, and for the same length the one closest to the start of the window.
+        for length in range(min(len(tail), len(head)), 0, -1):
+            for skip in range(0, min(self.max_skip_words, len(head) - length) + 1):
+                # A single matching word after skipping is too weak a signal to drop anything.
+                if skip and length < 2:
+                    continue
+                if tail[-length:] == head[skip:skip + length]:
+                    cut = skip + length
+                    break
+            if cut:
+                break
+
+        added = new_words[cut:]
+        self.committed_words.extend(added)
+        return " ".join(added)
@@ -0,0 +1,120 @@
+from array import array
+import collections
+import re
+import tempfile
+import threading
+
+
+class TranscriptStore:
+    """
+    Append-only store of transcript segments for sessions of any length. Every segment is appended to a
+    log file, only the last memory_segments stay in memory and older ones are read back from the log by
+    offset when asked for.
+
+    The log has one segment per line, with backslashes and line breaks in the text escaped, so segments
+    that span several lines come back as they were. A log_path that already exists is appended to, what
+    earlier sessions left in it comes back as their segments.
+    """
+    def __init__(self, log_path=None, memory_segments=2000):
+        self.log_path = log_path
+        # No path means an anonymous temp file that goes away with the process.
+        self.log = open(log_path, "a+b") if log_path else tempfile.TemporaryFile()
+        self.memory_segments = memory_segments
+        self.recent = collections.deque(maxlen=memory_segments)
+        # Byte offset where each segment starts in the log, 8 bytes per segment however long the session.
+        self.offsets = array("Q")
+        self.end = 0
+        self.lock = threading.Lock()
+        self.load_offsets()
+
+    def load_offsets(self, block_size=1 << 20):
+        # The log only keeps the text, segments are found again at the line breaks between them.
+        self.log.seek(0)
+        position, line_start = 0, 0
+        while True:
+            block = self.log.read(block_size)
+            if not block:
+                break
+            newline = block.find(b"\n")
+            while newline != -1:
+                self.offsets.append(line_start)
+                line_start = position + newline + 1
+                newline = block.find(b"\n", newline + 1)
+            position += len(block)
+        if line_start < position:
+            # A line torn by a crash, ended so the next segment doesn't run on from it.
+            self.log.write(b"\n")
+            self.offsets.append(line_start)
+            position += 1
+        self.end = position
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, text):
+        data = escape(text) + b"\n"
+        with self.lock:
+            self.log.seek(self.end)
+            self.log.write(data)
+            self.offsets.append(self.end)
+            self.end += len(data)
+            self.recent.append(text)
+            return len(self.offsets) - 1
+
+    def segment(self, index):
+        count = len(self.offsets)
+        if not -count <= index < count:
+            raise IndexError(f"Transcript segment {index} out of range, there are {count}")
+        index %= count
+        return self.segments(index, index + 1)[0]
+
+    def segments(self, start=0, stop=None):
+        with self.lock:
+            count = len(self.offsets)
+            start, stop, _ = slice(start, stop).indices(count)
+            if start >= stop:
+                return []
+            first_in_memory = count - len(self.recent)
+            if start >= first_in_memory:
+                return list(self.recent)[start - first_in_memory:stop - first_in_memory]
+            # Spilled segments, one read for the whole range.
+            self.log.flush()
+            end = self.offsets[stop] if stop < count else self.end
+            self.log.seek(self.offsets[start])
+            data = self.log.read(end - self.offsets[start])
+            base = self.offsets[start]
+            return [
+                unescape(data[self.offsets[i] - base:(self.offsets[i + 1] if i + 1 < count else self.end) - base - 1])
+                for i in range(start, stop)
+            ]
+
+    def export(self, path):
+        # The whole transcript as plain text, one segment after the other, streamed from the log.
+        with self.lock:
+            self.log.flush()
+            self.log.seek(0)
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                for line in self.log:
+                    text = unescape(line.rstrip(b"\n"))
+                    f.write(text if text.endswith("\n") else text + "\n")
+
+    def clear(self):
+        with self.lock:
+            self.log.seek(0)
+            self.log.truncate()
+            self.offsets = array("Q")
+            self.end = 0
+            self.recent.clear()
+
+    def close(self):
+        with self.lock:
+            self.log.close()
+
+
+def escape(text):
+    # One line per segment whatever is in it.
+    return text.replace("\\", "\\\\").replace("\n", "\\n").encode()
+
+
+def unescape(data):
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), data.decode(errors="replace"))
@@ -0,0 +1,274 @@
+from datetime import datetime
+import asyncio
+import logging
+import threading
+
+from audio_encoders import WavEncoder
+from http_client import TranscriptionHTTPClient, HTTPStatusError
+from metrics import SegmentTimings
+
+WHISPERINT_URL = "https://y63omv344x74unnb.us-east-1.aws.endpoints.huggingface.cloud"
+
+
+
+class TranscriptionError(Exception):
+    """
+    Raised by backends when a segment couldn't be transcribed. Timeouts are raised as TimeoutError.
+    retryable is False for failures that trying again won't fix, like a rejected API key.
+    """
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SegmentMeta:
+    """
+    What a backend gets to know about the PCM it is asked to transcribe.
+    """
+    def __init__(self, sample_rate, sample_width, duration, sequence=None, encoder=None, timings=None, timeout=None, compaction=None):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.duration = duration
+        self.sequence = sequence
+        # Used by the backends that upload audio, WAV if not given.
+        self.encoder = encoder or WavEncoder()
+        # Backends time their encode and network stages into this.
+        self.timings = timings or SegmentTimings(audio_seconds=duration)
+        # Seconds the request may take, set by the RequestPolicy, the backend's own default if None.
+        self.timeout = timeout
+        # CompactedAudio if silences were cut out of the PCM, its kept ranges say where the pieces came from.
+        self.compaction = compaction
+
+
+class TranscriptionBackend:
+    """
+    Base class for transcription backends. transcribe gets the segment's PCM (a memoryview or a list of
+    them) and a SegmentMeta and returns the transcript, it is called from the transcription workers.
+    """
+    name = None
+    model = None
+    needs_network = True
+
+    @property
+    def cache_id(self):
+        # Same audio through another backend or model can give another transcript.
+        return f"{self.name}/{self.model}"
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def transcribe(self, buffer, meta):
+        # Returns the transcript, raises TranscriptionError or TimeoutError.
+        raise NotImplementedError
+
+    async def transcribe_async(self, buffer, meta):
+        return await asyncio.to_thread(self.transcribe, buffer, meta)
+
+    def warm_up(self):
+        # Get ready for the first segment, e.g. connect or load a model, without blocking the caller.
+        pass
+
+    def prepare(self):
+        # Blocks until the backend can take a segment, called before every transcription outside its timeout.
+        pass
+
+    def close(self):
+        pass
+
+    def log_latency(self, start_time, meta):
+        seconds = (datetime.now() - start_time).total_seconds()
+        logging.info(f"{self.name} transcription latency: {seconds} seconds for {meta.duration} seconds of audio ({seconds/meta.duration})")
+
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def available_backends():
+    return [name for name, cls in BACKENDS.items() if cls.is_available()]
+
+
+def create_backend(name, **options):
+    """
+    Builds the backend registered under name, every backend picks the options it needs and ignores the rest.
+    """
+    if name not in BACKENDS:
+        logging.warning(f"Unknown transcription service {name!r}, nothing will be transcribed")
+        return None
+    return BACKENDS[name](**options)
+
+
+@register_backend
+class OpenAIWhisperBackend(TranscriptionBackend):
+    name = "whisper"
+    model = "whisper-1"
+
+    def __init__(self, openai_api_key=None, request_timeout=15, **_):
+        self.request_timeout = request_timeout
+        self.api_key = openai_api_key
+        # openai takes most of a second to import, so it and the client wait for the first segment (or warm_up).
+        self.client = None
+        self.client_lock = threading.Lock()
+
+    def get_client(self):
+        with self.client_lock:
+            if self.client is None:
+                from openai import OpenAI
+                self.client = OpenAI(
+                    api_key=self.api_key,
+                )
+        return self.client
+
+    def transcribe(self, buffer, meta):
+        import openai
+
+        client = self.get_client()
+        with meta.timings.stage("encode"):
+            audio_file = meta.encoder.encode(buffer, meta.sample_rate, meta.sample_width)
+        timeout = meta.timeout or self.request_timeout
+        start_time = datetime.now()
+        try:
+            with meta.timings.stage("network"):
+                transcript = str(client.audio.transcriptions.create(
+                    model=self.model,
+                    file=audio_file,
+                    response_format="text",
+                    timeout=timeout,
+                    max_retries=0,  # the RequestPolicy does the retrying
+                ))
+        except openai.APITimeoutError as e:
+            raise TimeoutError(f"Transcription timed out after {timeout} seconds") from e
+        except openai.APIStatusError as e:
+            raise TranscriptionError(f"Problem with transcription: {e}", retryable=e.status_code == 429 or e.status_code >= 500) from e
+        except Exception as e:
+            raise TranscriptionError(f"Problem with transcription: {e}") from e
+        finally:
+            self.log_latency(start_time, meta)
+        return transcript
+
+    def warm_up(self):
+        threading.Thread(target=self.get_client, daemon=True).start()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+@register_backend
+class WhisperIntBackend(TranscriptionBackend):
+    name = "whisperInt"
+
+    def __init__(self, whisperInt_auth_header=None, whisperInt_url=WHISPERINT_URL, request_timeout=15,
+                 http_pool_size=4, http2=False, **_):
+        self.auth_header = whisperInt_auth_header
+        self.model = whisperInt_url
+        self.request_timeout = request_timeout
+        self.client = TranscriptionHTTPClient(whisperInt_url, pool_size=http_pool_size, http2=http2, timeout=request_timeout)
+
+    def transcribe(self, buffer, meta):
+        with meta.timings.stage("encode"):
+            audio_file = meta.encoder.encode(buffer, meta.sample_rate, meta.sample_width)
+        headers = {
+            "Authorization": self.auth_header,
+            "Content-Type": audio_file.content_type
+        }
+        start_time = datetime.now()
+        try:
+            with meta.timings.stage("network"):
+                response = self.client.post(audio_file, headers=headers, timeout=meta.timeout)
+            # An answer without text is a failure, never something to show as if it had been said.
+            if not isinstance(response, dict) or not isinstance(response.get("text"), str):
+                raise TranscriptionError(f"Problem with transcription: no text in the response {str(response)[:200]!r}", retryable=False)
+        except (TimeoutError, TranscriptionError):
+            raise
+        except HTTPStatusError as e:
+            raise TranscriptionError(f"Problem with transcription: {e}", retryable=e.retryable) from e
+        except Exception as e:
+            raise TranscriptionError(f"Problem with transcription: {e}") from e
+        finally:
+            self.log_latency(start_time, meta)
+        return response["text"]
+
+    def warm_up(self):
+        self.client.warm_up(headers={"Authorization": self.auth_header})
+
+    def close(self):
+        self.client.close()
+
+
+@register_backend
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Offline transcription on the CPU with faster-whisper (CTranslate2), int8 quantized. The model is
+    loaded once and kept for every following segment.
+    """
+    name = "local"
+    needs_network = False
+
+    def __init__(self, local_model="base", local_compute_type="int8", transcription_workers=1, **_):
+        self.model_size = local_model
+        self.compute_type = local_compute_type
+        self.workers = transcription_workers
+        self.whisper_model = None
+        self.model_lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def load_model(self):
+        with self.model_lock:
+            if self.whisper_model is None:
+                from faster_whisper import WhisperModel
+                start_time = datetime.now()
+                # num_workers lets that many segments run through the model at the same time.
+                self.whisper_model = WhisperModel(self.model_size, device="cpu", compute_type=self.compute_type, num_workers=self.workers)
+                logging.info(f"Loaded local whisper model {self.model_size} ({self.compute_type}) in {(datetime.now() - start_time).total_seconds()} seconds")
+        return self.whisper_model
+
+    @property
+    def model(self):
+        return f"{self.model_size}-{self.compute_type}"
+
+    def transcribe(self, buffer, meta):
+        import numpy as np
+
+        if meta.sample_width != 2:
+            raise TranscriptionError(f"The local model takes 16 bit audio, not {8 * meta.sample_width} bit", retryable=False)
+        model = self.load_model()
+        pieces = buffer if isinstance(buffer, (list, tuple)) else [buffer]
+        samples = np.concatenate([np.frombuffer(piece, dtype=np.int16) for piece in pieces])
+        if meta.sample_rate != 16000:
+            # faster-whisper takes whatever it is given as 16 kHz.
+            from resampler import PolyphaseResampler
+            samples = PolyphaseResampler(meta.sample_rate, 16000).process(samples)[:, 0]
+        samples = samples.astype(np.float32) / 32768.0
+        start_time = datetime.now()
+        try:
+            with meta.timings.stage("inference"):
+                segments, _ = model.transcribe(samples, beam_size=1, condition_on_previous_text=False)
+                transcript = " ".join(segment.text.strip() for segment in segments)
+        except Exception as e:
+            raise TranscriptionError(f"Problem with transcription: {e}", retryable=False) from e
+        finally:
+            self.log_latency(start_time, meta)
+        return transcript
+
+    def prepare(self):
+        # Loading (maybe downloading) the model can take minutes, that's not a request timing out.
+        try:
+            self.load_model()
+        except Exception as e:
+            raise TranscriptionError(f"Couldn't load the local model {self.model_size}: {e}", retryable=False) from e
+
+    def warm_up(self):
+        threading.Thread(target=self.load_model, daemon=True).start()
@@ -0,0 +1,131 @@
+import collections
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+
+def audio_key(pcm, backend_id, encoder=None):
+    """
+    Content address of a segment: a fast hash of its PCM (a memoryview or a list of them, hashed in place)
+    plus the backend and model that would transcribe it and the upload format (and bitrate) it would be sent
+    in, since a lossy upload can come back with different words.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for piece in pcm if isinstance(pcm, (list, tuple)) else [pcm]:
+        digest.update(piece)
+    upload = "raw"
+    if encoder is not None:
+        upload = encoder.name
+        if getattr(encoder, "bitrate", None) is not None:
+            upload += f"@{encoder.bitrate}"
+    return f"{backend_id}:{upload}:{digest.hexdigest()}"
+
+
+class DiskCacheTier:
+    """
+    sqlite backed tier that survives restarts, evicting the least recently used entries once the stored
+    transcripts pass max_bytes.
+    """
+    def __init__(self, path, max_bytes=50_000_000):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts (key TEXT PRIMARY KEY, text TEXT, size INTEGER, last_used REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT text FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.connection.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.connection.commit()
+            return row[0] if row else None
+
+    def put(self, key, text):
+        size = len(key) + len(text.encode())
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM transcripts WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO transcripts (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self.size += size - (previous[0] if previous else 0)
+            while self.size > self.max_bytes:
+                oldest = self.connection.execute(
+                    "SELECT key, size FROM transcripts ORDER BY last_used LIMIT 64"
+                ).fetchall()
+                if not oldest:
+                    break
+                for old_key, old_size in oldest:
+                    self.connection.execute("DELETE FROM transcripts WHERE key = ?", (old_key,))
+                    self.size -= old_size
+                    if self.size <= self.max_bytes:
+                        break
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class TranscriptionCache:
+    """
+    In-memory LRU of transcripts by audio_key, optionally backed by a DiskCacheTier. Hit rates are
+    logged every log_every lookups.
+    """
+    def __init__(self, max_entries=256, disk_path=None, disk_max_bytes=50_000_000, log_every=20):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = DiskCacheTier(disk_path, disk_max_bytes) if disk_path else None
+        self.log_every = log_every
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if text is None and self.disk is not None:
+            text = self.disk.get(key)
+            if text is not None:
+                self.store_in_memory(key, text)
+                with self.lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+        if text is None:
+            with self.lock:
+                self.misses += 1
+        self.log_stats()
+        return text
+
+    def put(self, key, text):
+        self.store_in_memory(key, text)
+        if self.disk is not None:
+            self.disk.put(key, text)
+
+    def store_in_memory(self, key, text):
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        if lookups and lookups % self.log_every == 0:
+            logging.info(f"Transcription cache: {self.hits}/{lookups} hits ({self.hits / lookups:.1%}), {self.disk_hits} from disk, {len(self.entries)} entries in memory")
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+
+
+class OrderedTranscriptionPool:
+    """
+    Bounded pool of transcription workers. Every submitted job gets a sequence number and on_result is
+    called with the results strictly in that order, even if later segments finish first, so several
+    segments can be in flight without the transcript coming out shuffled.
+    """
+    def __init__(self, on_result, max_workers=3, max_pending=None):
+        self.on_result = on_result
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcription")
+        # Bounds the job queue, submit blocks once this many segments are waiting or running.
+        self.max_pending = max_pending or 2 * max_workers
+        self.pending_slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.next_sequence = 0
+        self.next_to_emit = 0
+        self.finished = {}
+        self.emitting = False
+
+    def submit(self, fn, *args, context=None):
+        """
+        Runs fn(*args) on a worker and returns the segment's sequence number. context is handed back to
+        on_result untouched, together with the sequence number and fn's result (None if it raised).
+        """
+        self.pending_slots.acquire()
+        with self.lock:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._job_done(sequence, context, f))
+        return sequence
+
+    def _job_done(self, sequence, context, future):
+        try:
+            result = future.result()
+        except Exception:
+            logging.exception(f"Transcription job {sequence} failed")
+            result = None
+        with self.lock:
+            self.finished[sequence] = (context, result)
+            # One thread at a time emits, whoever finds the next result ready, so the order holds while
+            # on_result runs without the lock and can use the pool.
+            emit = not self.emitting
+            self.emitting = True
+        while emit:
+            with self.lock:
+                if self.next_to_emit not in self.finished:
+                    self.emitting = False
+                    break
+                emitting = self.next_to_emit
+                context, result = self.finished.pop(emitting)
+            try:
+                self.on_result(emitting, context, result)
+            except Exception:
+                logging.exception(f"Handling result of transcription job {emitting} failed")
+            with self.lock:
+                self.next_to_emit += 1
+        self.pending_slots.release()
+
+    def has_room(self):
+        # submit wouldn't block.
+        with self.lock:
+            return self.next_sequence - self.next_to_emit < self.max_pending
+
+    def in_flight(self):
+        with self.lock:
+            return self.next_sequence - self.next_to_emit
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """
+    Frame level voice activity detection on NumPy views of the captured PCM, a drop-in for the per chunk
+    audioop.rms comparison (audioop is gone in Python 3.13).
+
+    Every chunk is split into frames that are all scored at once: RMS energy against the energy
+    threshold (same scale as audioop.rms, so existing thresholds keep working), plus zero crossing rate
+    and spectral flatness to reject loud but noise-like frames (fans, keyboard, breath). is_speech decides
+    a whole chunk the way the listener used to, frame_decisions decides every frame and holds speech for
+    hangover_frames afterwards so short dips inside words don't count as pauses.
+    """
+    def __init__(self, sample_rate=16000, frame_length=256, hangover_frames=6, max_noise_flatness=0.45, max_noise_zcr=0.3):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.hangover_frames = hangover_frames
+        # A frame is noise-like only if its spectrum is flat AND it crosses zero a lot, fricatives are one but not the other.
+        self.max_noise_flatness = max_noise_flatness
+        self.max_noise_zcr = max_noise_zcr
+        self.window = np.hanning(frame_length).astype(np.float32)
+        self.hangover = 0
+        self.last_energy = 0.0
+
+    def reset(self):
+        self.hangover = 0
+
+    def frames(self, buffer):
+        samples = np.frombuffer(buffer, dtype=np.int16)
+        count = max(1, len(samples) // self.frame_length)
+        if len(samples) < self.frame_length:
+            return samples.reshape(1, -1).astype(np.float32)
+        return samples[:count * self.frame_length].reshape(count, self.frame_length).astype(np.float32)
+
+    def frame_features(self, buffer):
+        """
+        Returns per frame (rms, zero crossing rate, spectral flatness) arrays for a PCM buffer.
+        """
+        frames = self.frames(buffer)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        if frames.shape[1] == self.frame_length:
+            power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2 + 1e-10
+            flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        else:
+            flatness = np.zeros(len(frames), dtype=np.float32)
+        return rms, zcr, flatness
+
+    def rms(self, buffer):
+        samples = np.frombuffer(buffer, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+
+    def frame_decisions(self, buffer, energy_threshold):
+        """
+        Smoothed speech / non-speech decision for every frame of buffer, hangover carries over between calls.
+        """
+        rms, zcr, flatness = self.frame_features(buffer)
+        self.last_energy = float(np.sqrt(np.mean(rms * rms)))
+        noise_like = (flatness > self.max_noise_flatness) & (zcr > self.max_noise_zcr)
+        raw = (rms > energy_threshold) & ~noise_like
+
+        decisions = np.empty(len(raw), dtype=bool)
+        hangover = self.hangover
+        for i, speech in enumerate(raw):
+            hangover = self.hangover_frames if speech else max(0, hangover - 1)
+            decisions[i] = speech or hangover > 0
+        self.hangover = hangover
+        return decisions
+
+    def is_speech(self, buffer, energy_threshold):
+        # `audioop.rms(buffer, width) > energy_threshold` like before, except that noise-like frames count as
+        # silence, so it never triggers where audioop wouldn't have.
+        samples = np.frombuffer(buffer, dtype=np.int16).astype(np.float32)
+        if not len(samples):
+            self.last_energy = 0.0
+            return False
+        energy = samples * samples
+        self.last_energy = float(np.sqrt(np.mean(energy)))
+        if self.last_energy <= energy_threshold:
+            return False
+        _, zcr, flatness = self.frame_features(buffer)
+        noise_like = (flatness > self.max_noise_flatness) & (zcr > self.max_noise_zcr)
+        if noise_like.any():
+            frame_energy = energy[:len(noise_like) * self.frame_length].reshape(len(noise_like), -1).sum(axis=1)
+            energy_left = float(np.sum(energy)) - float(frame_energy[noise_like].sum())
+            return bool(np.sqrt(max(0.0, energy_left) / len(samples)) > energy_threshold)
+        return True
@@ -0,0 +1,77 @@
+import io
+import struct
+
+# RIFF/WAVE header of a plain PCM file, everything up to the first byte of sample data.
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+
+def wav_header(data_size, sample_rate, sample_width, channels=1):
+    block_align = channels * sample_width
+    return WAV_HEADER.pack(
+        b'RIFF', WAV_HEADER.size - 8 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b'data', data_size,
+    )
+
+
+class WavStream(io.RawIOBase):
+    """
+    Read only file-like WAV built from a header and the PCM memoryview(s) it describes, without ever
+    joining them. Works as the request body for requests/httpx and as the file for the OpenAI client,
+    so both backends upload the same in-memory buffer.
+    """
+    content_type = "audio/wav"
+
+    def __init__(self, pcm, sample_rate, sample_width, channels=1, name="audio.wav"):
+        super().__init__()
+        pieces = pcm if isinstance(pcm, (list, tuple)) else [pcm]
+        pieces = [memoryview(piece).cast('B') for piece in pieces]
+        data_size = sum(len(piece) for piece in pieces)
+        self.parts = [memoryview(wav_header(data_size, sample_rate, sample_width, channels))] + pieces
+        self.size = WAV_HEADER.size + data_size
+        self.duration = data_size / (sample_rate * sample_width * channels)
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        # The OpenAI client takes the upload's filename (and so its format) from here.
+        self.name = name
+        self.position = 0
+
+    def __len__(self):
+        return self.size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    def readinto(self, b):
+        target = memoryview(b).cast('B')
+        written = 0
+        part_start = 0
+        for part in self.parts:
+            part_end = part_start + len(part)
+            if self.position < part_end and written < len(target):
+                begin = self.position - part_start
+                count = min(part_end - self.position, len(target) - written)
+                target[written:written + count] = part[begin:begin + count]
+                written += count
+                self.position += count
+            part_start = part_end
+        return written
+
+    def pcm_parts(self):
+        # The sample data without the header, for backends that take raw PCM.
+        return self.parts[1:]